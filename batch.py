@@ -0,0 +1,72 @@
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from config import BATCH_CONCURRENCY, REQUEST_DEADLINE
+from deadline import Deadline, current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchResult:
+    """نتیجه پردازش یک مورد از کار گروهی"""
+    index: int
+    item: Any
+    error: Optional[Exception] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_item(process: Callable[[Any], None], index: int, item: Any, parent: Deadline) -> BatchResult:
+    """اجرای یک مورد با بودجه زمانی خودش؛ خطا به جای انتشار در نتیجه ثبت می‌شود"""
+    started = time.monotonic()
+    try:
+        # هر مورد از زمان شروع بودجه یک درخواست را دارد، اما نه بیشتر از زمان باقیمانده کار گروهی؛
+        # پس از پایان یا لغو محدودیت کار گروهی، موارد باقیمانده بلافاصله متوقف می‌شوند
+        with deadline_scope(Deadline(min(REQUEST_DEADLINE, parent.remaining()))):
+            process(item)
+        return BatchResult(index, item, elapsed=time.monotonic() - started)
+    except Exception as e:
+        logger.warning(f"مورد {index + 1} کار گروهی ناموفق بود: {e}")
+        return BatchResult(index, item, error=e, elapsed=time.monotonic() - started)
+
+
+def run_batch(items: List[Any], process: Callable[[Any], None],
+              on_result: Optional[Callable[[BatchResult], None]] = None,
+              concurrency: int = BATCH_CONCURRENCY) -> List[BatchResult]:
+    """پردازش همزمان موارد یک کار گروهی با حداکثر concurrency مورد در حال اجرا
+
+    process برای هر مورد در نخ جداگانه اجرا می‌شود (دانلود و ارسال همان مورد) و
+    on_result در نخ فراخوان و به ترتیب پایان موارد فراخوانی می‌شود، بنابراین هر نتیجه
+    بدون انتظار برای موارد کندتر گزارش می‌شود. محدودیت‌های مراحل دانلود، تبدیل و
+    آپلود مدیر کارها همچنان بین همه موارد و کارهای دیگر رعایت می‌شود.
+
+    Returns:
+        List[BatchResult]: نتایج به ترتیب موارد ورودی
+    """
+    if not items:
+        return []
+    results: List[Optional[BatchResult]] = [None] * len(items)
+    workers = max(1, min(concurrency, len(items)))
+    parent = current_deadline()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-item") as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _run_item, process, index, item, parent)
+            for index, item in enumerate(items)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.index] = result
+            if on_result:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    logger.error(f"خطا در گزارش نتیجه مورد {result.index + 1} کار گروهی: {e}")
+    return results
@@ -0,0 +1,200 @@
+"""مقایسه سرعت تشخیص لینک با مسیریاب یکپارچه (links.find_links) و روش قبلی
+
+روش قبلی: بررسی زیررشته‌ها و regex جداگانه برای هر نوع لینک در process_message،
+سپس extract_url و توابع is_*_url (که پیش‌تر در utils بودند) و در پایان استخراج شناسه ویدیو یا کد کوتاه پست.
+
+اجرا: python bench/bench_links.py [تعداد تکرار]
+"""
+import os
+import re
+import sys
+import timeit
+import logging
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench-token")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from links import find_links  # noqa: E402
+
+# مجموعه پیام‌های نمونه: لینک‌های پشتیبانی شده و نشده، با متن اطراف و بدون لینک
+CORPUS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "اینو ببین https://youtu.be/dQw4w9WgXcQ?si=abcdef خیلی خوبه",
+    "https://www.youtube.com/shorts/aqz-KE-bpKQ?feature=share",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG&index=2",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "https://www.instagram.com/p/CabcDEF123/?img_index=1",
+    "ریلز جدید: https://www.instagram.com/reel/Cx_y-z9/?igsh=MWZ4",
+    "https://www.instagram.com/stories/some.user/3141592653589793/",
+    "https://example.com/some/page?x=1",
+    "سلام، این پیام هیچ لینکی ندارد ولی نسبتاً طولانی است تا هزینه جستجو در متن هم سنجیده شود",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+# توابع تشخیص لینک پیشین ماژول utils که مسیریاب یکپارچه جایگزین آنها شده است
+def extract_url(text):
+    """استخراج URL از متن ارسال شده"""
+    # الگوی URL استاندارد
+    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
+
+    # یافتن URL ها در متن
+    urls = re.findall(url_pattern, text)
+
+    if not urls:
+        # اگر URL پیدا نشد، ممکن است کاربر لینک را بدون پروتکل ارسال کرده باشد
+        # سعی می‌کنیم الگوهای رایج را بررسی کنیم
+        common_domains = [
+            r'(?:www\.)?instagram\.com/[\w.-]+/(?:p|reel)/[\w-]+',     # Instagram posts and reels
+            r'(?:www\.)?instagram\.com/stories/[\w.-]+/\d+',           # Instagram stories
+            r'(?:www\.)?youtube\.com/watch\?v=[\w-]+',                 # YouTube videos
+            r'youtu\.be/[\w-]+',                                       # YouTube shortened URLs
+            r'(?:www\.)?youtube\.com/shorts/[\w-]+'                    # YouTube shorts
+        ]
+
+        for pattern in common_domains:
+            potential_url = re.search(pattern, text)
+            if potential_url:
+                return 'https://' + potential_url.group(0)
+
+    # اگر URL استاندارد پیدا شد
+    if urls:
+        # بررسی کنیم که URL یوتیوب کامل است یا فقط دامنه اصلی
+        for url in urls:
+            # برای شناسایی یک URL کامل یوتیوب
+            if '/shorts/' in url:
+                # اطمینان از اینکه بعد از /shorts/ یک شناسه وجود دارد
+                match = re.search(r'youtube\.com/shorts/([\w-]+)', url)
+                if match and match.group(1):
+                    logger.info(f"URL شورتز یوتیوب پیدا شد: {url}")
+                    return url
+
+            # برای ویدیوهای عادی یوتیوب
+            if '/watch?v=' in url:
+                match = re.search(r'[?&]v=([\w-]+)', url)
+                if match and match.group(1):
+                    logger.info(f"URL ویدیوی یوتیوب پیدا شد: {url}")
+                    return url
+
+            # برای لینک‌های کوتاه یوتیوب
+            if 'youtu.be/' in url:
+                match = re.search(r'youtu\.be/([\w-]+)', url)
+                if match and match.group(1):
+                    logger.info(f"URL کوتاه یوتیوب پیدا شد: {url}")
+                    return url
+
+            # برای لینک‌های اینستاگرام
+            if 'instagram.com/' in url:
+                logger.info(f"URL اینستاگرام پیدا شد: {url}")
+                return url
+
+        # اگر هیچ یک از شرایط بالا صادق نبود، اولین URL را برمی‌گردانیم
+        logger.info(f"URL پیدا شد: {urls[0]}")
+        return urls[0]
+
+    logger.warning(f"هیچ URL در متن پیدا نشد: {text}")
+    return None
+
+
+def is_instagram_url(url):
+    """بررسی می‌کند که آیا URL مربوط به اینستاگرام است یا خیر"""
+    parsed_url = urlparse(url)
+    return any(domain in parsed_url.netloc for domain in ['instagram.com', 'www.instagram.com', 'instagr.am'])
+
+
+def is_youtube_url(url):
+    """بررسی می‌کند که آیا URL مربوط به یوتیوب است یا خیر"""
+    parsed_url = urlparse(url)
+    return any(domain in parsed_url.netloc for domain in ['youtube.com', 'www.youtube.com', 'youtu.be'])
+
+
+def is_youtube_shorts(url):
+    """بررسی می‌کند که آیا URL مربوط به شورتز یوتیوب است یا خیر"""
+    # تشخیص دقیق‌تر شورتز یوتیوب با استفاده از regex
+    if not url:
+        return False
+
+    # بررسی الگوی /shorts/ در URL
+    shorts_pattern = r'youtube\.com/shorts/[\w-]+'
+    is_shorts = bool(re.search(shorts_pattern, url))
+
+    if is_shorts:
+        logger.info(f"لینک شورتز یوتیوب شناسایی شد: {url}")
+
+    return is_shorts
+
+
+def _legacy_video_id(url):
+    parsed_url = urlparse(url)
+    if parsed_url.netloc == 'youtu.be':
+        return parsed_url.path[1:]
+    if '/watch' in parsed_url.path:
+        return parse_qs(parsed_url.query).get('v', [None])[0]
+    for marker in ('/shorts/', '/embed/', '/v/'):
+        if marker in parsed_url.path:
+            return parsed_url.path.split(marker)[1].split('/')[0]
+    return None
+
+
+def _legacy_shortcode(url):
+    for pattern in (r'instagram.com/p/([^/?#&]+)', r'instagram.com/reel/([^/?#&]+)',
+                    r'instagram.com/tv/([^/?#&]+)', r'instagram.com/stories/[^/]+/([^/?#&]+)'):
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def legacy_route(text):
+    """بازسازی مسیر تشخیص process_message پیش از مسیریاب یکپارچه"""
+    if "youtube.com/shorts/" in text:
+        match = re.search(r'(https?://(?:www\.)?youtube\.com/shorts/[\w-]+)', text)
+        if match:
+            return 'shorts', _legacy_video_id(match.group(1))
+    if "youtube.com/watch?v=" in text:
+        match = re.search(r'(https?://(?:www\.)?youtube\.com/watch\?v=[\w-]+(?:&\S*)?)', text)
+        if match:
+            return 'video', _legacy_video_id(match.group(1))
+    if "youtu.be/" in text:
+        match = re.search(r'(https?://(?:www\.)?youtu\.be/[\w-]+)', text)
+        if match:
+            return 'video', _legacy_video_id(match.group(1))
+    if "instagram.com/" in text:
+        match = re.search(r'(https?://(?:www\.)?instagram\.com/\S+)', text)
+        if match:
+            return 'instagram', _legacy_shortcode(match.group(1))
+    url = extract_url(text)
+    if not url:
+        return None
+    if is_instagram_url(url):
+        return 'instagram', _legacy_shortcode(url)
+    if is_youtube_url(url):
+        return ('shorts' if is_youtube_shorts(url) else 'video'), _legacy_video_id(url)
+    return 'unsupported', None
+
+
+def router_route(text):
+    return [(link.kind, link.media_id) for link in find_links(text)]
+
+
+def _measure(route, number):
+    best = min(timeit.repeat(lambda: [route(text) for text in CORPUS], number=number, repeat=5))
+    return best / (number * len(CORPUS)) * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # لاگ‌های توابع قبلی در زمان‌سنجی اثر نگذارند
+    logging.disable(logging.CRITICAL)
+    legacy = _measure(legacy_route, number)
+    router = _measure(router_route, number)
+    print(f"روش قبلی:         {legacy:7.2f} میکروثانیه برای هر پیام")
+    print(f"مسیریاب یکپارچه: {router:7.2f} میکروثانیه برای هر پیام")
+    print(f"نسبت: {legacy / router:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
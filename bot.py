@@ -1,9 +1,7 @@
 import os
-import re
-import logging
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Any
 
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, InputMediaVideo
+from telegram import Update, Message, InlineKeyboardMarkup, InlineKeyboardButton, ChatAction
 from telegram.ext import (
     Updater,
     CommandHandler, 
@@ -12,30 +10,188 @@ from telegram.ext import (
     Filters, 
     CallbackContext
 )
-from instaloader.exceptions import PrivateProfileNotFollowedException
 
-from config import TOKEN, logger
+from config import (
+    TOKEN,
+    MAX_TELEGRAM_FILE_SIZE,
+    STREAMING_UPLOAD,
+    BATCH_CONCURRENCY,
+    BATCH_MAX_LINKS,
+    BATCH_DOCUMENT_MAX_SIZE,
+    PLAYLIST_CONCURRENCY,
+    PLAYLIST_MAX_ITEMS,
+    logger
+)
 from messages import *
 from utils import (
-    extract_url, 
-    is_instagram_url, 
-    is_youtube_url, 
-    is_youtube_shorts, 
     get_file_size,
     format_size,
+    extract_audio,
     clean_temp_file,
-    convert_video_to_audio
+    TELEGRAM_AUDIO_EXTENSIONS
 )
-from downloader.instagram import InstagramDownloader
 from downloader.youtube import YouTubeDownloader
-from download_instagram_handlers import download_instagram_video, download_instagram_audio
+from downloader.errors import DownloadAbortedError, FileTooLargeError, ContentUnavailableError
+from deadline import DeadlineExceededError, current_deadline
+from download_instagram_handlers import (
+    download_instagram_video,
+    download_instagram_audio,
+    send_instagram_post
+)
+from jobs import job_manager, DownloadJob, JobKind, Stage, JobQueueFullError
+from cache import media_key, media_store, MEDIA_VIDEO, MEDIA_AUDIO
+from delivery import send_video_file, send_audio_file, send_coalesced, media_error_message, deliver_media_request
+from prefetch import prefetcher, MENU_VIDEO, MENU_SHORTS
+from streaming import stream_video_upload
+from sessions import session_store, callback_data, parse_callback_data
+from links import (
+    find_links,
+    classify_url,
+    unique_links,
+    MediaLink,
+    PLATFORM_INSTAGRAM,
+    LINK_SHORTS,
+    LINK_PLAYLIST,
+    LINK_POST,
+    LINK_REEL
+)
+from batch import BatchResult, run_batch
 
-# راه‌اندازی دانلودرها
-instagram_downloader = InstagramDownloader()
+# راه‌اندازی دانلودرها (دانلودر اینستاگرام و مجموعه زمینه‌هایش بین همه هندلرها مشترک است)
 youtube_downloader = YouTubeDownloader()
 
-# دیکشنری برای نگهداری اطلاعات موقت کاربران
-user_data = {}
+# عملیات دکمه‌های اینلاین؛ callback_data به شکل «عملیات:شناسه نشست[:itag]» است
+ACTION_VIDEO_MENU = 'v'
+ACTION_QUALITY = 'q'
+ACTION_AUDIO = 'a'
+ACTION_BACK = 'b'
+ACTION_SHORTS_QUALITY = 'sq'
+ACTION_SHORTS_VIDEO = 'sv'
+ACTION_SHORTS_AUDIO = 'sa'
+ACTION_INSTAGRAM_VIDEO = 'iv'
+ACTION_INSTAGRAM_AUDIO = 'ia'
+ACTION_PLAYLIST_MENU = 'p'
+ACTION_PLAYLIST_LIMITS = 'pl'
+ACTION_PLAYLIST_VIDEO = 'pv'
+ACTION_PLAYLIST_AUDIO = 'pa'
+
+# تعداد ویدیوهای قابل انتخاب در منوی پلی‌لیست
+PLAYLIST_LIMIT_BUTTONS = ((3, BUTTON_PLAYLIST_LIMIT_3), (5, BUTTON_PLAYLIST_LIMIT_5), (10, BUTTON_PLAYLIST_LIMIT_10))
+
+def obtain_youtube_audio(url: str, video_id: Optional[str], cache_key: Optional[str]) -> str:
+    """فایل صوتی ویدیوی یوتیوب از کش فایل روی دیسک، از ویدیوی ذخیره شده یا با دانلود استریم صوتی"""
+    audio_file = media_store.checkout_file(cache_key)
+    if audio_file:
+        return audio_file
+
+    # اگر ویدیوی همین محتوا (با هر کیفیتی) روی دیسک باشد، صدا بدون دانلود استخراج می‌شود
+    video_files = media_store.checkout_variant('youtube', video_id, MEDIA_VIDEO) if video_id else None
+    if video_files:
+        try:
+            logger.info(f"استخراج صدای {video_id} از ویدیوی ذخیره شده")
+            with job_manager.stage(Stage.TRANSCODE):
+                audio_file = extract_audio(video_files[0])
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            logger.warning(f"خطا در استخراج صدا از ویدیوی ذخیره شده {video_id}: {e}")
+        finally:
+            for video_file in video_files:
+                clean_temp_file(video_file)
+
+    # دانلود مستقیم استریم صوتی (بدون دانلود کامل ویدیو و تبدیل مجدد)
+    if not audio_file:
+        with job_manager.stage(Stage.DOWNLOAD):
+            audio_file = youtube_downloader.download_audio(url)
+        # اگر تلگرام فرمت دریافت شده (مثل opus یا ویدیوی جایگزین) را مستقیماً نمی‌پذیرد، صدا در مرحله تبدیل استخراج می‌شود
+        if audio_file and os.path.splitext(audio_file)[1].lower() not in TELEGRAM_AUDIO_EXTENSIONS:
+            downloaded_file = audio_file
+            logger.info(f"فرمت {downloaded_file} مستقیماً قابل ارسال نیست، در حال استخراج صدا...")
+            try:
+                with job_manager.stage(Stage.TRANSCODE):
+                    audio_file = extract_audio(downloaded_file)
+            finally:
+                clean_temp_file(downloaded_file)
+            file_size = get_file_size(audio_file) if audio_file else 0
+            if file_size > MAX_TELEGRAM_FILE_SIZE:
+                logger.warning(f"سایز فایل صوتی ({format_size(file_size)}) بیشتر از حد مجاز تلگرام است")
+                clean_temp_file(audio_file)
+                raise FileTooLargeError(file_size, MAX_TELEGRAM_FILE_SIZE)
+    media_store.store_file(cache_key, audio_file)
+    return audio_file
+
+def send_youtube_video(bot, chat_id: int, cache_key: Optional[str], download: Callable[[], str],
+                       stream: Optional[Callable[[], Optional[Message]]] = None,
+                       on_upload: Optional[Callable[[], Any]] = None) -> Message:
+    """ارسال ویدیوی یوتیوب از کش فایل روی دیسک، به صورت جریانی (stream) یا با دانلود (download)"""
+    # استفاده از فایل ذخیره شده روی دیسک در صورت وجود
+    output_file = media_store.checkout_file(cache_key)
+    try:
+        if not output_file and stream:
+            message = stream()
+            if message:
+                return message
+        if not output_file:
+            with job_manager.stage(Stage.DOWNLOAD):
+                output_file = download()
+            media_store.store_file(cache_key, output_file)
+        if not output_file:
+            raise IOError("هیچ فایل ویدیویی دانلود نشد")
+        logger.info(f"ویدیوی یوتیوب با موفقیت دانلود شد: {output_file}")
+        if on_upload:
+            on_upload()
+        return send_video_file(bot, chat_id, output_file)
+    finally:
+        if output_file:
+            youtube_downloader.clean_up(output_file)
+
+def send_youtube_audio(bot, chat_id: int, url: str, video_id: Optional[str], cache_key: Optional[str], title: str,
+                       on_upload: Optional[Callable[[], Any]] = None) -> Message:
+    """ارسال صدای ویدیوی یوتیوب از کش دیسک، از ویدیوی ذخیره شده یا با دانلود استریم صوتی"""
+    audio_file = obtain_youtube_audio(url, video_id, cache_key)
+    try:
+        if not audio_file:
+            raise IOError(f"هیچ فایل صوتی از {url} دانلود نشد")
+        if on_upload:
+            on_upload()
+        return send_audio_file(bot, chat_id, audio_file, title)
+    finally:
+        if audio_file:
+            clean_temp_file(audio_file)
+
+def stream_youtube_video(bot, chat_id: int, url: str, itag: str, query) -> Optional[Message]:
+    """ارسال فرمت پیش‌رونده همزمان با دریافت و بدون نوشتن روی دیسک
+
+    Returns:
+        پیام ارسال شده، یا None اگر ارسال جریانی غیرفعال، ناممکن یا ناموفق باشد (دانلود روی دیسک انجام می‌شود)
+    """
+    if not STREAMING_UPLOAD:
+        return None
+    try:
+        source = youtube_downloader.get_progressive_source(url, itag)
+        if not source:
+            return None
+        source_url, headers = source
+        # آپلود همزمان با دریافت شروع می‌شود
+        query.edit_message_text(UPLOAD_TO_TELEGRAM)
+        with job_manager.stage(Stage.DOWNLOAD), job_manager.stage(Stage.UPLOAD):
+            return stream_video_upload(bot, chat_id, source_url, headers)
+    except DownloadAbortedError:
+        raise
+    except Exception as e:
+        logger.warning(f"ارسال جریانی {url} ناموفق بود، دانلود روی دیسک انجام می‌شود: {e}")
+        return None
+
+def start_speculative_download(token: str, menu: str, session: Dict[str, Any]) -> None:
+    """دانلود حدسی پرانتخاب‌ترین کیفیت در حالی که منوی کیفیت درخواست token به کاربر نمایش داده می‌شود"""
+    url, video_id = session['url'], session['media_id']
+    if not video_id:
+        return
+    prefetcher.start(
+        token, menu, session['streams'],
+        cache_key_for=lambda itag: media_key('youtube', video_id, str(itag), MEDIA_VIDEO),
+        download=lambda itag: youtube_downloader.download_video(url, itag)
+    )
 
 def start(update: Update, context: CallbackContext) -> None:
     """پاسخ به دستور /start"""
@@ -49,6 +205,31 @@ def about_command(update: Update, context: CallbackContext) -> None:
     """پاسخ به دستور /about"""
     update.message.reply_text(ABOUT_MESSAGE, parse_mode='Markdown')
 
+def enqueue_job(update: Update, context: CallbackContext, kind: JobKind, handler, *args) -> None:
+    """قرار دادن کار سنگین در صف پس‌زمینه و پاسخ فوری به کاربر"""
+    query = update.callback_query
+    job = DownloadJob(
+        kind=kind,
+        user_id=update.effective_user.id,
+        chat_id=update.effective_chat.id,
+        handler=handler,
+        args=(update, context) + args
+    )
+
+    # پاسخ فوری قبل از قرار دادن در صف تا پیام‌های کارگر روی آن نوشته شوند
+    if query:
+        query.edit_message_text(JOB_QUEUED)
+    else:
+        context.bot.send_chat_action(chat_id=job.chat_id, action=ChatAction.TYPING)
+
+    try:
+        job_manager.submit(job)
+    except JobQueueFullError:
+        if query:
+            query.edit_message_text(QUEUE_FULL_ERROR)
+        else:
+            update.message.reply_text(QUEUE_FULL_ERROR)
+
 def process_message(update: Update, context: CallbackContext) -> None:
     """پردازش پیام‌های ورودی و استخراج لینک"""
     if not update.message or not update.message.text:
@@ -56,203 +237,203 @@ def process_message(update: Update, context: CallbackContext) -> None:
 
     logger.info(f"پردازش پیام: {update.message.text[:50]}...")
 
-    # بهبود شناسایی لینک‌های یوتیوب شورتز
     original_text = update.message.text
     user_id = update.effective_user.id
 
-    # برای لینک‌های خاص YouTube Shorts
-    if "youtube.com/shorts/" in original_text:
-        shorts_pattern = r'(https?://(?:www\.)?youtube\.com/shorts/[\w-]+)'
-        shorts_match = re.search(shorts_pattern, original_text)
-        if shorts_match:
-            shorts_url = shorts_match.group(1)
-            logger.info(f"لینک شورتز یوتیوب به طور مستقیم شناسایی شد: {shorts_url}")
-            process_youtube_shorts(update, context, shorts_url, user_id)
-            return
-
-    # برای لینک‌های عادی یوتیوب
-    if "youtube.com/watch?v=" in original_text:
-        video_pattern = r'(https?://(?:www\.)?youtube\.com/watch\?v=[\w-]+(?:&\S*)?)'
-        video_match = re.search(video_pattern, original_text)
-        if video_match:
-            video_url = video_match.group(1)
-            logger.info(f"لینک ویدیوی یوتیوب به طور مستقیم شناسایی شد: {video_url}")
-            process_youtube_video(update, context, video_url, user_id)
-            return
-
-    # برای لینک‌های کوتاه یوتیوب
-    if "youtu.be/" in original_text:
-        short_url_pattern = r'(https?://(?:www\.)?youtu\.be/[\w-]+)'
-        short_url_match = re.search(short_url_pattern, original_text)
-        if short_url_match:
-            short_url = short_url_match.group(1)
-            logger.info(f"لینک کوتاه یوتیوب به طور مستقیم شناسایی شد: {short_url}")
-            process_youtube_video(update, context, short_url, user_id)
-            return
-
-    # برای لینک‌های اینستاگرام
-    if "instagram.com/" in original_text:
-        instagram_pattern = r'(https?://(?:www\.)?instagram\.com/\S+)'
-        instagram_match = re.search(instagram_pattern, original_text)
-        if instagram_match:
-            instagram_url = instagram_match.group(1)
-            logger.info(f"لینک اینستاگرام به طور مستقیم شناسایی شد: {instagram_url}")
-            process_instagram_url(update, context, instagram_url, user_id)
-            return
-
-    # اگر شناسایی مستقیم موفق نبود، از روش عمومی استفاده می‌کنیم
-    url = extract_url(original_text)
-    if not url:
+    # تشخیص پلتفرم، نوع و شناسه محتوا در یک گذر روی متن پیام
+    links = find_links(original_text)
+    if not links:
         logger.warning(f"لینک معتبری یافت نشد در پیام: {original_text[:50]}...")
         update.message.reply_text(NO_LINK_FOUND)
         return
 
-    logger.info(f"URL استخراج شده با روش عمومی: {url} - کاربر: {user_id}")
+    media_links = unique_links(links)
+    if not media_links:
+        logger.warning(f"لینک پشتیبانی نشده: {links[0].url}")
+        update.message.reply_text(UNSUPPORTED_LINK)
+        return
+
+    # چند لینک در یک پیام به صورت یک کار گروهی دانلود می‌شوند (پلی‌لیست‌ها منوی جداگانه دارند)
+    batch_links = without_playlists(update, media_links)
+    if len(batch_links) > 1:
+        logger.info(f"{len(batch_links)} لینک در پیام کاربر {user_id} شناسایی شد")
+        enqueue_job(update, context, JobKind.BATCH, process_link_batch, limit_batch(update, batch_links), user_id)
+        return
 
-    if is_instagram_url(url):
-        logger.info(f"پردازش لینک اینستاگرام: {url}")
-        process_instagram_url(update, context, url, user_id)
-    elif is_youtube_url(url):
-        logger.info(f"پردازش لینک یوتیوب: {url}")
-        process_youtube_url(update, context, url, user_id)
+    link = batch_links[0] if batch_links else media_links[0]
+    logger.info(f"لینک {link.platform}/{link.kind} با شناسه {link.media_id} شناسایی شد - کاربر: {user_id}")
+
+    if link.kind == LINK_PLAYLIST:
+        process_youtube_playlist(update, context, link, user_id)
+    elif link.platform == PLATFORM_INSTAGRAM:
+        enqueue_job(update, context, JobKind.INSTAGRAM_POST, process_instagram_url, link, user_id)
     else:
-        logger.warning(f"لینک پشتیبانی نشده: {url}")
-        update.message.reply_text(UNSUPPORTED_LINK)
+        enqueue_job(update, context, JobKind.YOUTUBE_STREAMS, process_youtube_url, link, user_id)
+
+def process_document(update: Update, context: CallbackContext) -> None:
+    """پردازش فایل متنی حاوی لینک‌ها (هر تعداد لینک، با هر جداکننده‌ای)"""
+    document = update.message.document
+    if document.file_size and document.file_size > BATCH_DOCUMENT_MAX_SIZE:
+        logger.warning(f"فایل لینک‌ها با حجم {format_size(document.file_size)} رد شد")
+        update.message.reply_text(BATCH_DOCUMENT_TOO_LARGE)
+        return
 
-def process_instagram_url(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """پردازش لینک اینستاگرام"""
-    chat_id = update.effective_chat.id
-    
-    # تعریف متغیرها خارج از بلوک try برای جلوگیری از خطای دسترسی
-    status_message = None
-    downloaded_files = []
-    
+    logger.info(f"دریافت فایل لینک‌ها {document.file_name} از کاربر {update.effective_user.id}")
+    enqueue_job(update, context, JobKind.BATCH, process_url_document, document.file_id, update.effective_user.id)
+
+def process_url_document(update: Update, context: CallbackContext, file_id: str, user_id: int) -> None:
+    """استخراج لینک‌های فایل متنی و دانلود گروهی آنها"""
     try:
-        logger.info(f"شروع پردازش محتوا از اینستاگرام با URL: {url}")
-        
-        # ذخیره اطلاعات در دیکشنری کاربر برای استفاده در دکمه‌های اینلاین
-        user_data[user_id] = {
-            'instagram_url': url,
-            'chat_id': chat_id
-        }
-        
-        # بررسی اگر ریلز یا ویدیو است، امکان انتخاب کیفیت و استخراج صدا را ارائه می‌دهیم
-        if '/reel/' in url or '/p/' in url:
-            # برای امنیت بیشتر و جلوگیری از خطای Button_data_invalid،
-            # از شناسه کاربر برای ایجاد کلید منحصر به فرد استفاده می‌کنیم
-            keyboard = [
-                [
-                    InlineKeyboardButton(BUTTON_DOWNLOAD_VIDEO, callback_data=f"insta_video_{user_id}"),
-                    InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=f"insta_audio_{user_id}")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            update.message.reply_text(
-                "لطفاً نوع دانلود محتوای اینستاگرام را انتخاب کنید:",
-                reply_markup=reply_markup
-            )
-            return
-        
-        # برای سایر محتواها (مثلاً استوری‌ها یا عکس‌ها)، مستقیماً شروع به دانلود می‌کنیم
-        status_message = update.message.reply_text(INSTAGRAM_DOWNLOAD_STARTED)
+        telegram_file = context.bot.get_file(file_id, timeout=current_deadline().timeout())
+        content = telegram_file.download_as_bytearray()
+    except Exception as e:
+        logger.error(f"خطا در دریافت فایل لینک‌ها: {e}")
+        update.message.reply_text(GENERAL_ERROR)
+        return
 
-        logger.info(f"شروع دانلود محتوا از اینستاگرام با URL: {url}")
-        downloaded_files = instagram_downloader.download_post(url)
+    links = without_playlists(update, unique_links(find_links(content.decode('utf-8', errors='ignore'))))
+    if not links:
+        logger.warning(f"لینک پشتیبانی شده‌ای در فایل کاربر {user_id} یافت نشد")
+        update.message.reply_text(NO_LINK_FOUND)
+        return
 
-        if not downloaded_files:
-            logger.warning(f"هیچ فایلی از {url} دانلود نشد.")
-            if status_message:
-                status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
+    process_link_batch(update, context, limit_batch(update, links), user_id)
+
+def without_playlists(update: Update, links: List[MediaLink]) -> List[MediaLink]:
+    """لینک‌های قابل دانلود گروهی؛ کنار گذاشتن پلی‌لیست‌های همراه لینک‌های دیگر به کاربر اطلاع داده می‌شود"""
+    batch_links = [link for link in links if link.kind != LINK_PLAYLIST]
+    if batch_links and len(batch_links) < len(links):
+        logger.info(f"{len(links) - len(batch_links)} لینک پلی‌لیست از کار گروهی کنار گذاشته شد")
+        update.message.reply_text(BATCH_PLAYLIST_SKIPPED)
+    return batch_links
+
+def limit_batch(update: Update, links: List[MediaLink]) -> List[MediaLink]:
+    """محدود کردن تعداد لینک‌های یک کار گروهی به BATCH_MAX_LINKS"""
+    if len(links) > BATCH_MAX_LINKS:
+        update.message.reply_text(BATCH_TOO_MANY_LINKS.format(limit=BATCH_MAX_LINKS))
+        return links[:BATCH_MAX_LINKS]
+    return links
+
+def batch_error_message(link: MediaLink, error: Exception) -> str:
+    """پیام خطای یک مورد ناموفق کار گروهی"""
+    if link.platform == PLATFORM_INSTAGRAM:
+        return media_error_message(error, INSTAGRAM_FILE_TOO_LARGE, INSTAGRAM_DOWNLOAD_ERROR)
+    return media_error_message(error, YOUTUBE_FILE_TOO_LARGE, YOUTUBE_DOWNLOAD_ERROR)
+
+def deliver_youtube_video(bot, chat_id: int, link: MediaLink) -> None:
+    """ارسال ویدیوی یوتیوب با بهترین کیفیت زیر سقف تلگرام (بدون منوی انتخاب کیفیت)"""
+    cache_key = link.cache_key('best', MEDIA_VIDEO)
+    send_coalesced(bot, chat_id, cache_key, lambda: send_youtube_video(
+        bot, chat_id, cache_key, lambda: youtube_downloader.download_shorts(link.url)
+    ))
+
+def deliver_youtube_audio(bot, chat_id: int, link: MediaLink) -> None:
+    """ارسال صدای ویدیوی یوتیوب (از کش، از ویدیوی ذخیره شده یا با دانلود استریم صوتی)"""
+    cache_key = link.cache_key('best', MEDIA_AUDIO)
+    send_coalesced(bot, chat_id, cache_key, lambda: send_youtube_audio(
+        bot, chat_id, link.url, link.media_id, cache_key, "Audio from YouTube"
+    ), title="Audio from YouTube")
+
+def deliver_instagram_post(bot, chat_id: int, link: MediaLink) -> None:
+    """ارسال همه فایل‌های پست، ریلز یا استوری اینستاگرام"""
+    send_coalesced(bot, chat_id, link.cache_key('all', 'post'),
+                   lambda: send_instagram_post(bot, chat_id, link.url, link.media_id))
+
+def deliver_link(bot, chat_id: int, link: MediaLink) -> None:
+    """دانلود و ارسال یک لینک کار گروهی"""
+    if link.platform == PLATFORM_INSTAGRAM:
+        deliver_instagram_post(bot, chat_id, link)
+    else:
+        deliver_youtube_video(bot, chat_id, link)
+
+def deliver_batch(bot, chat_id: int, links: List[MediaLink], deliver, status_message: Message,
+                  concurrency: int = BATCH_CONCURRENCY) -> int:
+    """دانلود و ارسال همزمان چند مورد با گزارش پیشرفت روی status_message
+
+    هر مورد به محض آماده شدن ارسال می‌شود (بدون انتظار برای موارد کندتر)، خطای هر
+    مورد جداگانه گزارش می‌شود و در پایان خلاصه نتایج جای پیام وضعیت را می‌گیرد.
+
+    Returns:
+        int: تعداد موارد موفق
+    """
+    total = len(links)
+    status_message.edit_text(BATCH_DOWNLOAD_STARTED.format(total=total))
+    done = 0
+
+    def report(result: BatchResult) -> None:
+        nonlocal done
+        done += 1
+        if not result.ok:
+            bot.send_message(
+                chat_id=chat_id,
+                text=BATCH_ITEM_FAILED.format(url=result.item.url, reason=batch_error_message(result.item, result.error)),
+                disable_web_page_preview=True
+            )
+        status_message.edit_text(BATCH_DOWNLOAD_PROGRESS.format(done=done, total=total))
 
-        logger.info(f"تعداد {len(downloaded_files)} فایل از اینستاگرام دانلود شد")
-        if status_message:
-            status_message.edit_text(UPLOAD_TO_TELEGRAM)
+    results = run_batch(links, lambda link: deliver(bot, chat_id, link), on_result=report, concurrency=concurrency)
 
-        # ارسال فایل‌ها به کاربر
-        if len(downloaded_files) == 1:
-            # اگر فقط یک فایل باشد
-            file_path = downloaded_files[0]
-            file_size = get_file_size(file_path)
-            logger.info(f"ارسال فایل با سایز {format_size(file_size)}")
+    succeeded = sum(1 for result in results if result.ok)
+    try:
+        status_message.delete()
+    except Exception as e:
+        logger.warning(f"خطا در حذف پیام وضعیت دانلود گروهی: {e}")
+    bot.send_message(
+        chat_id=chat_id,
+        text=BATCH_DOWNLOAD_SUMMARY.format(succeeded=succeeded, failed=total - succeeded, total=total)
+    )
+    return succeeded
 
-            try:
-                if file_path.endswith('.jpg'):
-                    with open(file_path, 'rb') as photo_file:
-                        update.message.reply_photo(photo=photo_file)
-                else:
-                    with open(file_path, 'rb') as video_file:
-                        update.message.reply_video(video=video_file)
-            except Exception as send_error:
-                logger.error(f"خطا در ارسال فایل به کاربر: {send_error}")
-                if status_message:
-                    status_message.edit_text(GENERAL_ERROR)
-                return
+def process_link_batch(update: Update, context: CallbackContext, links: List[MediaLink], user_id: int) -> None:
+    """دانلود گروهی چند لینک با همزمانی محدود"""
+    chat_id = update.effective_chat.id
+    logger.info(f"شروع دانلود گروهی {len(links)} لینک برای کاربر {user_id}")
+    status_message = context.bot.send_message(chat_id=chat_id, text=JOB_QUEUED)
+    succeeded = deliver_batch(context.bot, chat_id, links, deliver_link, status_message)
+    logger.info(f"دانلود گروهی کاربر {user_id} پایان یافت: {succeeded} از {len(links)} موفق")
 
-        else:
-            # اگر چندین فایل باشد (آلبوم)
-            media_group = []
-            try:
-                for file_path in downloaded_files[:10]:  # حداکثر 10 فایل در یک آلبوم
-                    file_size = get_file_size(file_path)
-                    logger.info(f"اضافه کردن فایل با سایز {format_size(file_size)} به آلبوم")
-
-                    with open(file_path, 'rb') as media_file:
-                        if file_path.endswith('.jpg'):
-                            media_group.append(InputMediaPhoto(media=media_file))
-                        else:
-                            media_group.append(InputMediaVideo(media=media_file))
-
-                if media_group:
-                    logger.info(f"ارسال آلبوم با {len(media_group)} فایل")
-                    update.message.reply_media_group(media=media_group)
-
-            except Exception as album_error:
-                logger.error(f"خطا در ارسال آلبوم به کاربر: {album_error}")
-                if status_message:
-                    status_message.edit_text(GENERAL_ERROR)
-                return
-
-        if status_message:
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_SUCCESS)
-        logger.info("محتوا با موفقیت به کاربر ارسال شد")
-
-    except PrivateProfileNotFollowedException:
-        logger.warning(f"پروفایل خصوصی: {url}")
-        if status_message:
-            status_message.edit_text(INSTAGRAM_PRIVATE_ACCOUNT)
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود از اینستاگرام: {e}")
-            if status_message:
-                status_message.edit_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود از اینستاگرام: {e}")
-            if status_message:
-                status_message.edit_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در پردازش لینک اینستاگرام {url}: {e}")
-            logger.exception("جزئیات خطا:")
-            if status_message:
-                status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            else:
-                update.message.reply_text(INSTAGRAM_DOWNLOAD_ERROR)
-    finally:
-        # پاک کردن فایل‌های موقت
-        if downloaded_files:
-            logger.info(f"پاک کردن {len(downloaded_files)} فایل موقت")
-            instagram_downloader.clean_up(downloaded_files)
+def process_instagram_url(update: Update, context: CallbackContext, link: MediaLink, user_id: int) -> None:
+    """پردازش لینک اینستاگرام"""
+    chat_id = update.effective_chat.id
+    url = link.url
+    logger.info(f"شروع پردازش محتوا از اینستاگرام با URL: {url}")
+
+    # بررسی اگر ریلز یا ویدیو است، امکان انتخاب کیفیت و استخراج صدا را ارائه می‌دهیم
+    if link.kind in (LINK_POST, LINK_REEL):
+        # لینک و شناسه محتوا در نشست درخواست ذخیره می‌شوند و دکمه‌ها فقط شناسه کوتاه نشست را دارند
+        # (جلوگیری از خطای Button_data_invalid)
+        token = session_store.create(user_id, chat_id, url=url, media_id=link.media_id)
+        keyboard = [
+            [
+                InlineKeyboardButton(BUTTON_DOWNLOAD_VIDEO, callback_data=callback_data(ACTION_INSTAGRAM_VIDEO, token)),
+                InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=callback_data(ACTION_INSTAGRAM_AUDIO, token))
+            ]
+        ]
+        update.message.reply_text(
+            "لطفاً نوع دانلود محتوای اینستاگرام را انتخاب کنید:",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
 
-def process_youtube_url(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+    # برای سایر محتواها (مثلاً استوری‌ها یا عکس‌ها)، مستقیماً شروع به دانلود می‌کنیم
+    status_message = update.message.reply_text(INSTAGRAM_DOWNLOAD_STARTED)
+    deliver_media_request(
+        context.bot, chat_id, url, link.cache_key('all', 'post'),
+        lambda: send_instagram_post(context.bot, chat_id, url, link.media_id,
+                                    on_upload=lambda: status_message.edit_text(UPLOAD_TO_TELEGRAM)),
+        status_message.edit_text, INSTAGRAM_DOWNLOAD_SUCCESS, INSTAGRAM_FILE_TOO_LARGE, INSTAGRAM_DOWNLOAD_ERROR
+    )
+
+def process_youtube_url(update: Update, context: CallbackContext, link: MediaLink, user_id: int) -> None:
     """پردازش لینک یوتیوب"""
-    if is_youtube_shorts(url):
-        process_youtube_shorts(update, context, url, user_id)
+    if link.kind == LINK_SHORTS:
+        process_youtube_shorts(update, context, link, user_id)
     else:
-        process_youtube_video(update, context, url, user_id)
+        process_youtube_video(update, context, link, user_id)
 
-def process_youtube_shorts(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+def process_youtube_shorts(update: Update, context: CallbackContext, link: MediaLink, user_id: int) -> None:
     """پردازش لینک شورتز یوتیوب"""
+    url = link.url
     logger.info(f"پردازش لینک شورتز یوتیوب: {url}")
     
     # دریافت استریم‌های موجود برای این شورتز
@@ -264,22 +445,19 @@ def process_youtube_shorts(update: Update, context: CallbackContext, url: str, u
             update.message.reply_text(YOUTUBE_DOWNLOAD_ERROR)
             return
             
-        # ذخیره اطلاعات برای استفاده در کالبک
-        user_data[user_id] = {
-            'youtube_shorts_url': url,
-            'streams': streams,
-            'chat_id': update.effective_chat.id
-        }
+        # ذخیره اطلاعات در نشست درخواست برای استفاده در کالبک (بدون استخراج مجدد استریم‌ها)
+        session = {'url': url, 'media_id': link.media_id, 'streams': streams}
+        token = session_store.create(user_id, update.effective_chat.id, **session)
         
         # ایجاد دکمه‌های انتخاب کیفیت
         keyboard = []
         
         # اضافه کردن دکمه‌های کیفیت برای شورتز
         for resolution, (itag, _) in streams.items():
-            keyboard.append([InlineKeyboardButton(f"📹 {resolution}", callback_data=f"shorts_quality_{itag}")])
+            keyboard.append([InlineKeyboardButton(f"📹 {resolution}", callback_data=callback_data(ACTION_SHORTS_QUALITY, token, itag))])
         
         # اضافه کردن دکمه استخراج صدا
-        keyboard.append([InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=f"shorts_audio_{url}")])
+        keyboard.append([InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=callback_data(ACTION_SHORTS_AUDIO, token))])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -288,666 +466,306 @@ def process_youtube_shorts(update: Update, context: CallbackContext, url: str, u
             YOUTUBE_QUALITY_SELECTION,
             reply_markup=reply_markup
         )
+        start_speculative_download(token, MENU_SHORTS, session)
+    except ContentUnavailableError as e:
+        logger.warning(f"محتوای {url} در دسترس نیست: {e}")
+        update.message.reply_text(CONTENT_UNAVAILABLE_MESSAGES[e.reason])
+    except DeadlineExceededError as e:
+        logger.warning(f"زمان مجاز پردازش {url} به پایان رسید: {e}")
+        update.message.reply_text(REQUEST_TIMEOUT_ERROR)
     except Exception as e:
         logger.error(f"خطا در پردازش شورتز یوتیوب: {e}")
         update.message.reply_text(YOUTUBE_DOWNLOAD_ERROR)
 
-def download_youtube_shorts_video(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+def download_youtube_shorts_video(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
     """دانلود ویدیوی شورتز یوتیوب"""
-    query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(YOUTUBE_SHORTS_DOWNLOAD_STARTED)
-    output_file = ""  # تعریف متغیر خروجی
+    status_message = update.callback_query.edit_message_text(YOUTUBE_SHORTS_DOWNLOAD_STARTED)
+    url, video_id = session['url'], session['media_id']
+    chat_id = update.effective_chat.id
+    cache_key = media_key('youtube', video_id, 'best', MEDIA_VIDEO) if video_id else None
 
+    logger.info(f"شروع دانلود شورتز یوتیوب با URL: {url}")
     try:
-        logger.info(f"شروع دانلود شورتز یوتیوب با URL: {url}")
-        output_file = youtube_downloader.download_shorts(url)
-
-        if not output_file:
-            logger.warning(f"هیچ فایلی از شورتز {url} دانلود نشد.")
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"شورتز یوتیوب با موفقیت دانلود شد: {output_file}")
-        file_size = get_file_size(output_file)
-        logger.info(f"سایز فایل شورتز: {format_size(file_size)}")
-
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال ویدیو به کاربر
-        try:
-            with open(output_file, 'rb') as video_file:
-                context.bot.send_video(
-                    chat_id=user_data[user_id]['chat_id'],
-                    video=video_file
-                )
-
-            status_message.edit_text(YOUTUBE_SHORTS_DOWNLOAD_SUCCESS)
-            logger.info("شورتز یوتیوب با موفقیت به کاربر ارسال شد")
-
-        except Exception as send_error:
-            logger.error(f"خطا در ارسال شورتز به کاربر: {send_error}")
-            status_message.edit_text(GENERAL_ERROR)
-
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود شورتز یوتیوب: {e}")
-            status_message.edit_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود شورتز یوتیوب: {e}")
-            status_message.edit_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در پردازش شورتز یوتیوب {url}: {e}")
-            logger.exception("جزئیات خطا:")
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
+        deliver_media_request(
+            context.bot, chat_id, url, cache_key,
+            lambda: send_youtube_video(context.bot, chat_id, cache_key, lambda: youtube_downloader.download_shorts(url),
+                                       on_upload=lambda: status_message.edit_text(UPLOAD_TO_TELEGRAM)),
+            status_message.edit_text, YOUTUBE_SHORTS_DOWNLOAD_SUCCESS, YOUTUBE_FILE_TOO_LARGE, YOUTUBE_DOWNLOAD_ERROR
+        )
     finally:
-        # پاک کردن فایل موقت
-        if output_file:
-            logger.info(f"پاک کردن فایل موقت شورتز: {output_file}")
-            youtube_downloader.clean_up(output_file)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
 
-def download_youtube_shorts_audio(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+def download_youtube_shorts_audio(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
     """دانلود و استخراج صدای شورتز یوتیوب"""
-    query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(AUDIO_EXTRACTION_STARTED)
-    video_file = ""
-    audio_file = ""
-
-    try:
-        logger.info(f"شروع دانلود شورتز یوتیوب برای استخراج صدا با URL: {url}")
-        # ابتدا ویدیو را دانلود می‌کنیم
-        video_file = youtube_downloader.download_shorts(url)
-
-        if not video_file:
-            logger.warning(f"هیچ فایلی از شورتز {url} دانلود نشد.")
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"شورتز یوتیوب با موفقیت دانلود شد: {video_file}")
-
-        # استخراج صدا از ویدیو
-        logger.info("در حال استخراج صدا از ویدیو...")
-        audio_file = convert_video_to_audio(video_file)
-
-        if not audio_file:
-            logger.error("خطا در استخراج صدا از ویدیو")
-            status_message.edit_text(AUDIO_EXTRACTION_ERROR)
-            return
-
-        file_size = get_file_size(audio_file)
-        logger.info(f"صدا با موفقیت استخراج شد. سایز: {format_size(file_size)}")
-
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال فایل صوتی به کاربر
-        try:
-            with open(audio_file, 'rb') as audio:
-                context.bot.send_audio(
-                    chat_id=user_data[user_id]['chat_id'],
-                    audio=audio,
-                    title=f"Audio from YouTube Shorts"
-                )
-
-            status_message.edit_text(AUDIO_EXTRACTION_SUCCESS)
-            logger.info("فایل صوتی با موفقیت به کاربر ارسال شد")
-
-        except Exception as send_error:
-            logger.error(f"خطا در ارسال فایل صوتی به کاربر: {send_error}")
-            status_message.edit_text(GENERAL_ERROR)
-
-    except Exception as e:
-        logger.error(f"خطا در استخراج صدا از شورتز یوتیوب {url}: {e}")
-        logger.exception("جزئیات خطا:")
-        status_message.edit_text(AUDIO_EXTRACTION_ERROR)
-    finally:
-        # پاک کردن فایل‌های موقت
-        if video_file:
-            logger.info(f"پاک کردن فایل موقت ویدیو: {video_file}")
-            youtube_downloader.clean_up(video_file)
-        if audio_file:
-            logger.info(f"پاک کردن فایل موقت صوتی: {audio_file}")
-            clean_temp_file(audio_file)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
+    download_audio_request(update, context, token, session, "Audio from YouTube Shorts")
+
+def main_menu_markup(token: str) -> InlineKeyboardMarkup:
+    """دکمه‌های انتخاب نوع دانلود ویدیوی یوتیوب"""
+    keyboard = [
+        [
+            InlineKeyboardButton(BUTTON_DOWNLOAD_VIDEO, callback_data=callback_data(ACTION_VIDEO_MENU, token)),
+            InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=callback_data(ACTION_AUDIO, token))
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
 
-def process_youtube_video(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+def process_youtube_video(update: Update, context: CallbackContext, link: MediaLink, user_id: int) -> None:
     """پردازش لینک ویدیوی یوتیوب"""
+    url = link.url
     # دریافت لیست کیفیت‌های موجود
-    available_streams = youtube_downloader.get_available_streams(url)
+    try:
+        available_streams = youtube_downloader.get_available_streams(url)
+    except ContentUnavailableError as e:
+        logger.warning(f"محتوای {url} در دسترس نیست: {e}")
+        update.message.reply_text(CONTENT_UNAVAILABLE_MESSAGES[e.reason])
+        return
+    except DeadlineExceededError as e:
+        logger.warning(f"زمان مجاز پردازش {url} به پایان رسید: {e}")
+        update.message.reply_text(REQUEST_TIMEOUT_ERROR)
+        return
+    except Exception as e:
+        logger.error(f"خطا در دریافت کیفیت‌های ویدیوی یوتیوب {url}: {e}")
+        update.message.reply_text(YOUTUBE_DOWNLOAD_ERROR)
+        return
 
     if not available_streams:
         update.message.reply_text(YOUTUBE_DOWNLOAD_ERROR)
         return
 
-    # ایجاد دکمه‌های انتخاب کیفیت
-    keyboard = []
-    
-    # دکمه‌های اصلی
-    keyboard.append([
-        InlineKeyboardButton(BUTTON_DOWNLOAD_VIDEO, callback_data=f"video_{url}"),
-        InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=f"audio_{url}")
-    ])
-    
-    # ذخیره اطلاعات برای استفاده در کالبک
-    user_data[user_id] = {
-        'youtube_url': url,
-        'chat_id': update.effective_chat.id,
-        'streams': available_streams
-    }
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # استریم‌ها و شناسه ویدیو یک بار در نشست درخواست ذخیره می‌شوند تا منوی کیفیت
+    # و دانلود بدون تجزیه مجدد لینک یا استخراج مجدد استریم‌ها انجام شوند
+    token = session_store.create(
+        user_id, update.effective_chat.id,
+        url=url, media_id=link.media_id, streams=available_streams
+    )
 
     # ارسال پیام با دکمه‌های انتخابی
     update.message.reply_text(
         "لطفاً نوع دانلود را انتخاب کنید:",
-        reply_markup=reply_markup
+        reply_markup=main_menu_markup(token)
     )
 
 
-def download_youtube_video(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """دانلود ویدیوی یوتیوب"""
+def show_quality_menu(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
+    """نمایش دکمه‌های انتخاب کیفیت ویدیوی یوتیوب از استریم‌های ذخیره شده در نشست"""
     query = update.callback_query
-    query.answer()
+    streams = session['streams']
 
-    status_message = query.edit_message_text(YOUTUBE_DOWNLOAD_STARTED)
-
-    try:
-        # دریافت استریم‌های موجود
-        streams = youtube_downloader.get_available_streams(url)
+    # ایجاد دکمه‌های انتخاب کیفیت
+    keyboard = []
+    for resolution, (itag, _) in streams.items():
+        # عنوان کیفیت شامل حجم (دقیق یا تخمینی) است
+        keyboard.append([InlineKeyboardButton(resolution, callback_data=callback_data(ACTION_QUALITY, token, itag))])
 
-        if not streams:
-            logger.warning(f"هیچ استریمی برای URL {url} یافت نشد")
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
+    logger.info(f"تعداد {len(keyboard)} دکمه برای انتخاب کیفیت ساخته شد")
 
-        # ذخیره اطلاعات برای استفاده در کالبک
-        user_data[user_id] = {
-            'youtube_url': url,
-            'streams': streams,
-            'status_message_id': status_message.message_id,
-            'chat_id': update.effective_chat.id
-        }
-        logger.info(f"اطلاعات کاربر {user_id} با کلید youtube_url={url} ذخیره شد")
+    # اضافه کردن دکمه بازگشت
+    keyboard.append([InlineKeyboardButton(BUTTON_BACK, callback_data=callback_data(ACTION_BACK, token))])
 
-        # ایجاد دکمه‌های انتخاب کیفیت
-        keyboard = []
-        for resolution, (itag, size) in streams.items():
-            size_str = format_size(size)
-            keyboard.append([InlineKeyboardButton(f"{resolution} ({size_str})", callback_data=f"youtube_quality_{itag}")])
-        
-        logger.info(f"تعداد {len(keyboard)} دکمه برای انتخاب کیفیت ساخته شد")
+    query.edit_message_text(
+        YOUTUBE_QUALITY_SELECTION,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    start_speculative_download(token, MENU_VIDEO, session)
 
-        # اضافه کردن دکمه بازگشت
-        keyboard.append([InlineKeyboardButton(BUTTON_BACK, callback_data=f"back_{url}")])
+def show_main_menu(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
+    """بازگشت به منوی اصلی انتخاب نوع دانلود"""
+    prefetcher.cancel(token)
+    update.callback_query.edit_message_text(
+        "لطفاً نوع دانلود را انتخاب کنید:",
+        reply_markup=main_menu_markup(token)
+    )
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
+def download_audio_request(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                           title: str) -> None:
+    """دانلود صدای ویدیو یا شورتز یوتیوب و ارسال آن با عنوان title"""
+    status_message = update.callback_query.edit_message_text(AUDIO_EXTRACTION_STARTED)
+    url, video_id = session['url'], session['media_id']
+    chat_id = update.effective_chat.id
+    cache_key = media_key('youtube', video_id, 'best', MEDIA_AUDIO) if video_id else None
 
-        status_message.edit_text(
-            YOUTUBE_QUALITY_SELECTION,
-            reply_markup=reply_markup
+    logger.info(f"شروع دانلود صدای یوتیوب با URL: {url}")
+    try:
+        deliver_media_request(
+            context.bot, chat_id, url, cache_key,
+            lambda: send_youtube_audio(context.bot, chat_id, url, video_id, cache_key, title,
+                                       on_upload=lambda: status_message.edit_text(UPLOAD_TO_TELEGRAM)),
+            status_message.edit_text, AUDIO_EXTRACTION_SUCCESS, AUDIO_FILE_TOO_LARGE, AUDIO_EXTRACTION_ERROR,
+            title=title
         )
-        logger.info("دکمه‌های انتخاب کیفیت با موفقیت نمایش داده شد")
-
-    except Exception as e:
-        logger.error(f"خطا در پردازش ویدیوی یوتیوب {url}: {e}")
-        logger.exception("جزئیات خطا:")
-        status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
+    finally:
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
 
-def download_youtube_audio(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
+def download_youtube_audio(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
     """دانلود و استخراج صدای ویدیوی یوتیوب"""
+    download_audio_request(update, context, token, session, "Audio from YouTube")
+
+def playlist_menu_markup(token: str) -> InlineKeyboardMarkup:
+    """دکمه‌های انتخاب نوع دانلود پلی‌لیست"""
+    keyboard = [
+        [InlineKeyboardButton(BUTTON_DOWNLOAD_PLAYLIST, callback_data=callback_data(ACTION_PLAYLIST_LIMITS, token, MEDIA_VIDEO))],
+        [InlineKeyboardButton(BUTTON_DOWNLOAD_PLAYLIST_AUDIO, callback_data=callback_data(ACTION_PLAYLIST_LIMITS, token, MEDIA_AUDIO))]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def process_youtube_playlist(update: Update, context: CallbackContext, link: MediaLink, user_id: int) -> None:
+    """پردازش لینک پلی‌لیست یوتیوب: نمایش منوی نوع دانلود"""
+    logger.info(f"پردازش لینک پلی‌لیست یوتیوب: {link.url}")
+    token = session_store.create(user_id, update.effective_chat.id, url=link.url, media_id=link.media_id)
+    update.message.reply_text(PLAYLIST_TYPE_SELECTION, reply_markup=playlist_menu_markup(token))
+
+def show_playlist_menu(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
+    """بازگشت به منوی نوع دانلود پلی‌لیست"""
+    update.callback_query.edit_message_text(PLAYLIST_TYPE_SELECTION, reply_markup=playlist_menu_markup(token))
+
+def show_playlist_limits(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                         media_kind: str) -> None:
+    """نمایش دکمه‌های انتخاب تعداد ویدیوهای پلی‌لیست"""
+    action = ACTION_PLAYLIST_AUDIO if media_kind == MEDIA_AUDIO else ACTION_PLAYLIST_VIDEO
+    keyboard = [[
+        InlineKeyboardButton(label, callback_data=callback_data(action, token, limit))
+        for limit, label in PLAYLIST_LIMIT_BUTTONS if limit <= PLAYLIST_MAX_ITEMS
+    ]]
+    keyboard.append([InlineKeyboardButton(BUTTON_BACK, callback_data=callback_data(ACTION_PLAYLIST_MENU, token))])
+    update.callback_query.edit_message_text(PLAYLIST_LIMIT_SELECTION, reply_markup=InlineKeyboardMarkup(keyboard))
+
+def download_playlist_videos(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                             limit: str) -> None:
+    """دانلود ویدیوهای پلی‌لیست یوتیوب"""
+    download_youtube_playlist(update, context, token, session, limit, deliver_youtube_video)
+
+def download_playlist_audio(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                            limit: str) -> None:
+    """استخراج صدای ویدیوهای پلی‌لیست یوتیوب"""
+    download_youtube_playlist(update, context, token, session, limit, deliver_youtube_audio)
+
+def download_youtube_playlist(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                              limit: str, deliver) -> None:
+    """دانلود همزمان چند ویدیوی اول پلی‌لیست
+
+    حداکثر PLAYLIST_CONCURRENCY ویدیو همزمان دانلود می‌شوند و هر کدام به محض آماده شدن
+    ارسال می‌شود، بنابراین زمان کل به کندترین ویدیو نزدیک است نه مجموع آنها. ویدیوهایی
+    که قبلاً ارسال یا دانلود شده‌اند از کش file_id یا کش فایل ارسال می‌شوند.
+    """
     query = update.callback_query
-    query.answer()
 
-    status_message = query.edit_message_text(AUDIO_EXTRACTION_STARTED)
-    video_file = ""
-    audio_file = ""
+    url = session['url']
+    status_message = query.edit_message_text(PLAYLIST_DOWNLOAD_STARTED)
 
     try:
-        logger.info(f"شروع دانلود ویدیوی یوتیوب برای استخراج صدا با URL: {url}")
-
-        # دریافت استریم‌های موجود
-        streams = youtube_downloader.get_available_streams(url)
-
-        if not streams:
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        # انتخاب بهترین کیفیت با کمترین حجم
-        itag = None
-        min_size = float('inf')
-        for _, (tag, size) in streams.items():
-            if size < min_size:
-                min_size = size
-                itag = tag
-
-        if not itag:
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        # دانلود ویدیو
-        video_file = youtube_downloader.download_video(url, int(itag))
-
-        if not video_file:
-            logger.warning(f"هیچ فایلی از URL {url} دانلود نشد.")
-            status_message.edit_text(YOUTUBE_DOWNLOAD_ERROR)
+        limit = max(1, min(int(limit), PLAYLIST_MAX_ITEMS))
+        entries = youtube_downloader.get_playlist_videos(url, limit)
+        links = unique_links([link for link in (classify_url(entry['url']) for entry in entries) if link])
+        if not links:
+            logger.warning(f"هیچ ویدیویی در پلی‌لیست {url} یافت نشد")
+            status_message.edit_text(PLAYLIST_DOWNLOAD_ERROR)
             return
 
-        logger.info(f"ویدیوی یوتیوب با موفقیت دانلود شد: {video_file}")
-
-        # استخراج صدا از ویدیو
-        logger.info("در حال استخراج صدا از ویدیو...")
-        audio_file = convert_video_to_audio(video_file)
-
-        if not audio_file:
-            logger.error("خطا در استخراج صدا از ویدیو")
-            status_message.edit_text(AUDIO_EXTRACTION_ERROR)
-            return
-
-        file_size = get_file_size(audio_file)
-        logger.info(f"صدا با موفقیت استخراج شد. سایز: {format_size(file_size)}")
-
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال فایل صوتی به کاربر
-        try:
-            with open(audio_file, 'rb') as audio:
-                context.bot.send_audio(
-                    chat_id=user_data[user_id]['chat_id'],
-                    audio=audio,
-                    title=f"Audio from YouTube"
-                )
-
-            status_message.edit_text(AUDIO_EXTRACTION_SUCCESS)
-            logger.info("فایل صوتی با موفقیت به کاربر ارسال شد")
-
-        except Exception as send_error:
-            logger.error(f"خطا در ارسال فایل صوتی به کاربر: {send_error}")
-            status_message.edit_text(GENERAL_ERROR)
+        logger.info(f"دانلود {len(links)} ویدیو از پلی‌لیست {url}")
+        succeeded = deliver_batch(context.bot, session['chat_id'], links, deliver, status_message, PLAYLIST_CONCURRENCY)
+        logger.info(f"دانلود پلی‌لیست {url} پایان یافت: {succeeded} از {len(links)} موفق")
 
+    except DeadlineExceededError as e:
+        logger.warning(f"زمان مجاز پردازش {url} به پایان رسید: {e}")
+        status_message.edit_text(REQUEST_TIMEOUT_ERROR)
     except Exception as e:
-        logger.error(f"خطا در استخراج صدا از ویدیوی یوتیوب {url}: {e}")
+        logger.error(f"خطا در دانلود پلی‌لیست یوتیوب {url}: {e}")
         logger.exception("جزئیات خطا:")
-        status_message.edit_text(AUDIO_EXTRACTION_ERROR)
+        status_message.edit_text(PLAYLIST_DOWNLOAD_ERROR)
     finally:
-        # پاک کردن فایل‌های موقت
-        if video_file:
-            logger.info(f"پاک کردن فایل موقت ویدیو: {video_file}")
-            youtube_downloader.clean_up(video_file)
-        if audio_file:
-            logger.info(f"پاک کردن فایل موقت صوتی: {audio_file}")
-            clean_temp_file(audio_file)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
 
 def callback_handler(update: Update, context: CallbackContext) -> None:
-    """هندلر اصلی برای همه دکمه‌های اینلاین"""
-    query = update.callback_query
-    query.answer()
-
-    user_id = update.effective_user.id
-    callback_data = query.data
-
-    # پردازش دکمه‌های برای ویدیوی یوتیوب (فرمت قدیمی)
-    if callback_data.startswith("yt_"):
-        # برای سازگاری با دکمه‌های قدیمی
-        try:
-            itag = int(callback_data[len("yt_"):])
-            youtube_quality_callback(update, context, itag)
-        except:
-            logger.error(f"خطا در پردازش دکمه yt_ با داده {callback_data}")
-            query.answer("خطا در پردازش دکمه. لطفا مجددا تلاش کنید")
-    elif callback_data.startswith("youtube_quality_"):
-        itag = int(callback_data[len("youtube_quality_"):])
-        youtube_quality_callback(update, context, itag)
-    # پردازش دکمه‌های انتخاب کیفیت برای شورتز یوتیوب
-    elif callback_data.startswith("shorts_quality_"):
-        itag = int(callback_data[len("shorts_quality_"):])
-        shorts_quality_callback(update, context, itag)
-    # پردازش دکمه‌های برای شورتز یوتیوب
-    elif callback_data.startswith("shorts_video_"):
-        url = callback_data[len("shorts_video_"):]
-        download_youtube_shorts_video(update, context, url, user_id)
-    elif callback_data.startswith("shorts_audio_"):
-        url = callback_data[len("shorts_audio_"):]
-        download_youtube_shorts_audio(update, context, url, user_id)
-    # پردازش دکمه‌های ویدیو و صوت برای ویدیوی عادی یوتیوب
-    elif callback_data.startswith("video_"):
-        url = callback_data[len("video_"):]
-        download_youtube_video(update, context, url, user_id)
-    elif callback_data.startswith("audio_"):
-        url = callback_data[len("audio_"):]
-        download_youtube_audio(update, context, url, user_id)
-    # پردازش دکمه‌های اینستاگرام
-    elif callback_data.startswith("insta_video_"):
-        callback_user_id = int(callback_data[len("insta_video_"):])
-        if callback_user_id == user_id and user_id in user_data and 'instagram_url' in user_data[user_id]:
-            url = user_data[user_id]['instagram_url']
-            download_instagram_video(update, context, url, user_id)
-        else:
-            query.answer("این دکمه برای شما نیست یا منقضی شده است.")
-    elif callback_data.startswith("insta_audio_"):
-        callback_user_id = int(callback_data[len("insta_audio_"):])
-        if callback_user_id == user_id and user_id in user_data and 'instagram_url' in user_data[user_id]:
-            url = user_data[user_id]['instagram_url']
-            download_instagram_audio(update, context, url, user_id)
-        else:
-            query.answer("این دکمه برای شما نیست یا منقضی شده است.")
-    # پردازش دکمه بازگشت
-    elif callback_data.startswith("back_"):
-        url = callback_data[len("back_"):]
-        # بازگشت به منوی اصلی انتخاب نوع دانلود
-        keyboard = [
-            [
-                InlineKeyboardButton(BUTTON_DOWNLOAD_VIDEO, callback_data=f"video_{url}"),
-                InlineKeyboardButton(BUTTON_EXTRACT_AUDIO, callback_data=f"audio_{url}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        query.edit_message_text(
-            "لطفاً نوع دانلود را انتخاب کنید:",
-            reply_markup=reply_markup
-        )
-
+    """هندلر اصلی برای همه دکمه‌های اینلاین
 
-# این تابع دیگر استفاده نمی‌شود و با youtube_quality_callback جایگزین شده است
-
-def shorts_quality_callback(update: Update, context: CallbackContext, itag: int) -> None:
-    """پردازش انتخاب کیفیت شورتز یوتیوب"""
+    وضعیت هر درخواست با یک بار خواندن نشست آن به دست می‌آید و عملیات دکمه
+    از جدول CALLBACK_MENUS (پاسخ فوری) یا CALLBACK_JOBS (کار پس‌زمینه) انتخاب می‌شود.
+    """
     query = update.callback_query
     query.answer()
 
     user_id = update.effective_user.id
-    if user_id not in user_data:
-        logger.warning(f"کاربر {user_id} در دیکشنری داده‌ها یافت نشد")
-        query.edit_message_text(GENERAL_ERROR)
-        return
+    action, token, args = parse_callback_data(query.data)
 
-    # استخراج اطلاعات از دیکشنری کاربر
-    if 'youtube_shorts_url' not in user_data[user_id]:
-        logger.warning(f"لینک شورتز یوتیوب برای کاربر {user_id} یافت نشد")
-        query.edit_message_text(GENERAL_ERROR)
+    session = session_store.get(token, user_id) if token else None
+    if session is None or (action not in CALLBACK_MENUS and action not in CALLBACK_JOBS):
+        # دکمه‌های قالب قدیمی (حاوی لینک) و نشست‌های منقضی یا متعلق به کاربر دیگر
+        logger.warning(f"دکمه نامعتبر یا منقضی از کاربر {user_id}: {query.data}")
+        query.edit_message_text(SESSION_EXPIRED_ERROR)
         return
-        
-    url = user_data[user_id]['youtube_shorts_url']
-    logger.info(f"دانلود شورتز یوتیوب با itag: {itag} - URL: {url}")
-
-    query.edit_message_text(YOUTUBE_SHORTS_DOWNLOAD_STARTED)
-    output_file = ""
-
-    try:
-        # دانلود ویدیو با کیفیت انتخاب شده
-        output_file = youtube_downloader.download_video(url, itag)
-        
-        if not output_file:
-            logger.warning(f"هیچ فایلی با itag {itag} از URL {url} دانلود نشد")
-            query.edit_message_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"شورتز یوتیوب با موفقیت دانلود شد: {output_file}")
-        file_size = get_file_size(output_file)
-        logger.info(f"سایز فایل شورتز: {format_size(file_size)}")
-
-        # ارسال ویدیو به کاربر
-        query.edit_message_text(UPLOAD_TO_TELEGRAM)
-        
-        with open(output_file, 'rb') as video_file:
-            context.bot.send_video(
-                chat_id=user_data[user_id]['chat_id'],
-                video=video_file,
-                supports_streaming=True
-            )
-            
-        logger.info("شورتز یوتیوب با موفقیت به کاربر ارسال شد")
-        query.edit_message_text(YOUTUBE_SHORTS_DOWNLOAD_SUCCESS)
-
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود شورتز یوتیوب: {e}")
-            query.edit_message_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود شورتز یوتیوب: {e}")
-            query.edit_message_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در دانلود شورتز یوتیوب: {e}")
-            logger.exception("جزئیات خطا:")
-            query.edit_message_text(YOUTUBE_DOWNLOAD_ERROR)
-    finally:
-        # پاک کردن اطلاعات کاربر و فایل موقت
-        if user_id in user_data:
-            logger.info(f"پاک کردن اطلاعات کاربر {user_id} از دیکشنری")
-            del user_data[user_id]
-        if output_file:
-            logger.info(f"پاک کردن فایل موقت ویدیو: {output_file}")
-            youtube_downloader.clean_up(output_file)
-
 
-def download_instagram_video(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """دانلود ویدیوی اینستاگرام"""
-    query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(INSTAGRAM_DOWNLOAD_STARTED)
-    downloaded_files = []
-
-    try:
-        logger.info(f"شروع دانلود ویدیوی اینستاگرام با URL: {url}")
-        downloaded_files = instagram_downloader.download_post(url)
-
-        if not downloaded_files:
-            logger.warning(f"هیچ فایلی از {url} دانلود نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-            
-        video_files = [f for f in downloaded_files if not f.endswith('.jpg')]
-        
-        if not video_files:
-            logger.warning(f"هیچ فایل ویدیویی در پست {url} یافت نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"تعداد {len(video_files)} ویدیو از اینستاگرام دانلود شد")
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال ویدیوها به کاربر
-        if len(video_files) == 1:
-            # اگر فقط یک ویدیو باشد
-            file_path = video_files[0]
-            file_size = get_file_size(file_path)
-            logger.info(f"ارسال ویدیو با سایز {format_size(file_size)}")
-
-            with open(file_path, 'rb') as video_file:
-                context.bot.send_video(
-                    chat_id=user_data[user_id]['chat_id'],
-                    video=video_file,
-                    supports_streaming=True
-                )
-        else:
-            # اگر چندین ویدیو باشد (آلبوم ویدیو)
-            media_group = []
-            for file_path in video_files[:10]:  # حداکثر 10 ویدیو در یک آلبوم
-                file_size = get_file_size(file_path)
-                logger.info(f"اضافه کردن ویدیو با سایز {format_size(file_size)} به آلبوم")
-
-                with open(file_path, 'rb') as video_file:
-                    media_group.append(InputMediaVideo(media=video_file))
+    if action in CALLBACK_MENUS:
+        CALLBACK_MENUS[action](update, context, token, session, *args)
+        return
 
-            if media_group:
-                logger.info(f"ارسال آلبوم با {len(media_group)} ویدیو")
-                context.bot.send_media_group(
-                    chat_id=user_data[user_id]['chat_id'],
-                    media=media_group
-                )
+    # دانلود حدسی فقط برای انتخاب کیفیت به کار می‌آید
+    if action not in (ACTION_QUALITY, ACTION_SHORTS_QUALITY):
+        prefetcher.cancel(token)
+    # عملیات انتخاب شده در نشست ثبت می‌شود (برای گزارش و تکرار درخواست)
+    session['action'] = action
+    session_store.update(token, action=action)
+    kind, handler = CALLBACK_JOBS[action]
+    enqueue_job(update, context, kind, handler, token, session, *args)
 
-        status_message.edit_text(INSTAGRAM_DOWNLOAD_SUCCESS)
-        logger.info("ویدیوهای اینستاگرام با موفقیت به کاربر ارسال شد")
 
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود ویدیوی اینستاگرام: {e}")
-            status_message.edit_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود ویدیوی اینستاگرام: {e}")
-            status_message.edit_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در دانلود ویدیوی اینستاگرام {url}: {e}")
-            logger.exception("جزئیات خطا:")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-    finally:
-        # پاک کردن فایل‌های موقت
-        if downloaded_files:
-            logger.info(f"پاک کردن {len(downloaded_files)} فایل موقت")
-            instagram_downloader.clean_up(downloaded_files)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
-            
-            
-def download_instagram_audio(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """دانلود و استخراج صدای ویدیوی اینستاگرام"""
+def download_quality_request(update: Update, context: CallbackContext, token: str, session: Dict[str, Any],
+                             itag: str, menu: str, started_message: str, success_message: str) -> None:
+    """دانلود ویدیو یا شورتز یوتیوب با کیفیت انتخاب شده (itag) و ارسال آن"""
     query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(AUDIO_EXTRACTION_STARTED)
-    downloaded_files = []
-    audio_file = ""
+    url, video_id, chat_id = session['url'], session['media_id'], session['chat_id']
+    logger.info(f"دانلود یوتیوب با itag: {itag} - URL: {url}")
+    prefetcher.resolve(token, menu, itag, session.get('streams'))
+    cache_key = media_key('youtube', video_id, str(itag), MEDIA_VIDEO) if video_id else None
 
+    query.edit_message_text(started_message)
     try:
-        logger.info(f"شروع دانلود ویدیوی اینستاگرام برای استخراج صدا با URL: {url}")
-        # ابتدا ویدیو را دانلود می‌کنیم
-        downloaded_files = instagram_downloader.download_post(url)
-
-        if not downloaded_files:
-            logger.warning(f"هیچ فایلی از {url} دانلود نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-
-        # فقط فایل‌های ویدیویی را استخراج می‌کنیم
-        video_files = [f for f in downloaded_files if not f.endswith('.jpg')]
-        
-        if not video_files:
-            logger.warning(f"هیچ فایل ویدیویی در پست {url} یافت نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-            
-        logger.info(f"تعداد {len(video_files)} ویدیو از اینستاگرام دانلود شد")
-        
-        # اگر چندین ویدیو باشد، فقط از اولین ویدیو صدا استخراج می‌کنیم
-        video_file = video_files[0]
-
-        # استخراج صدا از ویدیو
-        logger.info("در حال استخراج صدا از ویدیو...")
-        audio_file = convert_video_to_audio(video_file)
-
-        if not audio_file:
-            logger.error("خطا در استخراج صدا از ویدیو")
-            status_message.edit_text(AUDIO_EXTRACTION_ERROR)
-            return
-
-        file_size = get_file_size(audio_file)
-        logger.info(f"صدا با موفقیت استخراج شد. سایز: {format_size(file_size)}")
-
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال فایل صوتی به کاربر
-        with open(audio_file, 'rb') as audio:
-            context.bot.send_audio(
-                chat_id=user_data[user_id]['chat_id'],
-                audio=audio,
-                title=f"Audio from Instagram"
-            )
-
-        status_message.edit_text(AUDIO_EXTRACTION_SUCCESS)
-        logger.info("فایل صوتی با موفقیت به کاربر ارسال شد")
-
-    except Exception as e:
-        logger.error(f"خطا در استخراج صدا از ویدیوی اینستاگرام {url}: {e}")
-        logger.exception("جزئیات خطا:")
-        status_message.edit_text(AUDIO_EXTRACTION_ERROR)
+        deliver_media_request(
+            context.bot, chat_id, url, cache_key,
+            lambda: send_youtube_video(
+                context.bot, chat_id, cache_key, lambda: youtube_downloader.download_video(url, itag),
+                # فرمت‌های پیش‌رونده همزمان با دریافت و بدون نوشتن روی دیسک ارسال می‌شوند
+                stream=lambda: stream_youtube_video(context.bot, chat_id, url, itag, query),
+                on_upload=lambda: query.edit_message_text(UPLOAD_TO_TELEGRAM)
+            ),
+            query.edit_message_text, success_message, YOUTUBE_FILE_TOO_LARGE, YOUTUBE_DOWNLOAD_ERROR
+        )
     finally:
-        # پاک کردن فایل‌های موقت
-        if downloaded_files:
-            logger.info(f"پاک کردن {len(downloaded_files)} فایل موقت")
-            instagram_downloader.clean_up(downloaded_files)
-        if audio_file:
-            logger.info(f"پاک کردن فایل موقت صوتی: {audio_file}")
-            clean_temp_file(audio_file)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
 
+def shorts_quality_callback(update: Update, context: CallbackContext, token: str, session: Dict[str, Any], itag: str) -> None:
+    """پردازش انتخاب کیفیت شورتز یوتیوب"""
+    download_quality_request(update, context, token, session, itag, MENU_SHORTS,
+                             YOUTUBE_SHORTS_DOWNLOAD_STARTED, YOUTUBE_SHORTS_DOWNLOAD_SUCCESS)
 
-def youtube_quality_callback(update: Update, context: CallbackContext, itag: int) -> None:
+def youtube_quality_callback(update: Update, context: CallbackContext, token: str, session: Dict[str, Any], itag: str) -> None:
     """پردازش انتخاب کیفیت ویدیوی یوتیوب"""
-    query = update.callback_query
-    query.answer()
-
-    user_id = update.effective_user.id
-    if user_id not in user_data:
-        logger.warning(f"کاربر {user_id} در دیکشنری داده‌ها یافت نشد")
-        query.edit_message_text(GENERAL_ERROR)
-        return
-
-    # چک کردن کلید youtube_url در دیکشنری کاربر
-    if 'youtube_url' not in user_data[user_id]:
-        logger.warning(f"کلید youtube_url برای کاربر {user_id} یافت نشد")
-        logger.warning(f"کلیدهای موجود: {list(user_data[user_id].keys())}")
-        query.edit_message_text(GENERAL_ERROR)
-        return
-
-    url = user_data[user_id]['youtube_url']
-    logger.info(f"دانلود ویدیوی یوتیوب با itag: {itag} - URL: {url}")
-
-    query.edit_message_text(DOWNLOADING_MESSAGE)
-    output_file = ""
-
-    try:
-        output_file = youtube_downloader.download_video(url, itag)
-        if not output_file:
-            logger.warning(f"هیچ فایلی با itag {itag} از URL {url} دانلود نشد")
-            query.edit_message_text(YOUTUBE_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"ویدیوی یوتیوب با موفقیت دانلود شد: {output_file}")
-        file_size = get_file_size(output_file)
-        logger.info(f"سایز فایل ویدیو: {format_size(file_size)}")
-
-        query.edit_message_text(UPLOAD_TO_TELEGRAM)
-        with open(output_file, 'rb') as video_file:
-            context.bot.send_video(
-                chat_id=user_data[user_id]['chat_id'],
-                video=video_file,
-                supports_streaming=True
-            )
-        logger.info("ویدیوی یوتیوب با موفقیت به کاربر ارسال شد")
-        query.edit_message_text(YOUTUBE_DOWNLOAD_SUCCESS)
-
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود ویدیوی یوتیوب: {e}")
-            query.edit_message_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود ویدیوی یوتیوب: {e}")
-            query.edit_message_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در دانلود ویدیوی یوتیوب: {e}")
-            logger.exception("جزئیات خطا:")
-            query.edit_message_text(YOUTUBE_DOWNLOAD_ERROR)
-    finally:
-        if user_id in user_data:
-            logger.info(f"پاک کردن اطلاعات کاربر {user_id} از دیکشنری")
-            del user_data[user_id]
-        if output_file:
-            logger.info(f"پاک کردن فایل موقت ویدیو: {output_file}")
-            youtube_downloader.clean_up(output_file)
-
+    download_quality_request(update, context, token, session, itag, MENU_VIDEO,
+                             DOWNLOADING_MESSAGE, YOUTUBE_DOWNLOAD_SUCCESS)
+
+# عملیات دکمه‌هایی که فقط منوی پیام را تغییر می‌دهند و بلافاصله پاسخ داده می‌شوند
+CALLBACK_MENUS = {
+    ACTION_VIDEO_MENU: show_quality_menu,
+    ACTION_BACK: show_main_menu,
+    ACTION_PLAYLIST_MENU: show_playlist_menu,
+    ACTION_PLAYLIST_LIMITS: show_playlist_limits,
+}
+
+# عملیات دکمه‌هایی که دانلود را در صف کارهای پس‌زمینه قرار می‌دهند: (نوع کار، هندلر)
+CALLBACK_JOBS = {
+    ACTION_QUALITY: (JobKind.YOUTUBE_VIDEO, youtube_quality_callback),
+    ACTION_AUDIO: (JobKind.YOUTUBE_AUDIO, download_youtube_audio),
+    ACTION_SHORTS_QUALITY: (JobKind.YOUTUBE_SHORTS_VIDEO, shorts_quality_callback),
+    ACTION_SHORTS_VIDEO: (JobKind.YOUTUBE_SHORTS_VIDEO, download_youtube_shorts_video),
+    ACTION_SHORTS_AUDIO: (JobKind.YOUTUBE_SHORTS_AUDIO, download_youtube_shorts_audio),
+    ACTION_INSTAGRAM_VIDEO: (JobKind.INSTAGRAM_VIDEO, download_instagram_video),
+    ACTION_INSTAGRAM_AUDIO: (JobKind.INSTAGRAM_AUDIO, download_instagram_audio),
+    ACTION_PLAYLIST_VIDEO: (JobKind.YOUTUBE_PLAYLIST, download_playlist_videos),
+    ACTION_PLAYLIST_AUDIO: (JobKind.YOUTUBE_PLAYLIST, download_playlist_audio),
+}
 
 def main() -> None:
     """راه‌اندازی بات"""
@@ -960,6 +778,10 @@ def main() -> None:
     dispatcher.add_handler(CommandHandler("help", help_command))
     dispatcher.add_handler(CommandHandler("about", about_command))
     dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, process_message))
+    dispatcher.add_handler(MessageHandler(
+        Filters.document.file_extension("txt") | Filters.document.mime_type("text/plain"),
+        process_document
+    ))
 
     # هندلر جدید برای تمام دکمه‌های اینلاین
     dispatcher.add_handler(CallbackQueryHandler(callback_handler))
@@ -969,5 +791,8 @@ def main() -> None:
     updater.start_polling()
     updater.idle()
 
+    # توقف کارگرهای صف پس‌زمینه
+    job_manager.shutdown(wait=False)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
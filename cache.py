@@ -0,0 +1,618 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from telegram import InputMediaPhoto, InputMediaVideo
+from telegram.error import TelegramError
+
+from config import (
+    FILE_ID_CACHE_PATH,
+    FILE_ID_CACHE_TTL,
+    MEDIA_CACHE_DIR,
+    MEDIA_CACHE_MAX_BYTES,
+    NEGATIVE_CACHE_PATH,
+    NEGATIVE_CACHE_TTL_UNAVAILABLE,
+    NEGATIVE_CACHE_TTL_PRIVATE,
+    NEGATIVE_CACHE_TTL_TOO_LARGE,
+    NEGATIVE_CACHE_TTL_REGION_BLOCKED
+)
+from utils import generate_temp_filename, clean_temp_file
+from downloader.errors import (
+    ContentUnavailableError,
+    FileTooLargeError,
+    REASON_UNAVAILABLE,
+    REASON_PRIVATE,
+    REASON_REGION_BLOCKED,
+    REASON_TOO_LARGE
+)
+
+logger = logging.getLogger(__name__)
+
+# انواع رسانه‌ای که در کش file_id نگهداری می‌شوند
+MEDIA_VIDEO = 'video'
+MEDIA_AUDIO = 'audio'
+MEDIA_PHOTO = 'photo'
+
+
+def media_key(platform: str, media_id: str, variant: str, kind: str) -> str:
+    """ساخت کلید یکتای رسانه بر اساس هویت محتوا
+
+    Args:
+        platform: پلتفرم منبع (youtube یا instagram)
+        media_id: شناسه ویدیوی یوتیوب یا کد کوتاه پست اینستاگرام
+        variant: فرمت یا کیفیت درخواستی (مثلاً itag یا best)
+        kind: نوع خروجی (video یا audio)
+    """
+    return f"{platform}:{media_id}:{variant}:{kind}"
+
+
+def content_key(platform: str, media_id: str) -> str:
+    """کلید یکتای محتوا مستقل از فرمت و نوع خروجی (مثلاً برای وضعیت در دسترس بودن)"""
+    return f"{platform}:{media_id}"
+
+
+class TTLCache:
+    """کش LRU محدود در حافظه با زمان انقضا برای هر رکورد"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """دریافت مقدار ذخیره شده (یا None در صورت نبود یا انقضا)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        """ذخیره مقدار و حذف قدیمی‌ترین رکوردها در صورت پر بودن کش"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """حذف یک رکورد از کش"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """خالی کردن کامل کش"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """آمار استفاده از کش"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / total if total else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+@dataclass
+class CachedMedia:
+    """یک فایل ارسال شده به تلگرام که با file_id قابل ارسال مجدد است"""
+    file_id: str
+    media_type: str
+
+
+def cached_media_from_message(message: Any) -> Optional[CachedMedia]:
+    """استخراج file_id از پیام ارسال شده توسط تلگرام"""
+    if message is None:
+        return None
+    if getattr(message, 'video', None):
+        return CachedMedia(message.video.file_id, MEDIA_VIDEO)
+    if getattr(message, 'audio', None):
+        return CachedMedia(message.audio.file_id, MEDIA_AUDIO)
+    if getattr(message, 'photo', None):
+        # بزرگترین اندازه عکس در انتهای لیست قرار دارد
+        return CachedMedia(message.photo[-1].file_id, MEDIA_PHOTO)
+    return None
+
+
+class FileIdCache:
+    """ایندکس ماندگار file_id های تلگرام بر اساس هویت رسانه، با پشتیبانی از TTL"""
+
+    def __init__(self, path: str = FILE_ID_CACHE_PATH, ttl: int = FILE_ID_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS file_ids (
+                    media_key TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    media_type TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (media_key, item_index)
+                )"""
+            )
+        logger.info(f"کش file_id در مسیر {path} آماده شد")
+
+    def get(self, key: str) -> Optional[List[CachedMedia]]:
+        """دریافت file_id های ذخیره شده برای یک رسانه (یا None در صورت نبود یا انقضا)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_id, media_type, created_at FROM file_ids WHERE media_key = ? ORDER BY item_index",
+                (key,)
+            ).fetchall()
+
+            if rows and any(time.time() - created_at > self.ttl for _, _, created_at in rows):
+                logger.info(f"رکورد کش {key} منقضی شده است")
+                with self._conn:
+                    self._conn.execute("DELETE FROM file_ids WHERE media_key = ?", (key,))
+                rows = []
+
+            if rows:
+                self._hits += 1
+            else:
+                self._misses += 1
+            ratio = self._hit_ratio()
+
+        if rows:
+            logger.info(f"کش file_id برای {key} یافت شد (نرخ موفقیت کش: {ratio:.1%})")
+            return [CachedMedia(file_id, media_type) for file_id, media_type, _ in rows]
+        return None
+
+    def contains(self, key: str) -> bool:
+        """آیا file_id معتبری برای رسانه وجود دارد (بدون تغییر آمار کش)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(created_at) FROM file_ids WHERE media_key = ?", (key,)
+            ).fetchone()
+        return row[0] is not None and time.time() - row[0] <= self.ttl
+
+    def put(self, key: str, items: List[CachedMedia]) -> None:
+        """ذخیره file_id های رسانه پس از ارسال موفق"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_ids WHERE media_key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO file_ids (media_key, item_index, file_id, media_type, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, index, item.file_id, item.media_type, now) for index, item in enumerate(items)]
+            )
+        logger.info(f"{len(items)} file_id برای {key} در کش ذخیره شد")
+
+    def invalidate(self, key: str) -> None:
+        """حذف رکورد یک رسانه از کش (مثلاً وقتی تلگرام file_id را نپذیرد)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_ids WHERE media_key = ?", (key,))
+        logger.info(f"رکورد کش {key} باطل شد")
+
+    def purge_expired(self) -> int:
+        """حذف همه رکوردهای منقضی شده"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM file_ids WHERE created_at < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def _hit_ratio(self) -> float:
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """آمار استفاده از کش"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(DISTINCT media_key) FROM file_ids").fetchone()[0]
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hit_ratio(),
+                'entries': size,
+            }
+
+
+class MediaStore:
+    """کش ماندگار فایل‌های خام دانلود شده روی دیسک، با بودجه حجمی و حذف LRU
+
+    نام هر فایل از هش کلید رسانه ساخته می‌شود و ایندکس در SQLite نگهداری می‌شود.
+    فایل‌ها ابتدا با نام موقت نوشته و سپس به صورت اتمیک جایگزین می‌شوند، بنابراین
+    قطع ناگهانی برنامه فایل ناقصی در کش باقی نمی‌گذارد. فایل‌ها هنگام ذخیره و
+    برداشت (در صورت امکان) با hard link منتقل می‌شوند تا نیازی به کپی نباشد.
+    """
+
+    INDEX_NAME = 'index.sqlite3'
+    # نام‌هایی که خود کش می‌سازد: هش کلید رسانه با پسوند فایل، و نام موقت نوشتن اتمیک
+    _OWNED_FILE = re.compile(r'[0-9a-f]{64}(?:\.\w+)?|\.[0-9a-f-]{36}\.tmp')
+
+    def __init__(self, directory: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, self.INDEX_NAME), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS media_files (
+                    media_key TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (media_key, item_index)
+                )"""
+            )
+        self._recover()
+        logger.info(f"کش فایل‌های رسانه در مسیر {directory} آماده شد (بودجه: {max_bytes} بایت)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    @staticmethod
+    def _filename(key: str, index: int, extension: str) -> str:
+        """نام فایل کش بر اساس هش کلید رسانه و شماره آیتم"""
+        digest = hashlib.sha256(f"{key}#{index}".encode('utf-8')).hexdigest()
+        return f"{digest}{extension}"
+
+    @staticmethod
+    def _link_or_copy(source: str, target: str) -> None:
+        """ایجاد hard link (یا در صورت عدم امکان، کپی) و اطمینان از نوشته شدن روی دیسک"""
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        with open(target, 'rb') as target_file:
+            os.fsync(target_file.fileno())
+
+    def _recover(self) -> None:
+        """پاکسازی فایل‌های موقت نیمه‌کاره و هماهنگ کردن ایندکس با فایل‌های موجود
+
+        فقط فایل‌هایی حذف می‌شوند که نامشان با الگوی نام‌گذاری خود کش مطابقت دارد، تا اگر
+        MEDIA_CACHE_DIR به پوشه‌ای مشترک اشاره کند، فایل‌های دیگر دست نخورند.
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT media_key, filename FROM media_files").fetchall()
+            missing = {key for key, filename in rows if not os.path.exists(self._path(filename))}
+            for key in missing:
+                self._delete_key(key)
+            indexed = {filename for key, filename in rows if key not in missing}
+            for filename in os.listdir(self.directory):
+                if filename in indexed or not self._OWNED_FILE.fullmatch(filename):
+                    continue
+                clean_temp_file(self._path(filename))
+        if missing:
+            logger.warning(f"{len(missing)} رکورد کش فایل بدون فایل روی دیسک حذف شد")
+
+    def _delete_key(self, key: str) -> None:
+        """حذف فایل‌ها و رکوردهای یک رسانه (فراخوانی در حالت قفل)"""
+        rows = self._conn.execute("SELECT filename FROM media_files WHERE media_key = ?", (key,)).fetchall()
+        self._conn.execute("DELETE FROM media_files WHERE media_key = ?", (key,))
+        for (filename,) in rows:
+            clean_temp_file(self._path(filename))
+
+    def _evict(self) -> None:
+        """حذف رسانه‌هایی که مدت بیشتری استفاده نشده‌اند تا حجم کل در محدوده بودجه قرار گیرد"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_files").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT media_key, SUM(size) FROM media_files GROUP BY media_key ORDER BY MAX(last_access) LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            key, size = row
+            self._delete_key(key)
+            total -= size
+            logger.info(f"رسانه {key} برای رعایت بودجه کش فایل حذف شد")
+
+    def _checkout_rows(self, key: str, rows: List[Tuple[str]]) -> Optional[List[str]]:
+        """ایجاد نسخه‌های موقت از فایل‌های کش برای استفاده (و حذف) توسط هندلرها"""
+        copies = []
+        try:
+            for (filename,) in rows:
+                copy_path = generate_temp_filename(os.path.splitext(filename)[1])
+                self._link_or_copy(self._path(filename), copy_path)
+                copies.append(copy_path)
+        except OSError as e:
+            logger.warning(f"خطا در برداشت {key} از کش فایل: {e}")
+            for copy_path in copies:
+                clean_temp_file(copy_path)
+            self.invalidate(key)
+            return None
+        logger.info(f"{len(copies)} فایل برای {key} از کش فایل برداشته شد")
+        return copies
+
+    def contains(self, key: Optional[str]) -> bool:
+        """آیا فایل‌های رسانه در کش وجود دارند (بدون تغییر آمار و زمان استفاده)"""
+        if not self.enabled or not key:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM media_files WHERE media_key = ? LIMIT 1", (key,)).fetchone()
+        return row is not None
+
+    def checkout(self, key: Optional[str]) -> Optional[List[str]]:
+        """دریافت نسخه موقت فایل‌های ذخیره شده یک رسانه (یا None در صورت نبود)"""
+        if not self.enabled or not key:
+            return None
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT filename FROM media_files WHERE media_key = ? ORDER BY item_index", (key,)
+            ).fetchall()
+            if rows:
+                self._hits += 1
+                self._conn.execute("UPDATE media_files SET last_access = ? WHERE media_key = ?", (time.time(), key))
+            else:
+                self._misses += 1
+        return self._checkout_rows(key, rows) if rows else None
+
+    def checkout_file(self, key: Optional[str]) -> Optional[str]:
+        """دریافت نسخه موقت تنها فایل ذخیره شده یک رسانه"""
+        copies = self.checkout(key)
+        return copies[0] if copies else None
+
+    def checkout_variant(self, platform: str, media_id: str, kind: str) -> Optional[List[str]]:
+        """دریافت آخرین نسخه استفاده شده یک رسانه با هر فرمت یا کیفیتی (مثلاً هر کیفیت ویدیو)"""
+        if not self.enabled or not media_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT media_key FROM media_files WHERE media_key GLOB ? ORDER BY last_access DESC LIMIT 1",
+                (media_key(platform, media_id, '*', kind),)
+            ).fetchone()
+        return self.checkout(row[0]) if row else None
+
+    def store(self, key: Optional[str], paths: List[str]) -> None:
+        """ذخیره فایل‌های دانلود شده یک رسانه در کش (بدون تغییر فایل‌های اصلی)"""
+        if not self.enabled or not key or not paths:
+            return
+        try:
+            sizes = [os.path.getsize(path) for path in paths]
+        except OSError as e:
+            logger.warning(f"فایل‌های {key} برای ذخیره در کش یافت نشدند: {e}")
+            return
+        if sum(sizes) > self.max_bytes:
+            logger.info(f"حجم {key} بیشتر از بودجه کش فایل است، ذخیره نمی‌شود")
+            return
+
+        filenames = []
+        try:
+            for index, path in enumerate(paths):
+                filename = self._filename(key, index, os.path.splitext(path)[1])
+                temp_path = self._path(f".{uuid.uuid4()}.tmp")
+                try:
+                    self._link_or_copy(path, temp_path)
+                    # جایگزینی اتمیک: فایل کش یا کامل است یا وجود ندارد
+                    os.replace(temp_path, self._path(filename))
+                finally:
+                    clean_temp_file(temp_path)
+                filenames.append(filename)
+        except OSError as e:
+            logger.warning(f"خطا در ذخیره {key} در کش فایل: {e}")
+            for filename in filenames:
+                clean_temp_file(self._path(filename))
+            return
+
+        now = time.time()
+        with self._lock, self._conn:
+            stale = self._conn.execute("SELECT filename FROM media_files WHERE media_key = ?", (key,)).fetchall()
+            self._conn.execute("DELETE FROM media_files WHERE media_key = ?", (key,))
+            self._conn.executemany(
+                "INSERT INTO media_files (media_key, item_index, filename, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, index, filename, size, now) for index, (filename, size) in enumerate(zip(filenames, sizes))]
+            )
+            for (filename,) in stale:
+                if filename not in filenames:
+                    clean_temp_file(self._path(filename))
+            self._evict()
+        logger.info(f"{len(filenames)} فایل برای {key} در کش فایل ذخیره شد")
+
+    def store_file(self, key: Optional[str], path: Optional[str]) -> None:
+        """ذخیره تک فایل دانلود شده یک رسانه در کش"""
+        if path:
+            self.store(key, [path])
+
+    def invalidate(self, key: str) -> None:
+        """حذف فایل‌ها و رکورد یک رسانه از کش"""
+        with self._lock, self._conn:
+            self._delete_key(key)
+        logger.info(f"رسانه {key} از کش فایل حذف شد")
+
+    def stats(self) -> Dict[str, Any]:
+        """آمار استفاده از کش"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(DISTINCT media_key), COALESCE(SUM(size), 0) FROM media_files"
+            ).fetchone()
+            hits_total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / hits_total if hits_total else 0.0,
+                'entries': entries,
+                'bytes': total,
+            }
+
+
+class NegativeCache:
+    """کش ماندگار خطاهای قطعی (حذف شده، خصوصی، بیش از حد بزرگ، مسدود منطقه‌ای)
+
+    هر نوع خطا مدت اعتبار جداگانه دارد؛ تا پایان آن، درخواست مجدد همان محتوا
+    بدون تماس با یوتیوب یا اینستاگرام با همان خطا پاسخ داده می‌شود.
+    """
+
+    def __init__(self, path: str = NEGATIVE_CACHE_PATH, ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.ttls = ttls or {
+            REASON_UNAVAILABLE: NEGATIVE_CACHE_TTL_UNAVAILABLE,
+            REASON_PRIVATE: NEGATIVE_CACHE_TTL_PRIVATE,
+            REASON_TOO_LARGE: NEGATIVE_CACHE_TTL_TOO_LARGE,
+            REASON_REGION_BLOCKED: NEGATIVE_CACHE_TTL_REGION_BLOCKED,
+        }
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS failures (
+                    failure_key TEXT PRIMARY KEY,
+                    reason TEXT NOT NULL,
+                    detail TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+        logger.info(f"کش نتایج منفی در مسیر {path} آماده شد")
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """دریافت (دلیل، جزئیات) خطای ذخیره شده برای یک کلید (یا None در صورت نبود یا انقضا)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reason, detail, expires_at FROM failures WHERE failure_key = ?", (key,)
+            ).fetchone()
+            if row and row[2] < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM failures WHERE failure_key = ?", (key,))
+                row = None
+            if row:
+                self._hits += 1
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, reason: str, detail: str = "") -> None:
+        """ذخیره یک خطای قطعی با مدت اعتبار مربوط به نوع آن"""
+        ttl = self.ttls.get(reason, 0)
+        if ttl <= 0:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO failures (failure_key, reason, detail, expires_at) VALUES (?, ?, ?, ?)",
+                (key, reason, detail, time.time() + ttl)
+            )
+        logger.info(f"خطای {reason} برای {key} به مدت {ttl} ثانیه در کش نتایج منفی ذخیره شد")
+
+    def raise_if_cached(self, *keys: Optional[str]) -> None:
+        """ایجاد مجدد خطای ذخیره شده برای اولین کلیدی که در کش وجود دارد"""
+        for key in keys:
+            entry = self.get(key) if key else None
+            if not entry:
+                continue
+            reason, detail = entry
+            logger.info(f"خطای {reason} برای {key} از کش نتایج منفی خوانده شد")
+            if reason == REASON_TOO_LARGE:
+                received, _, limit = detail.partition('/')
+                raise FileTooLargeError(int(received), int(limit))
+            raise ContentUnavailableError(reason, detail)
+
+    @contextmanager
+    def guard(self, availability_key: Optional[str], variant_key: Optional[str] = None) -> Iterator[None]:
+        """پاسخ از کش در صورت وجود خطای ذخیره شده، و ذخیره خطاهای قطعی رخ داده در بدنه
+
+        خطاهای در دسترس بودن برای کل محتوا (availability_key) و خطای حجم فقط برای
+        فرمت درخواستی (variant_key) ذخیره می‌شوند.
+        """
+        self.raise_if_cached(availability_key, variant_key)
+        try:
+            yield
+        except ContentUnavailableError as e:
+            if availability_key:
+                self.put(availability_key, e.reason, e.detail)
+            raise
+        except FileTooLargeError as e:
+            if variant_key:
+                self.put(variant_key, REASON_TOO_LARGE, f"{e.received}/{e.limit}")
+            raise
+
+    def purge_expired(self) -> int:
+        """حذف همه رکوردهای منقضی شده"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM failures WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """آمار استفاده از کش"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM failures").fetchone()[0]
+            return {
+                'hits': self._hits,
+                'entries': size,
+            }
+
+
+# نمونه مشترک کش file_id
+file_id_cache = FileIdCache()
+# نمونه مشترک کش فایل‌های رسانه
+media_store = MediaStore()
+# نمونه مشترک کش نتایج منفی
+negative_cache = NegativeCache()
+
+
+def send_cached_media(bot: Any, chat_id: int, key: str, **kwargs) -> bool:
+    """ارسال مجدد رسانه با file_id ذخیره شده، بدون دانلود و آپلود
+
+    Returns:
+        True اگر رسانه از کش ارسال شد، در غیر این صورت False
+    """
+    items = file_id_cache.get(key)
+    if not items:
+        return False
+
+    try:
+        if len(items) == 1:
+            item = items[0]
+            if item.media_type == MEDIA_AUDIO:
+                bot.send_audio(chat_id=chat_id, audio=item.file_id, **kwargs)
+            elif item.media_type == MEDIA_PHOTO:
+                bot.send_photo(chat_id=chat_id, photo=item.file_id)
+            else:
+                bot.send_video(chat_id=chat_id, video=item.file_id, supports_streaming=True)
+        else:
+            media_group = [
+                InputMediaPhoto(media=item.file_id) if item.media_type == MEDIA_PHOTO
+                else InputMediaVideo(media=item.file_id)
+                for item in items
+            ]
+            bot.send_media_group(chat_id=chat_id, media=media_group)
+        logger.info(f"رسانه {key} از کش file_id ارسال شد")
+        return True
+    except TelegramError as e:
+        # file_id دیگر معتبر نیست، رکورد را حذف می‌کنیم تا دوباره دانلود شود
+        logger.warning(f"ارسال از کش file_id برای {key} ناموفق بود: {e}")
+        file_id_cache.invalidate(key)
+        return False
+
+
+def remember_sent_media(key: str, messages: Any) -> None:
+    """ذخیره file_id پیام(های) ارسال شده در کش"""
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    items = [cached_media_from_message(message) for message in messages]
+    items = [item for item in items if item]
+    if len(items) != len(messages):
+        logger.warning(f"file_id برای همه پیام‌های {key} یافت نشد، در کش ذخیره نمی‌شود")
+        return
+    file_id_cache.put(key, items)
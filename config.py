@@ -30,3 +30,138 @@ if not os.path.exists(TEMP_DOWNLOAD_DIR):
         logger.error(f"خطا در ایجاد مسیر دانلود موقت: {e}")
 else:
     logger.info(f"مسیر دانلود موقت: {TEMP_DOWNLOAD_DIR}")
+
+# تنظیمات صف کارهای پس‌زمینه
+# تعداد کارگرهایی که کارهای دانلود را به صورت همزمان اجرا می‌کنند
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# حداکثر تعداد کارهای در انتظار در صف (بیشتر از این، درخواست رد می‌شود)
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+# حداکثر تعداد همزمان هر مرحله (دانلود، تبدیل با ffmpeg، آپلود به تلگرام)
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "3"))
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", "2"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "3"))
+# کارهای گروهی (چند لینک در یک پیام یا فایل متنی لینک‌ها)
+# حداکثر تعداد موارد یک کار گروهی که همزمان پردازش می‌شوند
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+# حداکثر تعداد لینک‌های پذیرفته شده در یک پیام یا فایل
+BATCH_MAX_LINKS = int(os.getenv("BATCH_MAX_LINKS", "20"))
+# حداکثر حجم فایل متنی لینک‌ها (بایت)
+BATCH_DOCUMENT_MAX_SIZE = int(os.getenv("BATCH_DOCUMENT_MAX_SIZE", str(256 * 1024)))  # 256 کیلوبایت
+# دانلود پلی‌لیست یوتیوب
+# حداکثر تعداد ویدیوهای یک پلی‌لیست که همزمان دانلود و ارسال می‌شوند
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "4"))
+# حداکثر تعداد ویدیوهای قابل انتخاب از یک پلی‌لیست
+PLAYLIST_MAX_ITEMS = int(os.getenv("PLAYLIST_MAX_ITEMS", "10"))
+
+# مسیر ذخیره داده‌های ماندگار (کش‌ها)
+CACHE_DIR = os.path.abspath(os.getenv("CACHE_DIR", "./cache"))
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# کش شناسه فایل‌های تلگرام (file_id) برای ارسال مجدد بدون دانلود و آپلود
+FILE_ID_CACHE_PATH = os.getenv("FILE_ID_CACHE_PATH", os.path.join(CACHE_DIR, "file_ids.sqlite3"))
+FILE_ID_CACHE_TTL = int(os.getenv("FILE_ID_CACHE_TTL", str(30 * 24 * 3600)))  # 30 روز
+
+# کش ماندگار فایل‌های خام دانلود شده روی دیسک (برای استفاده مجدد بدون دانلود)
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(CACHE_DIR, "media"))
+# حداکثر حجم کل فایل‌های کش (بایت)؛ با رسیدن به آن کم‌استفاده‌ترین فایل‌ها حذف می‌شوند (0 = غیرفعال)
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # 2 گیگابایت
+
+# کش نتایج منفی: پاسخ فوری به درخواست مجدد لینک‌های حذف شده، خصوصی، بیش از حد بزرگ یا مسدود
+NEGATIVE_CACHE_PATH = os.getenv("NEGATIVE_CACHE_PATH", os.path.join(CACHE_DIR, "negative.sqlite3"))
+# مدت اعتبار هر نوع خطا (ثانیه)
+NEGATIVE_CACHE_TTL_UNAVAILABLE = int(os.getenv("NEGATIVE_CACHE_TTL_UNAVAILABLE", str(6 * 3600)))  # 6 ساعت
+NEGATIVE_CACHE_TTL_PRIVATE = int(os.getenv("NEGATIVE_CACHE_TTL_PRIVATE", str(3600)))  # 1 ساعت
+NEGATIVE_CACHE_TTL_TOO_LARGE = int(os.getenv("NEGATIVE_CACHE_TTL_TOO_LARGE", str(7 * 24 * 3600)))  # 7 روز
+NEGATIVE_CACHE_TTL_REGION_BLOCKED = int(os.getenv("NEGATIVE_CACHE_TTL_REGION_BLOCKED", str(24 * 3600)))  # 1 روز
+
+# نشست درخواست‌های کاربران (لینک و گزینه‌های منوی هر درخواست)
+# نوع ذخیره‌ساز: memory یا sqlite (برای ماندگاری پس از راه‌اندازی مجدد و اشتراک بین چند پردازه)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+# مدت اعتبار هر نشست (ثانیه)
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(3600)))  # 1 ساعت
+# حداکثر تعداد نشست‌های نگهداری شده (قدیمی‌ترین‌ها حذف می‌شوند)
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+# مسیر پایگاه داده نشست‌ها در حالت sqlite
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+
+# کش اطلاعات استخراج شده ویدیوهای یوتیوب (لینک استریم‌ها بعد از چند ساعت منقضی می‌شوند)
+STREAM_INFO_CACHE_SIZE = int(os.getenv("STREAM_INFO_CACHE_SIZE", "256"))
+STREAM_INFO_CACHE_TTL = int(os.getenv("STREAM_INFO_CACHE_TTL", str(30 * 60)))  # 30 دقیقه
+
+# انتخاب تطبیقی روش‌های دانلود یوتیوب (yt-dlp، pytube، دانلود مستقیم)
+# تعداد آخرین تلاش‌هایی که آمار موفقیت و زمان هر روش بر اساس آنها محاسبه می‌شود
+BACKEND_STATS_WINDOW = int(os.getenv("BACKEND_STATS_WINDOW", "20"))
+# حداقل تعداد تلاش قبل از قضاوت درباره یک روش
+BACKEND_MIN_ATTEMPTS = int(os.getenv("BACKEND_MIN_ATTEMPTS", "5"))
+# نرخ خطایی که با رسیدن به آن روش موقتاً کنار گذاشته می‌شود (مدار باز می‌شود)
+BACKEND_FAILURE_THRESHOLD = float(os.getenv("BACKEND_FAILURE_THRESHOLD", "0.6"))
+# مدت زمان کنار گذاشتن روش خراب قبل از تلاش آزمایشی مجدد
+BACKEND_OPEN_SECONDS = int(os.getenv("BACKEND_OPEN_SECONDS", str(5 * 60)))  # 5 دقیقه
+# اجرای پوشش‌دار دانلود شورتز: اگر روش اول تا این مدت (ثانیه) شروع به دریافت نکند،
+# روش بعدی به صورت موازی شروع می‌شود و اولین نتیجه استفاده می‌شود (0 = غیرفعال)
+SHORTS_HEDGE_DELAY = float(os.getenv("SHORTS_HEDGE_DELAY", "0"))
+
+# دانلود حدسی: شروع دانلود پرانتخاب‌ترین کیفیت همزمان با نمایش منوی انتخاب کیفیت
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "false").lower() in ("1", "true", "yes")
+# حداکثر تعداد دانلودهای حدسی همزمان
+SPECULATIVE_MAX_ACTIVE = int(os.getenv("SPECULATIVE_MAX_ACTIVE", "2"))
+# حداکثر زمان هر دانلود حدسی (ثانیه)
+SPECULATIVE_TIMEOUT = int(os.getenv("SPECULATIVE_TIMEOUT", "180"))
+# حداقل تعداد انتخاب‌های ثبت شده قبل از شروع دانلود حدسی
+SPECULATIVE_MIN_CHOICES = int(os.getenv("SPECULATIVE_MIN_CHOICES", "5"))
+# مسیر ذخیره آمار کیفیت‌های انتخاب شده توسط کاربران
+QUALITY_HISTORY_PATH = os.getenv("QUALITY_HISTORY_PATH", os.path.join(CACHE_DIR, "quality_history.sqlite3"))
+
+# محدودیت زمانی هر درخواست کاربر (از ورود به صف تا پایان آپلود) به ثانیه
+REQUEST_DEADLINE = int(os.getenv("REQUEST_DEADLINE", str(10 * 60)))  # 10 دقیقه
+# حداکثر زمان انتظار برای هر درخواست شبکه (اتصال یا دریافت هر بسته)
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "30"))
+
+# مجموعه اتصال مشترک HTTP (اتصال‌های ماندگار بین درخواست‌ها)
+# حداکثر تعداد میزبان‌هایی که مجموعه اتصالشان نگهداری می‌شود
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "32"))
+# حداکثر اتصال‌های باز نگه داشته شده برای هر میزبان
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "10"))
+# تعداد تلاش مجدد برای خطاهای اتصال و خطاهای موقت سرور (5xx)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# ضریب تأخیر نمایی بین تلاش‌های مجدد (ثانیه)
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+# مدت اعتبار نتایج DNS در کش اتصال‌های مجموعه مشترک HTTP (ثانیه، 0 = غیرفعال)
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+# حداکثر تعداد نام‌های میزبان در کش DNS
+HTTP_DNS_CACHE_SIZE = int(os.getenv("HTTP_DNS_CACHE_SIZE", "256"))
+
+# دانلود چند اتصالی: تعداد بخش‌هایی که هر فایل به صورت همزمان (با درخواست Range) دریافت می‌شود
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+# فایل‌های کوچک‌تر از این حجم (بایت) با یک اتصال دریافت می‌شوند
+DOWNLOAD_SEGMENT_MIN_SIZE = int(os.getenv("DOWNLOAD_SEGMENT_MIN_SIZE", str(4 * 1024 * 1024)))  # 4 مگابایت
+# اندازه هر درخواست Range در yt-dlp برای فایل‌های تکه‌ای نشده (بایت، 0 = غیرفعال)
+DOWNLOAD_HTTP_CHUNK_SIZE = int(os.getenv("DOWNLOAD_HTTP_CHUNK_SIZE", str(10 * 1024 * 1024)))  # 10 مگابایت
+
+# ارسال جریانی: فرمت‌های پیش‌رونده (بدون نیاز به ترکیب) همزمان با دریافت به تلگرام آپلود می‌شوند
+# و روی دیسک نوشته نمی‌شوند
+STREAMING_UPLOAD = os.getenv("STREAMING_UPLOAD", "false").lower() in ("1", "true", "yes")
+# حداکثر حجم داده دریافت شده‌ای که در انتظار آپلود در حافظه می‌ماند (بایت)
+STREAMING_BUFFER_SIZE = int(os.getenv("STREAMING_BUFFER_SIZE", str(8 * 1024 * 1024)))  # 8 مگابایت
+
+# دریافت همزمان فایل‌های پست‌های چندتایی اینستاگرام
+# حداکثر تعداد فایل‌های یک پست که همزمان دریافت می‌شوند
+INSTAGRAM_FETCH_CONCURRENCY_PER_POST = int(os.getenv("INSTAGRAM_FETCH_CONCURRENCY_PER_POST", "4"))
+# حداکثر تعداد کل دریافت‌های همزمان از اینستاگرام (بین همه درخواست‌ها)
+INSTAGRAM_FETCH_CONCURRENCY = int(os.getenv("INSTAGRAM_FETCH_CONCURRENCY", "8"))
+# تعداد نمونه‌های مستقل instaloader (هر کدام با نشست و کوکی‌های خودش) برای دانلود همزمان
+INSTAGRAM_LOADER_POOL_SIZE = int(os.getenv("INSTAGRAM_LOADER_POOL_SIZE", str(JOB_WORKERS)))
+
+# نشست‌های اینستاگرام و بودجه درخواست هر نشست
+# نشست‌های ذخیره شده instaloader، جدا شده با کاما، به شکل username یا username:مسیر_فایل
+INSTAGRAM_SESSIONS = [item.strip() for item in os.getenv("INSTAGRAM_SESSIONS", "").split(",") if item.strip()]
+# استفاده از نشست ناشناس (بدون ورود) در کنار نشست‌های ذخیره شده
+INSTAGRAM_ANONYMOUS_SESSION = os.getenv("INSTAGRAM_ANONYMOUS_SESSION", "true").lower() in ("1", "true", "yes")
+# تعداد درخواست مجاز هر نشست در دقیقه (نرخ پر شدن سطل توکن)
+INSTAGRAM_RATE_PER_MINUTE = float(os.getenv("INSTAGRAM_RATE_PER_MINUTE", "30"))
+# حداکثر درخواست‌های پشت سر هم هر نشست (ظرفیت سطل توکن)
+INSTAGRAM_RATE_BURST = int(os.getenv("INSTAGRAM_RATE_BURST", "10"))
+# مدت کنار گذاشتن نشست پس از اولین پاسخ 429 (با هر تکرار دو برابر می‌شود)
+INSTAGRAM_BACKOFF_SECONDS = int(os.getenv("INSTAGRAM_BACKOFF_SECONDS", "60"))
+# حداکثر مدت کنار گذاشتن یک نشست
+INSTAGRAM_MAX_BACKOFF_SECONDS = int(os.getenv("INSTAGRAM_MAX_BACKOFF_SECONDS", str(15 * 60)))
@@ -0,0 +1,101 @@
+import time
+import logging
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from config import REQUEST_DEADLINE
+from downloader.errors import DownloadAbortedError
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceededError(DownloadAbortedError):
+    """زمان مجاز درخواست کاربر به پایان رسیده است"""
+    pass
+
+
+class Deadline:
+    """بودجه زمانی یک درخواست کاربر که در همه مراحل (دانلود، تبدیل، آپلود) رعایت می‌شود"""
+
+    def __init__(self, budget: float = REQUEST_DEADLINE):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """زمان باقیمانده به ثانیه"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, step: str = "") -> None:
+        """ایجاد خطا در صورت پایان زمان مجاز"""
+        if self.expired:
+            raise DeadlineExceededError(f"زمان مجاز درخواست ({self.budget} ثانیه) به پایان رسید {step}".strip())
+
+    def cancel(self) -> None:
+        """پایان فوری بودجه زمانی؛ مراحل بعدی کار با DeadlineExceededError متوقف می‌شوند"""
+        self.expires_at = time.monotonic()
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """محدودیت زمانی یک مرحله: زمان باقیمانده، حداکثر به اندازه cap"""
+        self.check()
+        remaining = self.remaining()
+        return min(remaining, cap) if cap else remaining
+
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar('deadline', default=None)
+
+
+# محدودیت پیش‌فرض هر نخ برای فراخوانی‌های بیرون از deadline_scope
+_fallback = threading.local()
+
+
+def current_deadline() -> Deadline:
+    """محدودیت زمانی درخواست جاری
+
+    کار هر درخواست داخل deadline_scope اجرا می‌شود (کارگرهای صف کارها، موارد کار گروهی و
+    دانلود حدسی) و نخ‌های فرعی با contextvars.copy_context().run همان محدودیت را به ارث می‌برند.
+    بیرون از deadline_scope (مثلاً کالبک‌هایی که مستقیماً در نخ dispatcher اجرا می‌شوند)، همه
+    فراخوانی‌های یک نخ یک محدودیت پیش‌فرض مشترک با بودجه REQUEST_DEADLINE می‌گیرند تا لغو یا
+    پایان آن بین مراحل حفظ شود؛ پس از پایان آن، فراخوانی بعدی محدودیت تازه‌ای می‌سازد تا نخ‌های
+    طولانی‌مدت برای همیشه متوقف نشوند.
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        return deadline
+    deadline = getattr(_fallback, 'deadline', None)
+    if deadline is None or deadline.expired:
+        deadline = Deadline()
+        _fallback.deadline = deadline
+        logger.warning(f"محدودیت زمانی بیرون از deadline_scope در نخ {threading.current_thread().name} "
+                       f"درخواست شد؛ از محدودیت پیش‌فرض {deadline.budget} ثانیه‌ای استفاده می‌شود")
+    return deadline
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """تعیین محدودیت زمانی درخواست برای همه فراخوانی‌های داخل این بلوک"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def run_subprocess(cmd: List[str], cap: Optional[float] = None, **kwargs) -> subprocess.CompletedProcess:
+    """اجرای subprocess.run با محدودیت زمانی برابر زمان باقیمانده درخواست
+
+    در صورت پایان زمان، پردازه فرزند متوقف و DeadlineExceededError ایجاد می‌شود.
+    """
+    deadline = current_deadline()
+    try:
+        return subprocess.run(cmd, timeout=deadline.timeout(cap), **kwargs)
+    except subprocess.TimeoutExpired as e:
+        logger.warning(f"اجرای {cmd[0]} پس از {e.timeout:.1f} ثانیه متوقف شد")
+        deadline.check(f"در اجرای {cmd[0]}")
+        raise
@@ -0,0 +1,103 @@
+import logging
+from typing import Any, Callable, Optional
+
+from telegram import Message
+from instaloader.exceptions import PrivateProfileNotFollowedException
+
+from messages import *
+from utils import get_file_size, format_size
+from jobs import job_manager, in_flight, Stage
+from cache import send_cached_media, remember_sent_media
+from deadline import DeadlineExceededError, current_deadline
+from downloader.errors import DownloadAbortedError, FileTooLargeError, InstagramRateLimitedError, ContentUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+def send_video_file(bot: Any, chat_id: int, path: str) -> Message:
+    """آپلود فایل ویدیو به تلگرام در مرحله آپلود مدیر کارها"""
+    logger.info(f"ارسال ویدیو با سایز {format_size(get_file_size(path))}")
+    with job_manager.stage(Stage.UPLOAD):
+        with open(path, 'rb') as video_file:
+            return bot.send_video(
+                chat_id=chat_id,
+                video=video_file,
+                supports_streaming=True,
+                timeout=current_deadline().timeout()
+            )
+
+
+def send_audio_file(bot: Any, chat_id: int, path: str, title: str) -> Message:
+    """آپلود فایل صوتی به تلگرام در مرحله آپلود مدیر کارها"""
+    logger.info(f"ارسال فایل صوتی با سایز {format_size(get_file_size(path))}")
+    with job_manager.stage(Stage.UPLOAD):
+        with open(path, 'rb') as audio:
+            return bot.send_audio(chat_id=chat_id, audio=audio, title=title, timeout=current_deadline().timeout())
+
+
+def send_coalesced(bot: Any, chat_id: int, cache_key: Optional[str], deliver: Callable[[], Any],
+                   **cached_kwargs) -> bool:
+    """ارسال رسانه از کش file_id یا با deliver، با یکی کردن درخواست‌های همزمان برای یک محتوا
+
+    deliver دانلود و ارسال را انجام می‌دهد و پیام(های) ارسال شده را برمی‌گرداند تا file_id آنها
+    برای درخواست‌های بعدی در کش ثبت شود. خطای deliver به فراخوان منتقل می‌شود.
+
+    Returns:
+        True اگر رسانه بدون دانلود از کش ارسال شد
+    """
+    if not cache_key:
+        deliver()
+        return False
+    while True:
+        with in_flight.coalesce(cache_key) as leader:
+            if send_cached_media(bot, chat_id, cache_key, **cached_kwargs):
+                logger.info(f"رسانه {cache_key} بدون دانلود از کش ارسال شد")
+                return True
+            # فقط مسئول کار دانلود می‌کند؛ درخواست منتظری که نتیجه را در کش نیافت دوباره صف می‌گیرد
+            if leader:
+                remember_sent_media(cache_key, deliver())
+                return False
+        logger.info(f"نتیجه دانلود {cache_key} در کش نیست، تلاش دوباره برای انجام آن")
+
+
+def media_error_message(error: Exception, too_large_message: str, default_message: str) -> str:
+    """پیام خطای مناسب برای کاربر بر اساس نوع خطای دانلود یا ارسال رسانه"""
+    if isinstance(error, ContentUnavailableError):
+        return CONTENT_UNAVAILABLE_MESSAGES[error.reason]
+    if isinstance(error, DeadlineExceededError):
+        return REQUEST_TIMEOUT_ERROR
+    if isinstance(error, FileTooLargeError):
+        return too_large_message
+    if isinstance(error, InstagramRateLimitedError):
+        return RATE_LIMIT_ERROR
+    if isinstance(error, PrivateProfileNotFollowedException):
+        return INSTAGRAM_PRIVATE_ACCOUNT
+    text = str(error).lower()
+    if "no connection" in text or "timeout" in text or "connection" in text:
+        return NETWORK_ERROR
+    if "rate limit" in text or "too many requests" in text:
+        return RATE_LIMIT_ERROR
+    return default_message
+
+
+def deliver_media_request(bot: Any, chat_id: int, url: str, cache_key: Optional[str], deliver: Callable[[], Any],
+                          edit_status: Callable[[str], Any], success_message: str, too_large_message: str,
+                          error_message: str, **cached_kwargs) -> bool:
+    """اجرای یک درخواست دانلود و ارسال رسانه و نمایش نتیجه یا خطای آن با edit_status
+
+    Returns:
+        True اگر رسانه (از کش یا با دانلود) ارسال شد
+    """
+    try:
+        send_coalesced(bot, chat_id, cache_key, deliver, **cached_kwargs)
+    except Exception as e:
+        if isinstance(e, (DownloadAbortedError, PrivateProfileNotFollowedException)):
+            logger.warning(f"درخواست {url} انجام نشد: {e}")
+        else:
+            logger.error(f"خطا در دانلود یا ارسال {url}: {e}")
+            logger.exception("جزئیات خطا:")
+        edit_status(media_error_message(e, too_large_message, error_message))
+        return False
+    logger.info(f"رسانه {url} با موفقیت به کاربر ارسال شد")
+    edit_status(success_message)
+    return True
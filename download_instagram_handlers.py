@@ -1,12 +1,18 @@
 import logging
-from typing import List
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InputMediaPhoto, InputMediaVideo
 from telegram.ext import CallbackContext
 
 from downloader.instagram import InstagramDownloader
-from utils import get_file_size, format_size, convert_video_to_audio, clean_temp_file
+from utils import extract_audio, clean_temp_file
 from messages import *
+from jobs import job_manager, Stage
+from cache import media_key, media_store, MEDIA_VIDEO, MEDIA_AUDIO
+from deadline import current_deadline
+from delivery import deliver_media_request, send_audio_file
+from sessions import session_store
 
 # دریافت نمونه logger
 logger = logging.getLogger(__name__)
@@ -14,160 +20,116 @@ logger = logging.getLogger(__name__)
 # ایجاد نمونه از کلاس دانلودر اینستاگرام
 instagram_downloader = InstagramDownloader()
 
-# دیکشنری برای نگهداری اطلاعات کاربران
-user_data = {}
-
-def download_instagram_video(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """دانلود ویدیوی اینستاگرام"""
-    query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(INSTAGRAM_DOWNLOAD_STARTED)
-    downloaded_files = []
-
-    try:
-        logger.info(f"شروع دانلود ویدیوی اینستاگرام با URL: {url}")
+def download_post_files(url: str, shortcode: Optional[str]) -> List[str]:
+    """فایل‌های پست اینستاگرام از کش فایل روی دیسک، یا در صورت نبود، با دانلود"""
+    source_key = media_key('instagram', shortcode, 'all', 'post') if shortcode else None
+    downloaded_files = media_store.checkout(source_key)
+    if downloaded_files:
+        return downloaded_files
+    with job_manager.stage(Stage.DOWNLOAD):
         downloaded_files = instagram_downloader.download_post(url)
-
+    media_store.store(source_key, downloaded_files)
+    return downloaded_files
+
+def send_post_files(bot: Any, chat_id: int, files: List[str]) -> Any:
+    """ارسال فایل‌های پست (یک فایل یا آلبوم حداکثر 10 تایی) و بازگشت پیام‌های ارسال شده"""
+    with job_manager.stage(Stage.UPLOAD), ExitStack() as opened:
+        if len(files) == 1:
+            media_file = opened.enter_context(open(files[0], 'rb'))
+            if files[0].endswith('.jpg'):
+                return bot.send_photo(chat_id=chat_id, photo=media_file, timeout=current_deadline().timeout())
+            return bot.send_video(chat_id=chat_id, video=media_file, timeout=current_deadline().timeout())
+
+        media_group = []
+        for file_path in files[:10]:  # حداکثر 10 فایل در یک آلبوم
+            media_file = opened.enter_context(open(file_path, 'rb'))
+            if file_path.endswith('.jpg'):
+                media_group.append(InputMediaPhoto(media=media_file))
+            else:
+                media_group.append(InputMediaVideo(media=media_file))
+        return bot.send_media_group(chat_id=chat_id, media=media_group, timeout=current_deadline().timeout())
+
+def send_instagram_post(bot: Any, chat_id: int, url: str, shortcode: Optional[str],
+                        on_upload: Optional[Callable[[], Any]] = None) -> Any:
+    """دانلود (یا برداشت از کش فایل) و ارسال همه فایل‌های پست، ریلز یا استوری"""
+    downloaded_files = download_post_files(url, shortcode)
+    try:
         if not downloaded_files:
-            logger.warning(f"هیچ فایلی از {url} دانلود نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-            
-        video_files = [f for f in downloaded_files if not f.endswith('.jpg')]
-        
-        if not video_files:
-            logger.warning(f"هیچ فایل ویدیویی در پست {url} یافت نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-
-        logger.info(f"تعداد {len(video_files)} ویدیو از اینستاگرام دانلود شد")
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال ویدیوها به کاربر
-        if len(video_files) == 1:
-            # اگر فقط یک ویدیو باشد
-            file_path = video_files[0]
-            file_size = get_file_size(file_path)
-            logger.info(f"ارسال ویدیو با سایز {format_size(file_size)}")
-
-            with open(file_path, 'rb') as video_file:
-                context.bot.send_video(
-                    chat_id=user_data[user_id]['chat_id'],
-                    video=video_file,
-                    supports_streaming=True
-                )
-        else:
-            # اگر چندین ویدیو باشد (آلبوم ویدیو)
-            from telegram import InputMediaVideo
-            media_group = []
-            for file_path in video_files[:10]:  # حداکثر 10 ویدیو در یک آلبوم
-                file_size = get_file_size(file_path)
-                logger.info(f"اضافه کردن ویدیو با سایز {format_size(file_size)} به آلبوم")
-
-                with open(file_path, 'rb') as video_file:
-                    media_group.append(InputMediaVideo(media=video_file))
-
-            if media_group:
-                logger.info(f"ارسال آلبوم با {len(media_group)} ویدیو")
-                context.bot.send_media_group(
-                    chat_id=user_data[user_id]['chat_id'],
-                    media=media_group
-                )
-
-        status_message.edit_text(INSTAGRAM_DOWNLOAD_SUCCESS)
-        logger.info("ویدیوهای اینستاگرام با موفقیت به کاربر ارسال شد")
-
-    except Exception as e:
-        if "No connection" in str(e) or "timeout" in str(e).lower() or "connection" in str(e).lower():
-            logger.error(f"خطای شبکه در دانلود ویدیوی اینستاگرام: {e}")
-            status_message.edit_text(NETWORK_ERROR)
-        elif "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-            logger.error(f"خطای محدودیت در دانلود ویدیوی اینستاگرام: {e}")
-            status_message.edit_text(RATE_LIMIT_ERROR)
-        else:
-            logger.error(f"خطا در دانلود ویدیوی اینستاگرام {url}: {e}")
-            logger.exception("جزئیات خطا:")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
+            raise IOError(f"هیچ فایلی از {url} دانلود نشد")
+        logger.info(f"تعداد {len(downloaded_files)} فایل از اینستاگرام دانلود شد")
+        if on_upload:
+            on_upload()
+        return send_post_files(bot, chat_id, downloaded_files)
     finally:
-        # پاک کردن فایل‌های موقت
         if downloaded_files:
-            logger.info(f"پاک کردن {len(downloaded_files)} فایل موقت")
             instagram_downloader.clean_up(downloaded_files)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
-            
-            
-def download_instagram_audio(update: Update, context: CallbackContext, url: str, user_id: int) -> None:
-    """دانلود و استخراج صدای ویدیوی اینستاگرام"""
-    query = update.callback_query
-    query.answer()
-
-    status_message = query.edit_message_text(AUDIO_EXTRACTION_STARTED)
-    downloaded_files = []
-    audio_file = ""
 
+def _post_videos(url: str, files: List[str]) -> List[str]:
+    """فایل‌های ویدیویی پست (خطا در صورت نبود ویدیو)"""
+    if not files:
+        raise IOError(f"هیچ فایلی از {url} دانلود نشد")
+    video_files = [f for f in files if not f.endswith('.jpg')]
+    if not video_files:
+        raise IOError(f"هیچ فایل ویدیویی در پست {url} یافت نشد")
+    logger.info(f"تعداد {len(video_files)} ویدیو از اینستاگرام دانلود شد")
+    return video_files
+
+def download_instagram_video(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
+    """دانلود ویدیوی اینستاگرام"""
+    status_message = update.callback_query.edit_message_text(INSTAGRAM_DOWNLOAD_STARTED)
+    url, shortcode = session['url'], session['media_id']
+    chat_id = update.effective_chat.id
+    cache_key = media_key('instagram', shortcode, 'all', MEDIA_VIDEO) if shortcode else None
+
+    def deliver() -> Any:
+        downloaded_files = download_post_files(url, shortcode)
+        try:
+            video_files = _post_videos(url, downloaded_files)
+            status_message.edit_text(UPLOAD_TO_TELEGRAM)
+            return send_post_files(context.bot, chat_id, video_files)
+        finally:
+            if downloaded_files:
+                instagram_downloader.clean_up(downloaded_files)
+
+    logger.info(f"شروع دانلود ویدیوی اینستاگرام با URL: {url}")
     try:
-        logger.info(f"شروع دانلود ویدیوی اینستاگرام برای استخراج صدا با URL: {url}")
-        # ابتدا ویدیو را دانلود می‌کنیم
-        downloaded_files = instagram_downloader.download_post(url)
-
-        if not downloaded_files:
-            logger.warning(f"هیچ فایلی از {url} دانلود نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-
-        # فقط فایل‌های ویدیویی را استخراج می‌کنیم
-        video_files = [f for f in downloaded_files if not f.endswith('.jpg')]
-        
-        if not video_files:
-            logger.warning(f"هیچ فایل ویدیویی در پست {url} یافت نشد.")
-            status_message.edit_text(INSTAGRAM_DOWNLOAD_ERROR)
-            return
-            
-        logger.info(f"تعداد {len(video_files)} ویدیو از اینستاگرام دانلود شد")
-        
-        # اگر چندین ویدیو باشد، فقط از اولین ویدیو صدا استخراج می‌کنیم
-        video_file = video_files[0]
-
-        # استخراج صدا از ویدیو
-        logger.info("در حال استخراج صدا از ویدیو...")
-        audio_file = convert_video_to_audio(video_file)
-
-        if not audio_file:
-            logger.error("خطا در استخراج صدا از ویدیو")
-            status_message.edit_text(AUDIO_EXTRACTION_ERROR)
-            return
-
-        file_size = get_file_size(audio_file)
-        logger.info(f"صدا با موفقیت استخراج شد. سایز: {format_size(file_size)}")
-
-        status_message.edit_text(UPLOAD_TO_TELEGRAM)
-
-        # ارسال فایل صوتی به کاربر
-        with open(audio_file, 'rb') as audio:
-            context.bot.send_audio(
-                chat_id=user_data[user_id]['chat_id'],
-                audio=audio,
-                title=f"Audio from Instagram"
-            )
-
-        status_message.edit_text(AUDIO_EXTRACTION_SUCCESS)
-        logger.info("فایل صوتی با موفقیت به کاربر ارسال شد")
+        deliver_media_request(context.bot, chat_id, url, cache_key, deliver, status_message.edit_text,
+                              INSTAGRAM_DOWNLOAD_SUCCESS, INSTAGRAM_FILE_TOO_LARGE, INSTAGRAM_DOWNLOAD_ERROR)
+    finally:
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
 
-    except Exception as e:
-        logger.error(f"خطا در استخراج صدا از ویدیوی اینستاگرام {url}: {e}")
-        logger.exception("جزئیات خطا:")
-        status_message.edit_text(AUDIO_EXTRACTION_ERROR)
+def download_instagram_audio(update: Update, context: CallbackContext, token: str, session: Dict[str, Any]) -> None:
+    """دانلود و استخراج صدای ویدیوی اینستاگرام"""
+    status_message = update.callback_query.edit_message_text(AUDIO_EXTRACTION_STARTED)
+    url, shortcode = session['url'], session['media_id']
+    chat_id = update.effective_chat.id
+    cache_key = media_key('instagram', shortcode, 'first', MEDIA_AUDIO) if shortcode else None
+
+    def deliver() -> Any:
+        downloaded_files = download_post_files(url, shortcode)
+        audio_file = ""
+        try:
+            # اگر چندین ویدیو باشد، فقط از اولین ویدیو صدا استخراج می‌کنیم
+            video_file = _post_videos(url, downloaded_files)[0]
+            logger.info("در حال استخراج صدا از ویدیو...")
+            with job_manager.stage(Stage.TRANSCODE):
+                audio_file = extract_audio(video_file)
+            if not audio_file:
+                raise IOError(f"استخراج صدا از ویدیوی {url} ناموفق بود")
+            status_message.edit_text(UPLOAD_TO_TELEGRAM)
+            return send_audio_file(context.bot, chat_id, audio_file, "Audio from Instagram")
+        finally:
+            if downloaded_files:
+                instagram_downloader.clean_up(downloaded_files)
+            if audio_file:
+                clean_temp_file(audio_file)
+
+    logger.info(f"شروع دانلود ویدیوی اینستاگرام برای استخراج صدا با URL: {url}")
+    try:
+        deliver_media_request(context.bot, chat_id, url, cache_key, deliver, status_message.edit_text,
+                              AUDIO_EXTRACTION_SUCCESS, INSTAGRAM_FILE_TOO_LARGE, AUDIO_EXTRACTION_ERROR,
+                              title="Audio from Instagram")
     finally:
-        # پاک کردن فایل‌های موقت
-        if downloaded_files:
-            logger.info(f"پاک کردن {len(downloaded_files)} فایل موقت")
-            instagram_downloader.clean_up(downloaded_files)
-        if audio_file:
-            logger.info(f"پاک کردن فایل موقت صوتی: {audio_file}")
-            clean_temp_file(audio_file)
-        # پاک کردن اطلاعات کاربر
-        if user_id in user_data:
-            del user_data[user_id]
\ No newline at end of file
+        # پاک کردن نشست درخواست
+        session_store.delete(token)
@@ -0,0 +1,365 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Type
+
+from config import (
+    BACKEND_STATS_WINDOW,
+    BACKEND_MIN_ATTEMPTS,
+    BACKEND_FAILURE_THRESHOLD,
+    BACKEND_OPEN_SECONDS,
+    JOB_WORKERS
+)
+from downloader.errors import DownloadAbortedError, DownloadCancelledError
+from deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+# نام روش‌های دانلود یوتیوب
+BACKEND_YTDLP = 'yt-dlp'
+BACKEND_PYTUBE = 'pytube'
+BACKEND_DIRECT = 'direct'
+
+
+class AttemptSignal:
+    """ارتباط بین اجرای موازی روش‌ها و هوک‌های پیشرفت دانلود
+
+    started: اولین بایت‌ها دریافت شده‌اند (نیازی به شروع روش پشتیبان نیست)
+    cancelled: روش دیگری زودتر نتیجه داده و این تلاش باید متوقف شود
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+    def mark_started(self) -> None:
+        self.started.set()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def check(self) -> None:
+        """ایجاد خطای لغو در صورت لغو شدن این تلاش"""
+        if self.cancelled.is_set():
+            raise DownloadCancelledError("دانلود به دلیل نتیجه گرفتن روش دیگر لغو شد")
+
+
+class CircuitState(Enum):
+    """وضعیت مدار هر روش دانلود"""
+    CLOSED = "closed"        # روش سالم است و استفاده می‌شود
+    OPEN = "open"            # روش پشت سر هم شکست خورده و موقتاً کنار گذاشته شده
+    HALF_OPEN = "half_open"  # زمان کنار گذاشتن تمام شده و یک تلاش آزمایشی مجاز است
+
+
+class BackendStats:
+    """آمار یک روش دانلود در پنجره لغزان آخرین تلاش‌ها به همراه مدار قطع‌کننده"""
+
+    def __init__(self, name: str, window: int, min_attempts: int, failure_threshold: float, open_seconds: float):
+        self.name = name
+        self.min_attempts = max(1, min_attempts)
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._samples: Deque[Tuple[bool, float]] = deque(maxlen=max(1, window))
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._total_attempts = 0
+        self._total_failures = 0
+
+    @property
+    def success_rate(self) -> float:
+        """نرخ موفقیت در پنجره فعلی (بدون نمونه، خوش‌بینانه 1 در نظر گرفته می‌شود)"""
+        if not self._samples:
+            return 1.0
+        return sum(1 for ok, _ in self._samples if ok) / len(self._samples)
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        """میانگین زمان تلاش‌های موفق در پنجره فعلی"""
+        latencies = [latency for ok, latency in self._samples if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def available(self) -> bool:
+        """آیا این روش در حال حاضر قابل استفاده است (بدون رزرو تلاش آزمایشی)"""
+        state = self.state
+        return state == CircuitState.CLOSED or (state == CircuitState.HALF_OPEN and not self._probing)
+
+    def acquire(self) -> bool:
+        """رزرو استفاده از روش درست قبل از اجرا؛ در حالت نیمه‌باز فقط یک تلاش آزمایشی در هر زمان"""
+        if not self.available():
+            return False
+        if self._state == CircuitState.HALF_OPEN:
+            self._probing = True
+        return True
+
+    def release_probe(self) -> None:
+        """آزاد کردن تلاش آزمایشی بدون ثبت نتیجه"""
+        self._probing = False
+
+    def record(self, ok: bool, latency: float) -> None:
+        """ثبت نتیجه یک تلاش و به‌روزرسانی وضعیت مدار"""
+        self._samples.append((ok, latency))
+        self._total_attempts += 1
+        if not ok:
+            self._total_failures += 1
+
+        if self._state != CircuitState.CLOSED:
+            # نتیجه تلاش آزمایشی وضعیت مدار را تعیین می‌کند
+            self._probing = False
+            if ok:
+                logger.info(f"روش {self.name} دوباره سالم است، مدار بسته شد")
+                self._state = CircuitState.CLOSED
+                # شکست‌های قبلی نباید بلافاصله مدار را دوباره باز کنند
+                self._samples.clear()
+                self._samples.append((ok, latency))
+            else:
+                self._open()
+            return
+
+        if (self._state == CircuitState.CLOSED and len(self._samples) >= self.min_attempts
+                and 1 - self.success_rate >= self.failure_threshold):
+            self._open()
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        logger.warning(f"روش {self.name} به دلیل خطاهای پی در پی برای {self.open_seconds} ثانیه کنار گذاشته شد "
+                       f"(نرخ موفقیت: {self.success_rate:.0%})")
+
+    def sort_key(self) -> Tuple[float, float]:
+        """کلید مرتب‌سازی: اول نرخ موفقیت بیشتر، سپس زمان کمتر
+
+        روش‌هایی که هنوز نمونه کافی ندارند از نظر موفقیت خوش‌بینانه و از نظر زمان
+        بدبینانه در نظر گرفته می‌شوند تا از روش‌های سالم و سریع جلو نزنند.
+        """
+        if len(self._samples) < self.min_attempts:
+            return (-1.0, float('inf'))
+        latency = self.mean_latency
+        return (-round(self.success_rate, 1), latency if latency is not None else float('inf'))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """آمار قابل نمایش این روش"""
+        latency = self.mean_latency
+        return {
+            'state': self.state.value,
+            'window': len(self._samples),
+            'success_rate': self.success_rate,
+            'mean_latency': round(latency, 2) if latency is not None else None,
+            'attempts': self._total_attempts,
+            'failures': self._total_failures,
+        }
+
+
+class BackendRegistry:
+    """انتخاب تطبیقی ترتیب روش‌های دانلود بر اساس سلامت و سرعت آنها"""
+
+    def __init__(self, window: int = BACKEND_STATS_WINDOW, min_attempts: int = BACKEND_MIN_ATTEMPTS,
+                 failure_threshold: float = BACKEND_FAILURE_THRESHOLD, open_seconds: float = BACKEND_OPEN_SECONDS):
+        self.window = window
+        self.min_attempts = min_attempts
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._backends: Dict[str, BackendStats] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get(self, name: str) -> BackendStats:
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = BackendStats(name, self.window, self.min_attempts, self.failure_threshold, self.open_seconds)
+            self._backends[name] = backend
+        return backend
+
+    def ordered(self, names: Sequence[str]) -> List[str]:
+        """روش‌های قابل استفاده به ترتیب اولویت (ترتیب پیش‌فرض در صورت برابری حفظ می‌شود)
+
+        اگر مدار همه روش‌ها باز باشد، روشی که بیشترین نرخ موفقیت را دارد به عنوان
+        تلاش آزمایشی برگردانده می‌شود تا درخواست بدون هیچ تلاشی رد نشود.
+        """
+        with self._lock:
+            ranked = sorted(names, key=lambda name: self._get(name).sort_key())
+            allowed = [name for name in ranked if self._get(name).available()]
+            if not allowed and ranked:
+                best = max(ranked, key=lambda name: self._get(name).success_rate)
+                logger.warning(f"مدار همه روش‌ها باز است، تلاش آزمایشی با {best}")
+                allowed = [best]
+        return allowed
+
+    def _available(self, name: str) -> bool:
+        with self._lock:
+            return self._get(name).available()
+
+    def _acquire(self, name: str, forced: bool) -> bool:
+        with self._lock:
+            return self._get(name).acquire() or forced
+
+    def record(self, name: str, ok: bool, latency: float) -> None:
+        """ثبت نتیجه یک تلاش"""
+        with self._lock:
+            self._get(name).record(ok, latency)
+
+    def run(self, operation: str, attempts: Sequence[Tuple[str, Callable[[], Any]]],
+            final_errors: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """اجرای زنجیره روش‌ها به ترتیب تطبیقی تا اولین نتیجه موفق
+
+        Args:
+            operation: نام عملیات برای لاگ (مثلاً دانلود ویدیو)
+            attempts: لیست (نام روش، تابع بدون ورودی) که در صورت موفقیت نتیجه غیرخالی برمی‌گرداند
+            final_errors: خطاهایی که به روش مربوط نیستند (مثل ویدیوی حذف شده) و زنجیره را متوقف می‌کنند
+
+        Returns:
+            اولین نتیجه غیرخالی، یا None اگر همه روش‌ها شکست بخورند
+        """
+        functions = dict(attempts)
+        names = self.ordered([name for name, _ in attempts])
+        # وقتی مدار همه روش‌ها باز است، روش برگزیده بدون رزرو اجرا می‌شود
+        forced = bool(names) and not self._available(names[0])
+        for name in names:
+            # پس از پایان زمان مجاز درخواست، روش بعدی امتحان نمی‌شود
+            current_deadline().check(operation)
+            if not self._acquire(name, forced):
+                # در فاصله مرتب‌سازی تا اجرا، درخواست دیگری تلاش آزمایشی را رزرو کرده است
+                continue
+            logger.info(f"{operation}: تلاش با روش {name}")
+            started = time.monotonic()
+            try:
+                result = functions[name]()
+            except (DownloadAbortedError,) + final_errors:
+                # خطا مربوط به محتوا است نه روش دانلود، پس در آمار روش ثبت نمی‌شود
+                with self._lock:
+                    self._get(name).release_probe()
+                raise
+            except Exception as e:
+                logger.warning(f"{operation}: خطا در روش {name}: {e}")
+                result = None
+            latency = time.monotonic() - started
+
+            self.record(name, bool(result), latency)
+            if result:
+                logger.info(f"{operation}: روش {name} در {latency:.2f} ثانیه موفق بود")
+                return result
+            logger.warning(f"{operation}: روش {name} پس از {latency:.2f} ثانیه ناموفق بود")
+
+        logger.error(f"{operation}: تمام روش‌ها شکست خورد")
+        return None
+
+    def _race_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # هر کار حداکثر چند تلاش همزمان دارد
+                self._executor = ThreadPoolExecutor(max_workers=JOB_WORKERS * 3, thread_name_prefix="backend-race")
+            return self._executor
+
+    def race(self, operation: str, attempts: Sequence[Tuple[str, Callable[[AttemptSignal], Any]]],
+             hedge_delay: float, discard: Callable[[Any], None],
+             final_errors: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """اجرای همزمان (پوشش‌دار) روش‌ها برای کاهش تأخیرهای طولانی
+
+        ابتدا بهترین روش اجرا می‌شود؛ اگر تا hedge_delay ثانیه نه نتیجه داده و نه
+        دریافت داده را شروع کرده باشد، روش بعدی هم به صورت موازی شروع می‌شود.
+        اولین نتیجه موفق برنده است، بقیه تلاش‌ها لغو و خروجی آنها با discard پاک می‌شود.
+
+        Args:
+            attempts: لیست (نام روش، تابعی که AttemptSignal می‌گیرد و نتیجه را برمی‌گرداند)
+            hedge_delay: تأخیر شروع روش پشتیبان به ثانیه
+            discard: تابع پاک کردن نتیجه تلاش‌های بازنده (مثلاً حذف فایل)
+        """
+        functions = dict(attempts)
+        queue = self.ordered([name for name, _ in attempts])
+        forced = bool(queue) and not self._available(queue[0])
+        executor = self._race_executor()
+        running: Dict[Future, Tuple[str, AttemptSignal, float]] = {}
+
+        def discard_late(future: Future) -> None:
+            # تلاش لغو شده ممکن است پیش از دیدن لغو، دانلود را تمام کرده باشد
+            if not future.cancelled() and future.exception() is None and future.result():
+                discard(future.result())
+
+        def launch() -> bool:
+            while queue:
+                current_deadline().check(operation)
+                name = queue.pop(0)
+                if not self._acquire(name, forced):
+                    continue
+                signal = AttemptSignal()
+                logger.info(f"{operation}: تلاش با روش {name}")
+                # محدودیت زمانی درخواست جاری به نخ اجرای روش منتقل می‌شود
+                context = contextvars.copy_context()
+                running[executor.submit(context.run, functions[name], signal)] = (name, signal, time.monotonic())
+                return True
+            return False
+
+        def cancel_running() -> None:
+            for future, (name, signal, _) in running.items():
+                logger.info(f"{operation}: لغو تلاش روش {name}")
+                signal.cancel()
+                with self._lock:
+                    self._get(name).release_probe()
+                future.add_done_callback(discard_late)
+            running.clear()
+
+        launch()
+        while running:
+            # پس از شروع دریافت داده، روش پشتیبان دیگر شروع نمی‌شود
+            hedging = queue and not any(signal.started.is_set() for _, signal, _ in running.values())
+            deadline = current_deadline()
+            timeout = min(hedge_delay, deadline.remaining()) if hedging else deadline.remaining()
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done and deadline.expired:
+                cancel_running()
+                deadline.check(operation)
+            if not done:
+                logger.info(f"{operation}: پس از {hedge_delay} ثانیه نتیجه‌ای نرسید، شروع روش پشتیبان")
+                launch()
+                continue
+
+            for future in done:
+                name, signal, started = running.pop(future)
+                latency = time.monotonic() - started
+                try:
+                    result = future.result()
+                except DownloadCancelledError:
+                    continue
+                except (DownloadAbortedError,) + final_errors:
+                    with self._lock:
+                        self._get(name).release_probe()
+                    cancel_running()
+                    raise
+                except Exception as e:
+                    logger.warning(f"{operation}: خطا در روش {name}: {e}")
+                    result = None
+
+                self.record(name, bool(result), latency)
+                if result:
+                    logger.info(f"{operation}: روش {name} در {latency:.2f} ثانیه برنده شد")
+                    # تلاش‌های دیگر (حتی اگر همزمان تمام شده باشند) لغو و پاک می‌شوند
+                    cancel_running()
+                    return result
+                logger.warning(f"{operation}: روش {name} پس از {latency:.2f} ثانیه ناموفق بود")
+
+            # در صورت شکست همه تلاش‌های جاری، بلافاصله روش بعدی شروع می‌شود
+            if not running:
+                launch()
+
+        logger.error(f"{operation}: تمام روش‌ها شکست خورد")
+        return None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """آمار همه روش‌ها"""
+        with self._lock:
+            return {name: backend.snapshot() for name, backend in self._backends.items()}
+
+
+# نمونه مشترک رجیستری روش‌های دانلود
+backend_registry = BackendRegistry()
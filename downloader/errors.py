@@ -0,0 +1,43 @@
+# خطاهای مشترک دانلودرها
+
+# دلایل در دسترس نبودن محتوا (کلاس‌های خطا در کش نتایج منفی)
+REASON_UNAVAILABLE = 'unavailable'
+REASON_PRIVATE = 'private'
+REASON_REGION_BLOCKED = 'region_blocked'
+REASON_TOO_LARGE = 'too_large'
+
+
+class DownloadAbortedError(Exception):
+    """دانلود عمداً در میانه کار متوقف شده و نباید با روش دیگری تکرار شود"""
+    pass
+
+
+class FileTooLargeError(DownloadAbortedError):
+    """حجم فایل از حداکثر حجم قابل ارسال در تلگرام بیشتر است"""
+
+    def __init__(self, received: int, limit: int):
+        super().__init__(f"حجم فایل ({received} بایت) بیشتر از حد مجاز ({limit} بایت) است")
+        self.received = received
+        self.limit = limit
+
+
+class DownloadCancelledError(DownloadAbortedError):
+    """دانلود لغو شده است (مثلاً روش دیگری زودتر نتیجه داده است)"""
+    pass
+
+
+class InstagramRateLimitedError(DownloadAbortedError):
+    """اینستاگرام درخواست‌ها را محدود کرده و هیچ نشست سالمی برای ادامه در دسترس نیست"""
+
+    def __init__(self, session_name: str):
+        super().__init__(f"محدودیت درخواست اینستاگرام برای نشست {session_name} (429 Too Many Requests)")
+        self.session_name = session_name
+
+
+class ContentUnavailableError(DownloadAbortedError):
+    """محتوا حذف شده، خصوصی یا در منطقه سرور مسدود است و تلاش با روش دیگر فایده‌ای ندارد"""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"محتوا در دسترس نیست ({reason}) {detail}".strip())
+        self.reason = reason
+        self.detail = detail
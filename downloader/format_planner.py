@@ -0,0 +1,149 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import MAX_TELEGRAM_FILE_SIZE
+from utils import format_size
+
+logger = logging.getLogger(__name__)
+
+# ضریب اطمینان برای حجم‌هایی که از روی بیت‌ریت تخمین زده می‌شوند
+BITRATE_ESTIMATE_MARGIN = 1.1
+
+# منبع تخمین حجم، به ترتیب دقت
+SIZE_EXACT = 'filesize'
+SIZE_APPROX = 'filesize_approx'
+SIZE_BITRATE = 'bitrate'
+
+
+def estimate_format_size(fmt: Dict, duration: Optional[float]) -> Tuple[Optional[int], Optional[str]]:
+    """تخمین حجم یک فرمت از روی filesize، filesize_approx یا بیت‌ریت × مدت زمان
+
+    Returns:
+        (حجم تخمینی به بایت، منبع تخمین) یا (None, None) اگر تخمین ممکن نباشد
+    """
+    if fmt.get('filesize'):
+        return int(fmt['filesize']), SIZE_EXACT
+    if fmt.get('filesize_approx'):
+        return int(fmt['filesize_approx']), SIZE_APPROX
+
+    # tbr بر حسب کیلوبیت بر ثانیه است
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration * BITRATE_ESTIMATE_MARGIN), SIZE_BITRATE
+    return None, None
+
+
+def _has_video(fmt: Dict) -> bool:
+    return fmt.get('vcodec') not in (None, 'none') and bool(fmt.get('height'))
+
+
+def _has_audio(fmt: Dict) -> bool:
+    return fmt.get('acodec') not in (None, 'none')
+
+
+@dataclass
+class FormatCandidate:
+    """یک گزینه دانلود: یک فرمت کامل یا ترکیب ویدیو و صدا"""
+    format_id: str
+    width: int
+    height: int
+    estimated_size: int
+    size_source: str
+    video_format_id: str
+    audio_format_id: Optional[str] = None
+
+    @property
+    def is_merged(self) -> bool:
+        """آیا ویدیو و صدا باید پس از دانلود ترکیب شوند"""
+        return self.audio_format_id is not None
+
+    @property
+    def label(self) -> str:
+        """عنوان قابل نمایش برای دکمه انتخاب کیفیت"""
+        prefix = '' if self.size_source == SIZE_EXACT else '~'
+        return f"{self.width}x{self.height} ({prefix}{format_size(self.estimated_size)})"
+
+
+@dataclass
+class FormatPlan:
+    """نتیجه برنامه‌ریزی فرمت؛ شامل همه گزینه‌ها و گزینه انتخاب شده زیر سقف حجم"""
+    video_id: Optional[str]
+    duration: Optional[float]
+    max_size: int
+    candidates: List[FormatCandidate] = field(default_factory=list)
+    chosen: Optional[FormatCandidate] = None
+
+    @property
+    def fitting(self) -> List[FormatCandidate]:
+        """گزینه‌هایی که حجم تخمینی آنها زیر سقف مجاز است"""
+        return [c for c in self.candidates if c.estimated_size <= self.max_size]
+
+    def find(self, format_id: str) -> Optional[FormatCandidate]:
+        """یافتن گزینه با شناسه فرمت"""
+        for candidate in self.candidates:
+            if candidate.format_id == str(format_id):
+                return candidate
+        return None
+
+    def describe(self) -> str:
+        """خلاصه متنی برنامه برای لاگ"""
+        if not self.chosen:
+            return f"هیچ فرمتی زیر {format_size(self.max_size)} برای {self.video_id} یافت نشد"
+        return (f"فرمت {self.chosen.format_id} ({self.chosen.label}, منبع تخمین: {self.chosen.size_source}) "
+                f"از بین {len(self.candidates)} گزینه برای {self.video_id} انتخاب شد")
+
+
+def plan_formats(info: Dict, max_size: int = MAX_TELEGRAM_FILE_SIZE) -> FormatPlan:
+    """ساخت برنامه دانلود: تخمین حجم همه گزینه‌ها و انتخاب بهترین کیفیت زیر سقف حجم"""
+    duration = info.get('duration')
+    formats = info.get('formats') or []
+    plan = FormatPlan(video_id=info.get('id'), duration=duration, max_size=max_size)
+
+    # صداهای m4a برای ترکیب با ویدیوهای mp4 (بهترین و کم‌حجم‌ترین)
+    audio_formats = []
+    for fmt in formats:
+        if _has_audio(fmt) and not _has_video(fmt) and fmt.get('ext') == 'm4a':
+            size, source = estimate_format_size(fmt, duration)
+            if size:
+                audio_formats.append((fmt, size, source))
+    audio_formats.sort(key=lambda item: item[0].get('abr') or item[0].get('tbr') or 0, reverse=True)
+    audio_choices = audio_formats[:1] + [item for item in audio_formats[-1:] if item is not audio_formats[0]]
+
+    for fmt in formats:
+        if fmt.get('ext') != 'mp4' or not _has_video(fmt):
+            continue
+        size, source = estimate_format_size(fmt, duration)
+        if not size:
+            continue
+
+        if _has_audio(fmt):
+            plan.candidates.append(FormatCandidate(
+                format_id=str(fmt['format_id']),
+                width=fmt.get('width') or 0,
+                height=fmt['height'],
+                estimated_size=size,
+                size_source=source,
+                video_format_id=str(fmt['format_id'])
+            ))
+            continue
+
+        for audio_fmt, audio_size, audio_source in audio_choices:
+            # دقت ترکیب برابر با منبع کم‌دقت‌تر است
+            combined_source = max(source, audio_source, key=[SIZE_EXACT, SIZE_APPROX, SIZE_BITRATE].index)
+            plan.candidates.append(FormatCandidate(
+                format_id=f"{fmt['format_id']}+{audio_fmt['format_id']}",
+                width=fmt.get('width') or 0,
+                height=fmt['height'],
+                estimated_size=size + audio_size,
+                size_source=combined_source,
+                video_format_id=str(fmt['format_id']),
+                audio_format_id=str(audio_fmt['format_id'])
+            ))
+
+    # بهترین کیفیت اول؛ در کیفیت برابر، گزینه با حجم بیشتر (بیت‌ریت بالاتر) اول
+    plan.candidates.sort(key=lambda c: (c.height, c.estimated_size), reverse=True)
+    fitting = plan.fitting
+    plan.chosen = fitting[0] if fitting else None
+    logger.info(plan.describe())
+    return plan
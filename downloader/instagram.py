@@ -1,21 +1,57 @@
 import os
-import re
 import time
 import logging
 import requests
 import tempfile
+import threading
+import contextlib
+import contextvars
 import instaloader
-from typing import List, Tuple, Dict, Any, Optional
-from instaloader.exceptions import ProfileNotExistsException, PrivateProfileNotFollowedException
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Optional, Iterator
+from instaloader.exceptions import (
+    ProfileNotExistsException,
+    PrivateProfileNotFollowedException,
+    QueryReturnedNotFoundException
+)
 
-from config import TEMP_DOWNLOAD_DIR
+from config import (
+    TEMP_DOWNLOAD_DIR,
+    HTTP_TIMEOUT,
+    INSTAGRAM_FETCH_CONCURRENCY,
+    INSTAGRAM_FETCH_CONCURRENCY_PER_POST,
+    INSTAGRAM_LOADER_POOL_SIZE
+)
 from utils import generate_temp_filename, clean_temp_file
+from deadline import current_deadline, DeadlineExceededError
+from http_pool import close_session, mount_pool, new_session
+from cache import negative_cache, content_key, media_key
+from links import media_id_for, PLATFORM_INSTAGRAM
+from downloader.errors import (
+    DownloadAbortedError,
+    InstagramRateLimitedError,
+    ContentUnavailableError,
+    REASON_UNAVAILABLE,
+    REASON_PRIVATE
+)
+from downloader.instagram_sessions import InstagramSession, SessionRateController, load_sessions
+from downloader.size_guard import SizeGuard
 
 logger = logging.getLogger(__name__)
 
-class InstagramDownloader:
-    def __init__(self):
-        """راه‌اندازی کلاس دانلودر اینستاگرام"""
+# محدودیت سراسری دریافت‌های همزمان از اینستاگرام (مشترک بین همه پست‌ها)
+_fetch_slots = threading.BoundedSemaphore(max(1, INSTAGRAM_FETCH_CONCURRENCY))
+
+class LoaderContext:
+    """یک نمونه مستقل instaloader به همراه نشست HTTP مخصوص خودش
+
+    هر زمینه به یک نشست اینستاگرام وابسته است و در هر لحظه فقط در اختیار یک دانلود
+    است، بنابراین تنظیمات و کوکی‌های آن بین دانلودهای همزمان مشترک نیست.
+    """
+
+    def __init__(self, index: int, session: InstagramSession):
+        self.index = index
+        self.session = session
         self.loader = instaloader.Instaloader(
             download_videos=True,
             download_video_thumbnails=False,
@@ -23,29 +59,200 @@ class InstagramDownloader:
             download_comments=False,
             save_metadata=False,
             compress_json=False,
-            filename_pattern='{profile}_{shortcode}'
+            filename_pattern='{profile}_{shortcode}',
+            # هر درخواست شبکه حداکثر به این مدت منتظر می‌ماند
+            request_timeout=HTTP_TIMEOUT,
+            # بودجه درخواست و مدیریت پاسخ 429 بر اساس نشست این زمینه
+            rate_controller=lambda loader_context: SessionRateController(loader_context, session)
         )
+        session.apply_to(self.loader)
+        # درخواست‌های instaloader هم از مجموعه اتصال مشترک استفاده می‌کنند (کوکی‌های نشست جدا می‌مانند)
+        mount_pool(self.loader.context._session)
+        # نشست HTTP برای دریافت مستقیم فایل‌ها روی همان مجموعه اتصال
+        self.http: requests.Session = new_session({'User-Agent': self.loader.context.user_agent})
+
+    def close(self) -> None:
+        """بستن نشست‌های HTTP این زمینه (نشست instaloader و نشست دریافت فایل‌ها)"""
+        close_session(self.loader.context._session)
+        close_session(self.http)
+
+
+class LoaderPool:
+    """مجموعه زمینه‌های instaloader که هر دانلود یکی از آن‌ها را قرض می‌گیرد
+
+    هر دانلود به کم‌بارترین نشست سالم فرستاده می‌شود. زمینه‌ها به صورت تنبل و حداکثر
+    به تعداد size ساخته می‌شوند؛ اگر همه در حال استفاده باشند یا همه نشست‌ها محدود
+    شده باشند، درخواست تا آزاد شدن یکی از آن‌ها (یا پایان مهلت درخواست) منتظر می‌ماند.
+    """
+
+    def __init__(self, size: int = INSTAGRAM_LOADER_POOL_SIZE, sessions: Optional[List[InstagramSession]] = None):
+        self.size = max(1, size)
+        self.sessions = sessions if sessions is not None else load_sessions()
+        self._idle: Dict[str, List[LoaderContext]] = {session.name: [] for session in self.sessions}
+        self._created = 0
+        self._changed = threading.Condition()
+
+    def _select(self) -> Tuple[Optional[InstagramSession], Optional[LoaderContext]]:
+        """انتخاب کم‌بارترین نشست سالم که زمینه آزاد دارد یا هنوز می‌توان برایش زمینه ساخت"""
+        candidates = sorted((session for session in self.sessions if session.healthy), key=InstagramSession.load)
+        for session in candidates:
+            if self._idle[session.name]:
+                return session, self._idle[session.name].pop()
+        if candidates and self._created < self.size:
+            return candidates[0], None
+        if candidates and self._evict_idle_backed_off():
+            return candidates[0], None
+        return None, None
+
+    def _evict_idle_backed_off(self) -> bool:
+        """کنار گذاشتن یک زمینه آزاد متعلق به نشست محدود شده تا ظرفیت آن به نشست سالم برسد"""
+        for session in self.sessions:
+            if not session.healthy and self._idle[session.name]:
+                context = self._idle[session.name].pop()
+                self._created -= 1
+                context.close()
+                logger.info(f"زمینه instaloader شماره {context.index} نشست محدود شده {session.name} کنار گذاشته شد")
+                return True
+        return False
+
+    def _wait_time(self) -> float:
+        """مدت انتظار تا آزاد شدن زمینه یا پایان محدودیت نزدیک‌ترین نشست"""
+        deadline = current_deadline()
+        if deadline.expired:
+            raise DeadlineExceededError("انتظار برای زمینه آزاد instaloader")
+        if any(session.healthy for session in self.sessions):
+            # پایان محدودیت هر نشست هم انتظار را به پایان می‌رساند (نه فقط آزاد شدن یک زمینه)
+            now = time.monotonic()
+            backoffs = [session.backoff_until - now for session in self.sessions if not session.healthy]
+            return min([deadline.remaining()] + [max(wait, 0.0) for wait in backoffs])
+        # همه نشست‌ها محدود شده‌اند؛ فقط اگر یکی از آن‌ها پیش از پایان مهلت آزاد شود صبر می‌کنیم
+        session = min(self.sessions, key=lambda item: item.backoff_until)
+        wait = session.backoff_until - time.monotonic()
+        if wait >= deadline.remaining():
+            raise InstagramRateLimitedError(session.name)
+        return max(wait, 0.0)
+
+    def _acquire(self) -> LoaderContext:
+        """گرفتن یک زمینه آزاد یا ساخت زمینه جدید برای کم‌بارترین نشست سالم"""
+        with self._changed:
+            while True:
+                session, context = self._select()
+                if session is not None:
+                    session.in_use += 1
+                    if context is None:
+                        self._created += 1
+                        index = self._created
+                    break
+                self._changed.wait(self._wait_time())
+        if context is not None:
+            return context
+        try:
+            logger.info(f"ایجاد زمینه instaloader شماره {index} برای نشست {session.name}")
+            return LoaderContext(index, session)
+        except Exception:
+            with self._changed:
+                self._created -= 1
+                session.in_use -= 1
+                self._changed.notify()
+            raise
+
+    def _release(self, context: LoaderContext) -> None:
+        with self._changed:
+            context.session.in_use -= 1
+            self._idle[context.session.name].append(context)
+            self._changed.notify()
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[LoaderContext]:
+        """قرض گرفتن یک زمینه برای مدت یک دانلود"""
+        context = self._acquire()
+        try:
+            yield context
+        finally:
+            self._release(context)
+
+
+class InstagramDownloader:
+    def __init__(self, pool_size: int = INSTAGRAM_LOADER_POOL_SIZE):
+        """راه‌اندازی کلاس دانلودر اینستاگرام"""
+        # هر دانلود یک زمینه مستقل instaloader را از این مجموعه قرض می‌گیرد
+        self.pool = LoaderPool(pool_size)
         # ایجاد مسیر ذخیره موقت
         if not os.path.exists(TEMP_DOWNLOAD_DIR):
             os.makedirs(TEMP_DOWNLOAD_DIR)
-    
+
     def _extract_shortcode_from_url(self, url: str) -> Optional[str]:
-        """استخراج کد کوتاه از لینک پست اینستاگرام"""
-        # الگوهای مختلف URL اینستاگرام
-        patterns = [
-            r'instagram.com/p/([^/?#&]+)',          # پست عادی
-            r'instagram.com/reel/([^/?#&]+)',       # ریلز
-            r'instagram.com/tv/([^/?#&]+)',         # IGTV
-            r'instagram.com/stories/[^/]+/([^/?#&]+)'  # استوری
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        
-        return None
+        """استخراج کد کوتاه از لینک پست، ریلز، IGTV یا استوری اینستاگرام با مسیریاب مشترک لینک‌ها"""
+        return media_id_for(url, PLATFORM_INSTAGRAM)
     
+    def get_shortcode(self, url: str) -> Optional[str]:
+        """کد کوتاه پست اینستاگرام برای استفاده به عنوان کلید کش"""
+        return self._extract_shortcode_from_url(url)
+
+    def _get_media_items(self, post: instaloader.Post) -> List[Tuple[str, str]]:
+        """لیست (لینک مستقیم، پسوند) همه فایل‌های پست به ترتیب نمایش"""
+        if post.typename == 'GraphSidecar':
+            items = []
+            for node in post.get_sidecar_nodes():
+                if node.is_video and node.video_url:
+                    items.append((node.video_url, '.mp4'))
+                else:
+                    items.append((node.display_url, '.jpg'))
+            return items
+        if post.is_video:
+            return [(post.video_url, '.mp4')]
+        return [(post.url, '.jpg')]
+
+    def _fetch_media(self, context: LoaderContext, media_url: str, extension: str) -> str:
+        """دریافت مستقیم یک فایل به مسیر دانلود موقت"""
+        target_path = generate_temp_filename(extension)
+        size_guard = SizeGuard()
+        with _fetch_slots:
+            try:
+                timeout = current_deadline().timeout(HTTP_TIMEOUT)
+                with context.http.get(media_url, stream=True, timeout=timeout) as response:
+                    if response.status_code == 429:
+                        context.session.mark_rate_limited()
+                        raise InstagramRateLimitedError(context.session.name)
+                    response.raise_for_status()
+                    received = 0
+                    with open(target_path, 'wb') as target_file:
+                        for chunk in response.iter_content(chunk_size=64 * 1024):
+                            target_file.write(chunk)
+                            received += len(chunk)
+                            size_guard.update(media_url, received)
+            except Exception:
+                clean_temp_file(target_path)
+                raise
+        return target_path
+
+    def _fetch_post_media(self, context: LoaderContext, post: instaloader.Post) -> List[str]:
+        """دریافت همزمان همه فایل‌های پست (از جمله پست‌های چندتایی) بدون instaloader"""
+        items = self._get_media_items(post)
+        workers = max(1, min(INSTAGRAM_FETCH_CONCURRENCY_PER_POST, len(items)))
+        logger.info(f"دریافت {len(items)} فایل از پست {post.shortcode} با {workers} اتصال همزمان")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="instagram-fetch") as executor:
+            # محدودیت زمانی درخواست جاری به نخ‌های دریافت منتقل می‌شود
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run, self._fetch_media, context, media_url, extension
+                )
+                for media_url, extension in items
+            ]
+
+        downloaded_files = []
+        fetch_error = None
+        for future in futures:
+            try:
+                downloaded_files.append(future.result())
+            except Exception as e:
+                fetch_error = fetch_error or e
+        if fetch_error:
+            self.clean_up(downloaded_files)
+            raise fetch_error
+        return downloaded_files
+
     def download_post(self, url: str) -> List[str]:
         """دانلود پست اینستاگرام (تصویر یا ویدیو)"""
         try:
@@ -56,76 +263,116 @@ class InstagramDownloader:
                 return []
             
             logger.info(f"کد کوتاه استخراج شده: {shortcode}")
+            current_deadline().check("قبل از دریافت اطلاعات پست")
             
-            try:
-                logger.info("در حال دریافت اطلاعات پست...")
-                post = instaloader.Post.from_shortcode(self.loader.context, shortcode)
-                logger.info(f"اطلاعات پست دریافت شد: {post.mediaid}")
-            except Exception as post_error:
-                logger.error(f"خطا در دریافت اطلاعات پست: {post_error}")
-                return []
-            
-            # مسیر فایل‌های دانلود شده
-            downloaded_files = []
-            
-            # ایجاد مسیر موقت برای دانلود
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                logger.info(f"مسیر موقت ایجاد شد: {tmpdirname}")
-                self.loader.dirname_pattern = tmpdirname
-                
-                try:
-                    logger.info("در حال دانلود پست...")
-                    self.loader.download_post(post, target=shortcode)
-                    logger.info("پست با موفقیت دانلود شد")
-                    
-                    # یافتن فایل‌های دانلود شده در مسیر موقت
-                    target_dir = os.path.join(tmpdirname, shortcode)
-                    logger.info(f"بررسی فایل‌های دانلود شده در: {target_dir}")
-                    
-                    if not os.path.exists(target_dir):
-                        logger.warning(f"مسیر هدف وجود ندارد: {target_dir}")
-                        # سعی می‌کنیم همه فایل‌ها در مسیر اصلی را بررسی کنیم
-                        target_dir = tmpdirname
-                    
-                    for root, _, files in os.walk(target_dir):
-                        logger.info(f"فایل‌های یافت شده: {files}")
-                        for file in files:
-                            # فقط فایل‌های عکس و ویدیو را انتخاب می‌کنیم
-                            if file.endswith(('.jpg', '.mp4')):
-                                source_path = os.path.join(root, file)
-                                logger.info(f"فایل یافت شد: {source_path}")
-                                
-                                # تعیین پسوند فایل
-                                file_ext = os.path.splitext(file)[1]
-                                target_path = generate_temp_filename(file_ext)
-                                
-                                # کپی فایل به مسیر هدف
-                                with open(source_path, 'rb') as src_file:
-                                    with open(target_path, 'wb') as dst_file:
-                                        dst_file.write(src_file.read())
-                                
-                                logger.info(f"فایل کپی شد به: {target_path}")
-                                downloaded_files.append(target_path)
-                    
-                    if not downloaded_files:
-                        logger.warning("هیچ فایلی دانلود نشد!")
-                
-                except PrivateProfileNotFollowedException as private_error:
-                    logger.error(f"پروفایل خصوصی است: {url}")
-                    raise PrivateProfileNotFollowedException("این پروفایل خصوصی است") from private_error
-                
-                except Exception as download_error:
-                    logger.error(f"خطا در دانلود پست اینستاگرام {url}: {download_error}")
-                    raise download_error
-            
-            logger.info(f"تعداد فایل‌های دانلود شده: {len(downloaded_files)}")
-            return downloaded_files
+            # پست‌های حذف شده یا خصوصی تا مدتی بدون تماس با اینستاگرام رد می‌شوند
+            with negative_cache.guard(content_key('instagram', shortcode), media_key('instagram', shortcode, 'all', 'post')):
+                # هر دانلود یک زمینه مستقل instaloader را در اختیار می‌گیرد؛ اگر نشست آن
+                # محدود شود، دانلود با نشست سالم دیگری تکرار می‌شود
+                for attempt in range(len(self.pool.sessions) + 1):
+                    with self.pool.lease() as context:
+                        try:
+                            downloaded_files = self._download_post_with_context(context, url, shortcode)
+                            # فقط دانلود واقعاً موفق شمارنده محدودیت نشست را صفر می‌کند
+                            if downloaded_files:
+                                context.session.mark_success()
+                            return downloaded_files
+                        except InstagramRateLimitedError:
+                            if attempt == len(self.pool.sessions):
+                                raise
+                            logger.warning(f"نشست {context.session.name} محدود شد، تلاش با نشست دیگر...")
         
+        except DownloadAbortedError:
+            raise
         except Exception as outer_error:
             logger.error(f"خطا در دانلود از اینستاگرام: {outer_error}")
             logger.exception("جزئیات خطا:")
             return []
     
+    def _download_post_with_context(self, context: LoaderContext, url: str, shortcode: str) -> List[str]:
+        """دانلود پست با زمینه instaloader قرض گرفته شده"""
+        try:
+            logger.info("در حال دریافت اطلاعات پست...")
+            post = instaloader.Post.from_shortcode(context.loader.context, shortcode)
+            logger.info(f"اطلاعات پست دریافت شد: {post.mediaid}")
+        except DownloadAbortedError:
+            raise
+        except PrivateProfileNotFollowedException as private_error:
+            raise ContentUnavailableError(REASON_PRIVATE, str(private_error)) from private_error
+        except (QueryReturnedNotFoundException, ProfileNotExistsException) as missing_error:
+            raise ContentUnavailableError(REASON_UNAVAILABLE, str(missing_error)) from missing_error
+        except Exception as post_error:
+            logger.error(f"خطا در دریافت اطلاعات پست: {post_error}")
+            return []
+
+        # روش اصلی: دریافت همزمان فایل‌ها مستقیماً در مسیر دانلود موقت
+        try:
+            downloaded_files = self._fetch_post_media(context, post)
+            logger.info(f"تعداد فایل‌های دانلود شده: {len(downloaded_files)}")
+            return downloaded_files
+        except DownloadAbortedError:
+            raise
+        except Exception as fetch_error:
+            logger.warning(f"خطا در دریافت مستقیم فایل‌های پست: {fetch_error}، تلاش با instaloader...")
+        
+        # مسیر فایل‌های دانلود شده
+        downloaded_files = []
+        
+        # ایجاد مسیر موقت برای دانلود داخل مسیر دانلود موقت، تا انتقال فایل‌ها
+        # فقط تغییر نام در همان فایل‌سیستم باشد و نیازی به کپی نباشد
+        with tempfile.TemporaryDirectory(dir=TEMP_DOWNLOAD_DIR) as tmpdirname:
+            logger.info(f"مسیر موقت ایجاد شد: {tmpdirname}")
+            # این زمینه فقط در اختیار همین دانلود است، پس تغییر مسیر آن امن است
+            context.loader.dirname_pattern = tmpdirname
+            
+            try:
+                current_deadline().check("قبل از دانلود پست")
+                logger.info("در حال دانلود پست...")
+                context.loader.download_post(post, target=shortcode)
+                logger.info("پست با موفقیت دانلود شد")
+                
+                # یافتن فایل‌های دانلود شده در مسیر موقت
+                target_dir = os.path.join(tmpdirname, shortcode)
+                logger.info(f"بررسی فایل‌های دانلود شده در: {target_dir}")
+                
+                if not os.path.exists(target_dir):
+                    logger.warning(f"مسیر هدف وجود ندارد: {target_dir}")
+                    # سعی می‌کنیم همه فایل‌ها در مسیر اصلی را بررسی کنیم
+                    target_dir = tmpdirname
+                
+                for root, _, files in os.walk(target_dir):
+                    logger.info(f"فایل‌های یافت شده: {files}")
+                    # ترتیب نام فایل‌ها همان ترتیب آیتم‌های پست چندتایی است
+                    for file in sorted(files):
+                        # فقط فایل‌های عکس و ویدیو را انتخاب می‌کنیم
+                        if file.endswith(('.jpg', '.mp4')):
+                            source_path = os.path.join(root, file)
+                            logger.info(f"فایل یافت شد: {source_path}")
+                            
+                            # تعیین پسوند فایل
+                            file_ext = os.path.splitext(file)[1]
+                            target_path = generate_temp_filename(file_ext)
+                            
+                            # انتقال فایل به مسیر هدف بدون خواندن محتوا در حافظه
+                            os.replace(source_path, target_path)
+                            
+                            logger.info(f"فایل منتقل شد به: {target_path}")
+                            downloaded_files.append(target_path)
+                
+                if not downloaded_files:
+                    logger.warning("هیچ فایلی دانلود نشد!")
+            
+            except PrivateProfileNotFollowedException as private_error:
+                logger.error(f"پروفایل خصوصی است: {url}")
+                raise ContentUnavailableError(REASON_PRIVATE, "این پروفایل خصوصی است") from private_error
+            
+            except Exception as download_error:
+                logger.error(f"خطا در دانلود پست اینستاگرام {url}: {download_error}")
+                raise download_error
+        
+        logger.info(f"تعداد فایل‌های دانلود شده: {len(downloaded_files)}")
+        return downloaded_files
+
     def download_reel(self, url: str) -> str:
         """دانلود ریلز اینستاگرام"""
         return self.download_post(url)[0] if self.download_post(url) else ""
@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+import instaloader
+from typing import List, Optional
+
+from config import (
+    INSTAGRAM_SESSIONS,
+    INSTAGRAM_ANONYMOUS_SESSION,
+    INSTAGRAM_RATE_PER_MINUTE,
+    INSTAGRAM_RATE_BURST,
+    INSTAGRAM_BACKOFF_SECONDS,
+    INSTAGRAM_MAX_BACKOFF_SECONDS
+)
+from deadline import current_deadline, DeadlineExceededError
+from downloader.errors import InstagramRateLimitedError
+
+logger = logging.getLogger(__name__)
+
+# نام نشست بدون ورود به حساب
+ANONYMOUS_SESSION = "anonymous"
+
+
+class TokenBucket:
+    """سطل توکن برای محدود کردن نرخ درخواست‌ها (امن برای استفاده در چند نخ)"""
+
+    def __init__(self, rate_per_minute: float = INSTAGRAM_RATE_PER_MINUTE, burst: int = INSTAGRAM_RATE_BURST):
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def available(self) -> float:
+        """تعداد توکن‌های موجود"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def acquire(self) -> None:
+        """برداشتن یک توکن؛ در صورت خالی بودن سطل تا پر شدن آن (حداکثر تا پایان مهلت درخواست) صبر می‌کند"""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            deadline = current_deadline()
+            if wait >= deadline.remaining():
+                raise DeadlineExceededError("انتظار برای بودجه درخواست اینستاگرام")
+            time.sleep(wait)
+
+
+class InstagramSession:
+    """یک هویت اینستاگرام (حساب ذخیره شده یا ناشناس) با بودجه درخواست و وضعیت محدودیت خودش
+
+    همه زمینه‌های instaloader که از این هویت استفاده می‌کنند یک سطل توکن مشترک دارند.
+    """
+
+    def __init__(self, name: str, username: Optional[str] = None, session_file: Optional[str] = None):
+        self.name = name
+        self.username = username
+        self.session_file = session_file
+        self.bucket = TokenBucket()
+        # تعداد دانلودهایی که در حال حاضر از این نشست استفاده می‌کنند
+        self.in_use = 0
+        self.backoff_until = 0.0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        """آیا نشست در حال حاضر به دلیل محدودیت کنار گذاشته نشده است"""
+        return time.monotonic() >= self.backoff_until
+
+    def load(self) -> tuple:
+        """کلید مقایسه بار نشست: ابتدا تعداد کاربران فعلی، سپس توکن‌های کمتر"""
+        return (self.in_use, -self.bucket.available())
+
+    def mark_rate_limited(self) -> None:
+        """کنار گذاشتن نشست پس از دریافت پاسخ 429 با افزایش نمایی مدت انتظار"""
+        with self._lock:
+            self.rate_limited_count += 1
+            backoff = min(INSTAGRAM_BACKOFF_SECONDS * 2 ** (self.rate_limited_count - 1), INSTAGRAM_MAX_BACKOFF_SECONDS)
+            self.backoff_until = time.monotonic() + backoff
+        logger.warning(f"نشست اینستاگرام {self.name} محدود شد، کنار گذاشته شده به مدت {backoff} ثانیه")
+
+    def mark_success(self) -> None:
+        """بازگشت شمارنده محدودیت پس از یک دانلود موفق"""
+        with self._lock:
+            self.rate_limited_count = 0
+
+    def apply_to(self, loader: instaloader.Instaloader) -> None:
+        """بارگذاری کوکی‌های نشست ذخیره شده در یک نمونه instaloader"""
+        if self.username:
+            loader.load_session_from_file(self.username, self.session_file)
+
+
+class SessionRateController(instaloader.RateController):
+    """کنترل نرخ instaloader که بودجه مشترک نشست را رعایت می‌کند
+
+    به جای خوابیدن طولانی پس از پاسخ 429، نشست را کنار می‌گذارد و خطا ایجاد می‌کند
+    تا دانلود با نشست سالم دیگری ادامه یابد.
+    """
+
+    def __init__(self, context: instaloader.InstaloaderContext, session: InstagramSession):
+        super().__init__(context)
+        self.session = session
+
+    def sleep(self, secs: float) -> None:
+        if secs >= current_deadline().remaining():
+            raise DeadlineExceededError("انتظار برای محدودیت درخواست instaloader")
+        time.sleep(secs)
+
+    def wait_before_query(self, query_type: str) -> None:
+        self.session.bucket.acquire()
+        super().wait_before_query(query_type)
+
+    def handle_429(self, query_type: str) -> None:
+        self.session.mark_rate_limited()
+        raise InstagramRateLimitedError(self.session.name)
+
+
+def load_sessions() -> List[InstagramSession]:
+    """ساخت لیست نشست‌ها از تنظیمات (نشست‌های ذخیره شده و در صورت فعال بودن، نشست ناشناس)"""
+    sessions = []
+    for item in INSTAGRAM_SESSIONS:
+        username, _, session_file = item.partition(":")
+        sessions.append(InstagramSession(username, username, session_file or None))
+    if INSTAGRAM_ANONYMOUS_SESSION or not sessions:
+        sessions.append(InstagramSession(ANONYMOUS_SESSION))
+    logger.info(f"نشست‌های اینستاگرام: {[session.name for session in sessions]}")
+    return sessions
@@ -0,0 +1,141 @@
+import os
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from config import DOWNLOAD_SEGMENTS, DOWNLOAD_SEGMENT_MIN_SIZE, HTTP_TIMEOUT
+from utils import format_size
+from deadline import current_deadline
+from http_pool import http
+from downloader.errors import DownloadAbortedError
+from downloader.size_guard import SizeGuard
+
+logger = logging.getLogger(__name__)
+
+# اندازه هر بسته خوانده شده از پاسخ HTTP
+CHUNK_SIZE = 64 * 1024
+# تعداد تلاش مجدد هر بخش پس از قطع اتصال (ادامه از آخرین بایت دریافت شده)
+SEGMENT_RETRIES = 2
+
+
+def _probe(url: str, headers: Dict[str, str]) -> Tuple[int, bool]:
+    """دریافت حجم فایل و پشتیبانی سرور از درخواست Range با درخواست اولین بایت"""
+    with http.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True,
+                  timeout=current_deadline().timeout(HTTP_TIMEOUT)) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            # Content-Range: bytes 0-0/12345
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit():
+                return int(total), True
+        return int(response.headers.get('Content-Length') or 0), False
+
+
+def _split(total: int, segments: int) -> List[Tuple[int, int]]:
+    """تقسیم فایل به بازه‌های پیوسته (ابتدا و انتهای شامل) با حجم تقریباً برابر"""
+    size = -(-total // segments)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _fetch_segment(url: str, output_file: str, index: int, start: int, end: int, headers: Dict[str, str],
+                   size_guard: SizeGuard, failed: threading.Event) -> int:
+    """دریافت یک بازه از فایل و نوشتن آن در جای خودش؛ بازگشت تعداد بایت‌های نوشته شده"""
+    position = start
+    attempts = 0
+    while position <= end:
+        try:
+            with http.get(url, headers={**headers, 'Range': f'bytes={position}-{end}'}, stream=True,
+                          timeout=current_deadline().timeout(HTTP_TIMEOUT)) as response:
+                if response.status_code != 206:
+                    raise IOError(f"پاسخ نامعتبر سرور برای بخش {index}: {response.status_code}")
+                with open(output_file, 'r+b') as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        # بخش دیگری شکست خورده و ادامه این بخش فایده‌ای ندارد
+                        if failed.is_set():
+                            return position - start
+                        chunk = chunk[:end + 1 - position]
+                        f.write(chunk)
+                        position += len(chunk)
+                        size_guard.update((url, index), position - start)
+                        if position > end:
+                            break
+            if position <= end:
+                raise IOError(f"اتصال بخش {index} پیش از پایان بازه بسته شد")
+        except DownloadAbortedError:
+            failed.set()
+            raise
+        except Exception as e:
+            attempts += 1
+            if attempts > SEGMENT_RETRIES or failed.is_set():
+                failed.set()
+                raise
+            logger.warning(f"خطا در دریافت بخش {index}، ادامه از بایت {position}: {e}")
+    return position - start
+
+
+def _download_single(url: str, output_file: str, headers: Dict[str, str], size_guard: SizeGuard, total: int) -> None:
+    """دریافت فایل با یک اتصال (برای سرورهای بدون پشتیبانی Range یا فایل‌های کوچک)"""
+    received = 0
+    with http.get(url, headers=headers, stream=True, timeout=current_deadline().timeout(HTTP_TIMEOUT)) as response:
+        response.raise_for_status()
+        with open(output_file, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                received += len(chunk)
+                size_guard.update(url, received)
+    if total and received != total:
+        raise IOError(f"دانلود ناقص: {received} از {total} بایت دریافت شد")
+
+
+def download_segmented(url: str, output_file: str, size_guard: SizeGuard, headers: Optional[Dict[str, str]] = None,
+                       segments: int = DOWNLOAD_SEGMENTS) -> str:
+    """دانلود فایل با چند اتصال همزمان (هر اتصال یک بازه Range) در صورت پشتیبانی سرور
+
+    هر بخش مستقیماً در جای خودش در فایل نوشته می‌شود و پس از قطع اتصال از آخرین
+    بایت دریافت شده ادامه می‌یابد. در پایان، حجم دریافت شده با حجم اعلام شده مقایسه می‌شود.
+
+    Args:
+        url: آدرس فایل
+        output_file: مسیر فایل خروجی
+        size_guard: پایش حجم و لغو (حجم همه بخش‌ها با هم جمع می‌شود)
+        headers: هدرهای درخواست
+        segments: حداکثر تعداد اتصال‌های همزمان
+
+    Returns:
+        str: مسیر فایل خروجی
+    """
+    headers = headers or {}
+    total, ranged = _probe(url, headers)
+    if total:
+        size_guard.expect(total)
+
+    if not ranged or segments <= 1 or total < DOWNLOAD_SEGMENT_MIN_SIZE:
+        _download_single(url, output_file, headers, size_guard, total)
+        return output_file
+
+    ranges = _split(total, segments)
+    logger.info(f"دانلود {format_size(total)} با {len(ranges)} اتصال همزمان")
+    # فضای کامل فایل از قبل رزرو می‌شود تا هر بخش در جای خودش نوشته شود
+    with open(output_file, 'wb') as f:
+        f.truncate(total)
+
+    failed = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="segment") as executor:
+        # هر بخش در زمینه (و مهلت) درخواست فعلی اجرا می‌شود
+        futures = [
+            executor.submit(contextvars.copy_context().run, _fetch_segment,
+                            url, output_file, index, start, end, headers, size_guard, failed)
+            for index, (start, end) in enumerate(ranges)
+        ]
+        try:
+            received = sum(future.result() for future in futures)
+        except BaseException:
+            failed.set()
+            raise
+
+    if received != total or os.path.getsize(output_file) != total:
+        raise IOError(f"دانلود ناقص: {received} از {total} بایت دریافت شد")
+    return output_file
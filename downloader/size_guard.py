@@ -0,0 +1,74 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from config import MAX_TELEGRAM_FILE_SIZE
+from utils import format_size
+from downloader.errors import FileTooLargeError
+from downloader.backends import AttemptSignal
+from deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class SizeGuard:
+    """پایش حجم دریافت شده در حین دانلود و توقف فوری در صورت عبور از سقف مجاز
+
+    برای فرمت‌های ترکیبی (ویدیو + صدا) حجم همه بخش‌ها با هم جمع می‌شود.
+    در صورت وجود signal، شروع دریافت داده اعلام و لغو دانلود در اولین بسته بعدی اعمال می‌شود.
+    """
+
+    def __init__(self, limit: int = MAX_TELEGRAM_FILE_SIZE, signal: Optional[AttemptSignal] = None):
+        self.limit = limit
+        self.signal = signal
+        self.exceeded = False
+        self._parts: Dict[Any, int] = {}
+        # دانلود چند اتصالی حجم بخش‌ها را از چند نخ به‌روز می‌کند
+        self._lock = threading.Lock()
+
+    @property
+    def received(self) -> int:
+        """مجموع بایت‌های دریافت شده از همه بخش‌ها"""
+        with self._lock:
+            return sum(self._parts.values())
+
+    def update(self, part: Any, received_bytes: int) -> None:
+        """ثبت حجم دریافت شده یک بخش و توقف دانلود در صورت عبور از سقف، لغو یا پایان زمان مجاز"""
+        current_deadline().check()
+        if self.signal:
+            self.signal.check()
+            self.signal.mark_started()
+        with self._lock:
+            self._parts[part] = received_bytes
+        if self.received > self.limit:
+            if not self.exceeded:
+                logger.warning(f"دانلود پس از دریافت {format_size(self.received)} متوقف شد (حد مجاز: {format_size(self.limit)})")
+            self.exceeded = True
+            raise FileTooLargeError(self.received, self.limit)
+
+    def expect(self, total_bytes: int) -> None:
+        """توقف پیش از شروع دریافت اگر حجم اعلام شده توسط سرور از سقف بیشتر باشد"""
+        if total_bytes > self.limit:
+            logger.warning(f"حجم اعلام شده فایل ({format_size(total_bytes)}) بیشتر از حد مجاز ({format_size(self.limit)}) است")
+            self.exceeded = True
+            raise FileTooLargeError(total_bytes, self.limit)
+
+    def raise_if_exceeded(self) -> None:
+        """اگر دانلود به دلیل حجم یا لغو متوقف شده، خطای نوع‌دار را دوباره ایجاد می‌کند
+
+        برای زمانی که کتابخانه (مثلاً yt-dlp) خطای هوک را در خطای دیگری پیچیده است.
+        """
+        if self.signal:
+            self.signal.check()
+        if self.exceeded:
+            raise FileTooLargeError(self.received, self.limit)
+
+    def ytdlp_hook(self, status: Dict) -> None:
+        """هوک progress_hooks برای yt-dlp"""
+        if status.get('status') == 'downloading':
+            part = status.get('filename') or status.get('tmpfilename')
+            self.update(part, status.get('downloaded_bytes') or 0)
+
+    def pytube_hook(self, stream: Any, chunk: bytes, bytes_remaining: int) -> None:
+        """هوک on_progress_callback برای pytube"""
+        self.update(stream.itag, stream.filesize - bytes_remaining)
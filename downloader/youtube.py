@@ -1,200 +1,415 @@
 import os
-import re
+import glob
+import copy
 import json
 import logging
 import tempfile
-import requests
 from typing import Dict, List, Optional, Tuple
-from urllib.parse import parse_qs, urlparse
 
 from pytube import YouTube
-from pytube.exceptions import RegexMatchError, VideoUnavailable
+from pytube.exceptions import RegexMatchError, VideoUnavailable, VideoPrivate, VideoRegionBlocked
 
-from config import MAX_TELEGRAM_FILE_SIZE
-from utils import generate_temp_filename, clean_temp_file, format_size
+from config import (
+    MAX_TELEGRAM_FILE_SIZE,
+    STREAM_INFO_CACHE_SIZE,
+    STREAM_INFO_CACHE_TTL,
+    SHORTS_HEDGE_DELAY,
+    HTTP_TIMEOUT,
+    DOWNLOAD_SEGMENTS,
+    DOWNLOAD_HTTP_CHUNK_SIZE
+)
+from utils import generate_temp_filename, clean_temp_file, format_size, TELEGRAM_AUDIO_EXTENSIONS
+from cache import TTLCache, negative_cache, content_key, media_key, MEDIA_VIDEO, MEDIA_AUDIO
+from deadline import current_deadline, run_subprocess
+from http_pool import http
+from links import classify_url, media_id_for, PLATFORM_YOUTUBE
+from downloader.format_planner import FormatPlan, plan_formats
+from downloader.errors import (
+    DownloadAbortedError,
+    FileTooLargeError,
+    ContentUnavailableError,
+    REASON_UNAVAILABLE,
+    REASON_PRIVATE,
+    REASON_REGION_BLOCKED
+)
+from downloader.size_guard import SizeGuard
+from downloader.segmented import download_segmented
+from downloader.backends import backend_registry, AttemptSignal, BACKEND_YTDLP, BACKEND_PYTUBE, BACKEND_DIRECT
 
 logger = logging.getLogger(__name__)
 
+# بخش‌هایی از پیام خطای yt-dlp که نشان‌دهنده در دسترس نبودن قطعی ویدیو هستند
+_UNAVAILABLE_MESSAGES = (
+    (REASON_PRIVATE, ('private video',)),
+    (REASON_REGION_BLOCKED, ('in your country', 'geo restrict', 'geo-restrict')),
+    (REASON_UNAVAILABLE, ('video unavailable', 'has been removed', 'account associated with this video has been terminated',
+                          'this video does not exist')),
+)
+
+# دانلود چند اتصالی در yt-dlp: دریافت همزمان تکه‌های فرمت‌های تکه‌ای (DASH/HLS)
+# و تقسیم فایل‌های یکپارچه به درخواست‌های Range کوچک‌تر
+_YTDLP_TRANSFER_OPTS = {
+    'concurrent_fragment_downloads': DOWNLOAD_SEGMENTS,
+    'http_chunk_size': DOWNLOAD_HTTP_CHUNK_SIZE,
+}
+
+def raise_if_unavailable(error: Exception) -> None:
+    """تبدیل خطاهای مربوط به خود ویدیو (خصوصی، حذف شده، مسدود منطقه‌ای) به خطای قطعی
+
+    خطای کلی VideoUnavailable در pytube ممکن است ناشی از مشکل خود کتابخانه باشد،
+    پس فقط انواع مشخص آن قطعی در نظر گرفته می‌شوند.
+    """
+    if isinstance(error, VideoPrivate):
+        raise ContentUnavailableError(REASON_PRIVATE, str(error)) from error
+    if isinstance(error, VideoRegionBlocked):
+        raise ContentUnavailableError(REASON_REGION_BLOCKED, str(error)) from error
+    message = str(error).lower()
+    for reason, patterns in _UNAVAILABLE_MESSAGES:
+        if any(pattern in message for pattern in patterns):
+            raise ContentUnavailableError(reason, str(error)) from error
+
 class YouTubeDownloader:
-    def __init__(self):
-        """راه‌اندازی کلاس دانلودر یوتیوب"""
-        pass
-        
+    def __init__(self, hedge_delay: float = SHORTS_HEDGE_DELAY):
+        """راه‌اندازی کلاس دانلودر یوتیوب
+
+        Args:
+            hedge_delay: تأخیر شروع روش پشتیبان در دانلود پوشش‌دار شورتز (0 = غیرفعال)
+        """
+        self.hedge_delay = hedge_delay
+        # کش اطلاعات استخراج شده و لیست استریم‌ها بر اساس شناسه ویدیو
+        self._info_cache = TTLCache(STREAM_INFO_CACHE_SIZE, STREAM_INFO_CACHE_TTL)
+        self._streams_cache = TTLCache(STREAM_INFO_CACHE_SIZE, STREAM_INFO_CACHE_TTL)
+
+    def _extract_info(self, url: str) -> Optional[Dict]:
+        """استخراج اطلاعات ویدیو با yt-dlp و نگهداری آن در کش
+
+        اطلاعات بدون پردازش فرمت‌ها (process=False) ذخیره می‌شود تا در زمان دانلود
+        با process_ie_result دوباره استفاده شود و نیازی به استخراج مجدد نباشد.
+        """
+        video_id = self._get_video_id(url)
+        if video_id:
+            info = self._info_cache.get(video_id)
+            if info is not None:
+                logger.info(f"اطلاعات ویدیو {video_id} از کش خوانده شد")
+                return info
+
+        import yt_dlp
+        ydl_opts = {
+            'quiet': True,
+            'skip_download': True,
+            'socket_timeout': current_deadline().timeout(HTTP_TIMEOUT)
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            raise_if_unavailable(e)
+            raise
+
+        if info and video_id:
+            self._info_cache.put(video_id, info)
+        return info
+
+    def _ytdlp_download(self, ydl, url: str) -> Optional[Dict]:
+        """دانلود با yt-dlp با استفاده مجدد از اطلاعات کش شده در صورت وجود"""
+        try:
+            info = self._extract_info(url)
+        except DownloadAbortedError:
+            raise
+        except Exception as info_error:
+            logger.warning(f"خطا در دریافت اطلاعات ویدیو از کش: {info_error}")
+            info = None
+
+        if info:
+            # process_ie_result دیکشنری ورودی را تغییر می‌دهد، پس از یک کپی استفاده می‌کنیم
+            return ydl.process_ie_result(copy.deepcopy(info), download=True)
+        return ydl.extract_info(url, download=True)
+
     def _get_streams_with_ytdlp(self, url: str) -> Dict[str, Tuple[str, int]]:
         """دریافت استریم‌ها با استفاده از yt-dlp به عنوان پلن B"""
         streams = {}
         try:
-            import yt_dlp
-            ydl_opts = {
-                'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
-                'listformats': True,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                formats = []
-                
-                # ابتدا فرمت‌ها را فیلتر و مرتب می‌کنیم
-                for format in info.get('formats', []):
-                    if format.get('ext') == 'mp4' and format.get('filesize') and format.get('height'):
-                        formats.append(format)
-                        
-                # مرتب‌سازی بر اساس کیفیت (از بیشترین به کمترین)
-                formats = sorted(formats, key=lambda x: x.get('height', 0), reverse=True)
-                
-                # اضافه کردن بهترین چند فرمت
-                for format in formats[:5]:  # محدود به 5 فرمت با بهترین کیفیت
-                    resolution = f"{format.get('width', 0)}x{format.get('height', 0)}"
-                    filesize = format.get('filesize', 0)
-                    
-                    if filesize < MAX_TELEGRAM_FILE_SIZE:
-                        key = f"{resolution} ({format_size(filesize)})"
-                        streams[key] = (format.get('format_id'), filesize)
+            plan = self.plan_download(url)
+            if plan:
+                # برای هر کیفیت، بهترین گزینه‌ای که زیر سقف حجم تلگرام جا می‌شود
+                heights = set()
+                for candidate in plan.fitting:
+                    if candidate.height in heights:
+                        continue
+                    heights.add(candidate.height)
+                    streams[candidate.label] = (candidate.format_id, candidate.estimated_size)
+                    if len(heights) >= 5:  # محدود به 5 فرمت با بهترین کیفیت
+                        break
                         
             logger.info(f"{len(streams)} استریم با استفاده از yt-dlp برای URL {url} یافت شد")
             
+        except DownloadAbortedError:
+            raise
         except Exception as yt_dlp_error:
             logger.error(f"خطا در استفاده از yt-dlp: {yt_dlp_error}")
             
         return streams
     
-    def _get_video_id(self, url: str) -> Optional[str]:
-        """استخراج شناسه ویدیو از URL یوتیوب"""
+    def plan_download(self, url: str, max_size: int = MAX_TELEGRAM_FILE_SIZE) -> Optional[FormatPlan]:
+        """برنامه‌ریزی فرمت قبل از دانلود: تخمین حجم گزینه‌ها و انتخاب بهترین کیفیت زیر سقف حجم"""
         try:
-            # بررسی اینکه آیا لینک اصلی یوتیوب بدون هیچ ویدیویی خاص است
-            if url.strip('/') in ['https://youtube.com', 'http://youtube.com', 
-                              'https://www.youtube.com', 'http://www.youtube.com']:
-                logger.warning(f"لینک ارسال شده فقط صفحه اصلی یوتیوب است: {url}")
-                return None
-            
-            parsed_url = urlparse(url)
-            
-            # بررسی فرمت کوتاه youtu.be
-            if parsed_url.netloc == 'youtu.be':
-                video_id = parsed_url.path[1:]
-                logger.info(f"شناسه ویدیو از لینک کوتاه: {video_id}")
-                return video_id
-                
-            # بررسی انواع مختلف لینک‌های یوتیوب 
-            elif parsed_url.netloc in ('youtube.com', 'www.youtube.com'):
-                # ویدیوی عادی
-                if '/watch' in parsed_url.path:
-                    if 'v' in parse_qs(parsed_url.query):
-                        video_id = parse_qs(parsed_url.query)['v'][0]
-                        logger.info(f"شناسه ویدیو از لینک watch: {video_id}")
-                        return video_id
-                    
-                # لینک شورتز
-                elif '/shorts/' in parsed_url.path:
-                    parts = parsed_url.path.split('/shorts/')
-                    if len(parts) > 1 and parts[1]:
-                        # حذف هرگونه پارامتر اضافی که ممکن است بعد از شناسه باشد
-                        video_id = parts[1].split('/')[0]
-                        logger.info(f"شناسه ویدیو از لینک شورتز: {video_id}")
-                        return video_id
-                    
-                # لینک embeded
-                elif '/embed/' in parsed_url.path:
-                    parts = parsed_url.path.split('/embed/')
-                    if len(parts) > 1 and parts[1]:
-                        video_id = parts[1].split('/')[0]
-                        logger.info(f"شناسه ویدیو از لینک embed: {video_id}")
-                        return video_id
-                        
-                # فرمت v
-                elif '/v/' in parsed_url.path:
-                    parts = parsed_url.path.split('/v/')
-                    if len(parts) > 1 and parts[1]:
-                        video_id = parts[1].split('/')[0]
-                        logger.info(f"شناسه ویدیو از لینک /v/: {video_id}")
-                        return video_id
-            
-            logger.warning(f"هیچ شناسه ویدیویی در URL پیدا نشد: {url}")
+            info = self._extract_info(url)
+        except DownloadAbortedError:
+            raise
+        except Exception as e:
+            logger.warning(f"خطا در دریافت اطلاعات برای برنامه‌ریزی فرمت: {e}")
             return None
-            
+        if not info:
+            return None
+        return plan_formats(info, max_size)
+
+    def _resolve_format(self, url: str, itag: Optional[str], default_format: str) -> str:
+        """تعیین رشته فرمت yt-dlp با توجه به برنامه حجم
+
+        Raises:
+            FileTooLargeError: اگر هیچ گزینه‌ای زیر سقف حجم وجود نداشته باشد
+        """
+        plan = self.plan_download(url)
+        if not plan or not plan.candidates:
+            # بدون اطلاعات کافی برای تخمین، رفتار قبلی حفظ می‌شود
+            return f'{itag}/{default_format}' if itag else default_format
+
+        candidate = plan.find(itag) if itag else None
+        if candidate and candidate.estimated_size <= plan.max_size:
+            return candidate.format_id
+        if candidate:
+            logger.warning(f"حجم تخمینی فرمت {itag} ({format_size(candidate.estimated_size)}) بیشتر از حد مجاز است")
+        if plan.chosen:
+            logger.info(plan.describe())
+            return plan.chosen.format_id
+
+        logger.warning(f"هیچ فرمتی زیر حد مجاز تلگرام برای {url} وجود ندارد، دانلود انجام نمی‌شود")
+        smallest = min(candidate.estimated_size for candidate in plan.candidates)
+        raise FileTooLargeError(smallest, plan.max_size)
+
+    def get_progressive_source(self, url: str, itag: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """آدرس مستقیم فرمت انتخاب شده اگر پیش‌رونده باشد (ویدیو و صدا در یک فایل، بدون نیاز به ترکیب)
+
+        Returns:
+            (آدرس فایل، هدرهای لازم برای دریافت) یا None اگر فرمت قابل ارسال جریانی نباشد
+        """
+        plan = self.plan_download(url)
+        candidate = plan.find(itag) if plan else None
+        if not candidate or candidate.is_merged or candidate.estimated_size > plan.max_size:
+            return None
+
+        import yt_dlp
+        ydl_opts = {
+            'quiet': True,
+            'skip_download': True,
+            'format': candidate.video_format_id,
+            'socket_timeout': current_deadline().timeout(HTTP_TIMEOUT)
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # فقط پس از پردازش فرمت‌ها آدرس نهایی (با امضای رمزگشایی شده) و هدرهای دریافت آن مشخص است
+                fmt = ydl.process_ie_result(copy.deepcopy(self._extract_info(url)), download=False)
+        except DownloadAbortedError:
+            raise
         except Exception as e:
-            logger.error(f"خطا در استخراج شناسه ویدیو: {e}")
-            logger.exception("جزئیات خطا:")
+            logger.warning(f"خطا در پردازش فرمت {itag} برای ارسال جریانی: {e}")
             return None
-    
+
+        if not fmt or str(fmt.get('format_id')) != candidate.video_format_id:
+            return None
+        # فرمت‌های تکه‌ای (DASH/HLS) یک فایل پیوسته نیستند
+        if fmt.get('url') and not fmt.get('fragments') and fmt.get('protocol', 'https') in ('http', 'https'):
+            return fmt['url'], fmt.get('http_headers') or {}
+        return None
+
+    def _get_video_id(self, url: str) -> Optional[str]:
+        """استخراج شناسه ویدیو از URL یوتیوب با مسیریاب مشترک لینک‌ها"""
+        return media_id_for(url, PLATFORM_YOUTUBE)
+
+    def _failure_guard(self, video_id: str, variant: str, kind: str):
+        """پاسخ از کش نتایج منفی و ذخیره خطاهای قطعی دانلود یک ویدیو"""
+        return negative_cache.guard(content_key('youtube', video_id), media_key('youtube', video_id, variant, kind))
+
+    def get_video_id(self, url: str) -> Optional[str]:
+        """شناسه ویدیوی یوتیوب برای استفاده به عنوان کلید کش"""
+        return self._get_video_id(url)
+
     def get_available_streams(self, url: str) -> Dict[str, Tuple[str, int]]:
         """دریافت لیست استریم‌های موجود برای دانلود به همراه سایز آنها"""
         video_id = self._get_video_id(url)
         if not video_id:
             logger.error(f"شناسه ویدیو از URL استخراج نشد: {url}")
             return {}
-        
-        # اول با yt-dlp تلاش می‌کنیم چون پایدارتر است و محدودیت کمتری دارد
-        try:
-            logger.info(f"تلاش برای دریافت استریم‌ها با yt-dlp برای ویدیو {video_id}")
-            ytdlp_streams = self._get_streams_with_ytdlp(url)
-            if ytdlp_streams:
-                logger.info(f"{len(ytdlp_streams)} استریم با yt-dlp یافت شد")
-                return ytdlp_streams
-            else:
-                logger.warning("هیچ استریمی با yt-dlp یافت نشد. تلاش با pytube...")
-        except Exception as e:
-            logger.error(f"خطا در استفاده از yt-dlp: {e}")
-            logger.info("تلاش با pytube...")
-        
-        # اگر yt-dlp موفق نبود، از pytube استفاده می‌کنیم
+
+        cached_streams = self._streams_cache.get(video_id)
+        if cached_streams:
+            logger.info(f"لیست استریم‌های ویدیو {video_id} از کش خوانده شد")
+            return cached_streams
+
+        with negative_cache.guard(content_key('youtube', video_id)):
+            streams = self._find_available_streams(url, video_id)
+        if streams:
+            self._streams_cache.put(video_id, streams)
+        return streams
+
+    def _find_available_streams(self, url: str, video_id: str) -> Dict[str, Tuple[str, int]]:
+        """یافتن استریم‌ها با yt-dlp و pytube به ترتیبی که رجیستری روش‌ها تعیین می‌کند"""
         try:
-            yt = YouTube(url)
-            yt.bypass_age_gate()  # تلاش برای بایپس محدودیت سنی
-            streams = {}
-            
-            # استخراج استریم‌های ویدیویی (با صدا)
-            video_streams = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc()
-            
-            # استخراج استریم‌های ویدیویی با کیفیت بالا (بدون صدا)
-            high_res_streams = yt.streams.filter(adaptive=True, file_extension='mp4', only_video=True).order_by('resolution').desc()
-            
-            # ابتدا استریم‌های با کیفیت معمولی (همراه با صدا) را اضافه می‌کنیم
-            for stream in video_streams:
-                resolution = stream.resolution
-                if resolution not in streams:
-                    try:
-                        filesize = stream.filesize
-                        key = f"{resolution} ({format_size(filesize)}) - با صدا"
-                        streams[key] = (stream.itag, filesize)
-                    except Exception as e:
-                        logger.warning(f"خطا در دریافت اطلاعات استریم {stream.itag}: {e}")
-                        continue
-            
-            # سپس استریم‌های با کیفیت بالا را اضافه می‌کنیم (حداکثر 3 مورد)
-            count = 0
-            for stream in high_res_streams:
-                resolution = stream.resolution
-                if resolution not in [s.split(" ")[0] for s in streams.keys()] and count < 3:
-                    try:
-                        filesize = stream.filesize
-                        # برای کیفیت‌های بالا، تنها در صورتی که حجم آن کمتر از حد مجاز تلگرام باشد اضافه می‌کنیم
-                        if filesize < MAX_TELEGRAM_FILE_SIZE:
-                            key = f"{resolution} ({format_size(filesize)}) - فقط تصویر"
-                            streams[key] = (stream.itag, filesize)
-                            count += 1
-                    except Exception as e:
-                        logger.warning(f"خطا در دریافت اطلاعات استریم {stream.itag}: {e}")
-                        continue
-            
-            if streams:
-                logger.info(f"{len(streams)} استریم با pytube یافت شد")
-                return streams
-            else:
-                logger.warning("هیچ استریمی با pytube یافت نشد")
-                return {}
-        
-        except VideoUnavailable:
+            streams = backend_registry.run(f"دریافت استریم‌های ویدیو {video_id}", [
+                (BACKEND_YTDLP, lambda: self._get_streams_with_ytdlp(url)),
+                (BACKEND_PYTUBE, lambda: self._get_streams_with_pytube(url)),
+            ], final_errors=(VideoUnavailable, RegexMatchError))
+        except VideoUnavailable as e:
+            raise_if_unavailable(e)
             logger.error(f"ویدیو موجود نیست: {url}")
             return {}
         except RegexMatchError:
             logger.error(f"لینک یوتیوب نامعتبر است: {url}")
             return {}
-        except Exception as e:
-            logger.error(f"خطا در دریافت استریم‌های ویدیو با pytube: {e}")
-            return {}
+        return streams or {}
+
+    def _get_streams_with_pytube(self, url: str) -> Dict[str, Tuple[str, int]]:
+        """دریافت استریم‌ها با استفاده از pytube"""
+        yt = YouTube(url)
+        yt.bypass_age_gate()  # تلاش برای بایپس محدودیت سنی
+        streams = {}
+        
+        # استخراج استریم‌های ویدیویی (با صدا)
+        video_streams = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc()
+        
+        # استخراج استریم‌های ویدیویی با کیفیت بالا (بدون صدا)
+        high_res_streams = yt.streams.filter(adaptive=True, file_extension='mp4', only_video=True).order_by('resolution').desc()
+        
+        # ابتدا استریم‌های با کیفیت معمولی (همراه با صدا) را اضافه می‌کنیم
+        for stream in video_streams:
+            resolution = stream.resolution
+            if resolution not in streams:
+                try:
+                    filesize = stream.filesize
+                    key = f"{resolution} ({format_size(filesize)}) - با صدا"
+                    streams[key] = (stream.itag, filesize)
+                except Exception as e:
+                    logger.warning(f"خطا در دریافت اطلاعات استریم {stream.itag}: {e}")
+                    continue
+        
+        # سپس استریم‌های با کیفیت بالا را اضافه می‌کنیم (حداکثر 3 مورد)
+        count = 0
+        for stream in high_res_streams:
+            resolution = stream.resolution
+            if resolution not in [s.split(" ")[0] for s in streams.keys()] and count < 3:
+                try:
+                    filesize = stream.filesize
+                    # برای کیفیت‌های بالا، تنها در صورتی که حجم آن کمتر از حد مجاز تلگرام باشد اضافه می‌کنیم
+                    if filesize < MAX_TELEGRAM_FILE_SIZE:
+                        key = f"{resolution} ({format_size(filesize)}) - فقط تصویر"
+                        streams[key] = (stream.itag, filesize)
+                        count += 1
+                except Exception as e:
+                    logger.warning(f"خطا در دریافت اطلاعات استریم {stream.itag}: {e}")
+                    continue
+        
+        if streams:
+            logger.info(f"{len(streams)} استریم با pytube یافت شد")
+        else:
+            logger.warning("هیچ استریمی با pytube یافت نشد")
+        return streams
     
-    def download_video(self, url: str, itag: int) -> str:
-        """دانلود ویدیو با استفاده از شناسه استریم"""
+    def _remove_partial_files(self, output_file: str) -> None:
+        """حذف فایل خروجی و فایل‌های نیمه‌کاره مرتبط (مثل .part و بخش‌های ترکیب نشده)"""
+        output_base = os.path.splitext(output_file)[0]
+        for partial_file in glob.glob(f"{glob.escape(output_base)}*"):
+            clean_temp_file(partial_file)
+
+    def _verified_output(self, output_file: str, method: str) -> str:
+        """بررسی فایل دانلود شده؛ مسیر فایل در صورت سالم بودن یا رشته خالی"""
+        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            logger.warning(f"فایل دانلود شده با {method} خالی است یا ایجاد نشده است")
+            self._remove_partial_files(output_file)
+            return ""
+
+        file_size = os.path.getsize(output_file)
+        if file_size > MAX_TELEGRAM_FILE_SIZE:
+            logger.warning(f"سایز فایل ({format_size(file_size)}) بیشتر از حد مجاز تلگرام است")
+            self._remove_partial_files(output_file)
+            raise FileTooLargeError(file_size, MAX_TELEGRAM_FILE_SIZE)
+
+        logger.info(f"فایل با موفقیت با {method} دانلود شد. سایز فایل: {format_size(file_size)}")
+        return output_file
+
+    def _download_with_ytdlp(self, url: str, output_file: str, itag: Optional[str], default_format: str,
+                             signal: Optional[AttemptSignal] = None) -> str:
+        """دانلود ویدیو با yt-dlp (پایدارتر و قدرتمندتر)"""
+        import yt_dlp
+
+        format_spec = self._resolve_format(url, itag, default_format)
+        # اگر در حین استخراج اطلاعات روش دیگری برنده شده، دانلود شروع نمی‌شود
+        if signal:
+            signal.check()
+        # توقف دانلود به محض عبور حجم دریافت شده از سقف تلگرام
+        size_guard = SizeGuard(signal=signal)
+        ydl_opts = {
+            'format': format_spec,
+            'outtmpl': output_file,
+            'merge_output_format': 'mp4',
+            'progress_hooks': [size_guard.ytdlp_hook],
+            'socket_timeout': current_deadline().timeout(HTTP_TIMEOUT),
+            'quiet': True,
+            **_YTDLP_TRANSFER_OPTS
+        }
+
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                self._ytdlp_download(ydl, url)
+        except Exception as e:
+            self._remove_partial_files(output_file)
+            # yt-dlp ممکن است خطای توقف به دلیل حجم را در خطای دیگری پیچیده باشد
+            size_guard.raise_if_exceeded()
+            raise_if_unavailable(e)
+            raise
+        return self._verified_output(output_file, "yt-dlp")
+
+    def _download_video_with_pytube(self, url: str, itag, output_file: str) -> str:
+        """دانلود ویدیو با pytube با استفاده از شناسه استریم"""
+        size_guard = SizeGuard()
+        try:
+            yt = YouTube(url, on_progress_callback=size_guard.pytube_hook)
+            logger.info(f"اطلاعات ویدیو دریافت شد: {yt.title}")
+            
+            # برای فرمت‌های ترکیبی yt-dlp (مثلاً 137+140) فقط itag ویدیو برای pytube معنی دارد
+            stream = yt.streams.get_by_itag(int(str(itag).split('+')[0]))
+            if not stream:
+                logger.error(f"استریم با شناسه {itag} یافت نشد برای {url}")
+                return ""
+                
+            logger.info(f"استریم با کیفیت {stream.resolution} و فرمت {stream.mime_type} یافت شد")
+            
+            # بررسی سایز فایل
+            filesize = None
+            try:
+                filesize = stream.filesize
+                logger.info(f"سایز فایل: {filesize} بایت ({format_size(filesize)})")
+            except Exception as size_error:
+                logger.warning(f"خطا در دریافت سایز فایل: {size_error}")
+            if filesize and filesize > MAX_TELEGRAM_FILE_SIZE:
+                logger.warning(f"سایز فایل ({format_size(filesize)}) بیشتر از حد مجاز تلگرام است")
+                raise FileTooLargeError(filesize, MAX_TELEGRAM_FILE_SIZE)
+            
+            # دانلود و ذخیره ویدیو
+            logger.info("در حال دانلود ویدیو با pytube...")
+            stream.download(filename=output_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
+        except Exception as e:
+            self._remove_partial_files(output_file)
+            size_guard.raise_if_exceeded()
+            raise_if_unavailable(e)
+            raise
+        return self._verified_output(output_file, "pytube")
+
+    def download_video(self, url: str, itag) -> str:
+        """دانلود ویدیو با استفاده از شناسه استریم
+
+        روش‌های yt-dlp، pytube و دانلود مستقیم به ترتیبی امتحان می‌شوند که
+        رجیستری روش‌ها بر اساس موفقیت و سرعت اخیر آنها تعیین می‌کند.
+        """
         try:
             logger.info(f"شروع دانلود ویدیوی یوتیوب با URL: {url} و itag: {itag}")
             
@@ -206,94 +421,24 @@ class YouTubeDownloader:
             
             output_file = generate_temp_filename('.mp4')
             logger.info(f"نام فایل خروجی: {output_file}")
-            
-            # روش 1: استفاده از yt-dlp (پایدارتر و قدرتمندتر)
-            try:
-                logger.info("در حال تلاش برای دانلود با yt-dlp...")
-                import yt_dlp
-                
-                ydl_opts = {
-                    'format': f'{itag}/best',
-                    'outtmpl': output_file,
-                    'quiet': True
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                
-                # بررسی وجود فایل
-                if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                    file_size = os.path.getsize(output_file)
-                    if file_size > MAX_TELEGRAM_FILE_SIZE:
-                        logger.warning(f"سایز فایل ({format_size(file_size)}) بیشتر از حد مجاز تلگرام است")
-                        os.remove(output_file)
-                        return ""
-                    
-                    logger.info(f"ویدیو با موفقیت با yt-dlp دانلود شد. سایز فایل: {format_size(file_size)}")
-                    return output_file
-                else:
-                    logger.warning("فایل دانلود شده با yt-dlp خالی است یا ایجاد نشده است")
-            except Exception as ytdlp_error:
-                logger.warning(f"خطا در دانلود با yt-dlp: {ytdlp_error}")
-                logger.warning("در حال تلاش با روش جایگزین (pytube)...")
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-            
-            # روش 2: استفاده از pytube
-            try:
-                yt = YouTube(url)
-                logger.info(f"اطلاعات ویدیو دریافت شد: {yt.title}")
-                
-                stream = yt.streams.get_by_itag(itag)
-                if not stream:
-                    logger.error(f"استریم با شناسه {itag} یافت نشد برای {url}")
-                    return ""
-                    
-                logger.info(f"استریم با کیفیت {stream.resolution} و فرمت {stream.mime_type} یافت شد")
-                
-                # بررسی سایز فایل
-                try:
-                    filesize = stream.filesize
-                    logger.info(f"سایز فایل: {filesize} بایت ({format_size(filesize)})")
-                    if filesize > MAX_TELEGRAM_FILE_SIZE:
-                        logger.warning(f"سایز فایل ({format_size(filesize)}) بیشتر از حد مجاز تلگرام است")
-                        return ""
-                except Exception as size_error:
-                    logger.warning(f"خطا در دریافت سایز فایل: {size_error}")
-                
-                # دانلود و ذخیره ویدیو
-                logger.info("در حال دانلود ویدیو با pytube...")
-                stream.download(filename=output_file)
-                
-                # بررسی وجود فایل
-                if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                    file_size = os.path.getsize(output_file)
-                    logger.info(f"ویدیو با موفقیت دانلود شد با pytube. سایز فایل: {format_size(file_size)}")
-                    return output_file
-                else:
-                    logger.warning("فایل دانلود شده با pytube خالی است یا ایجاد نشده است")
-            except Exception as pytube_error:
-                logger.warning(f"خطا در دانلود با pytube: {pytube_error}")
-                logger.warning("در حال تلاش با روش مستقیم...")
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-            
-            # روش 3: استفاده از دانلود مستقیم
-            logger.info("تلاش برای دانلود با روش مستقیم...")
-            direct_output = self._download_via_direct_link(video_id)
-            if direct_output:
-                logger.info("دانلود با روش مستقیم موفقیت‌آمیز بود")
-                return direct_output
-            else:
-                logger.error("تمام روش‌های دانلود شکست خورد")
-                return ""
+
+            # لینک‌های حذف شده یا فرمت‌های بیش از حد بزرگ تا مدتی بدون تلاش مجدد رد می‌شوند
+            with self._failure_guard(video_id, str(itag), MEDIA_VIDEO):
+                output = backend_registry.run(f"دانلود ویدیو {video_id}", [
+                    (BACKEND_YTDLP, lambda: self._download_with_ytdlp(url, output_file, str(itag), 'best')),
+                    (BACKEND_PYTUBE, lambda: self._download_video_with_pytube(url, itag, output_file)),
+                    (BACKEND_DIRECT, lambda: self._download_via_direct_link(video_id)),
+                ])
+            return output or ""
         
+        except DownloadAbortedError:
+            raise
         except Exception as outer_error:
             logger.error(f"خطای کلی در دانلود ویدیو: {outer_error}")
             logger.exception("جزئیات خطا:")
             return ""
     
-    def _download_via_direct_link(self, video_id: str) -> str:
+    def _download_via_direct_link(self, video_id: str, signal: Optional[AttemptSignal] = None) -> str:
         """تلاش برای دانلود مستقیم شورتز با استفاده از API های عمومی"""
         try:
             logger.info(f"تلاش برای دانلود مستقیم ویدیو با شناسه: {video_id}")
@@ -303,6 +448,7 @@ class YouTubeDownloader:
             try:
                 output_file = generate_temp_filename('.mp4')
                 logger.info(f"تلاش برای دانلود با استفاده از متد جایگزین... خروجی: {output_file}")
+                size_guard = SizeGuard(signal=signal)
                 
                 # تلاش با استفاده از اجرای command-line
                 import subprocess
@@ -314,7 +460,7 @@ class YouTubeDownloader:
                     from pytube import YouTube
                     try:
                         # تلاش مجدد با تنظیمات متفاوت
-                        yt = YouTube(url)
+                        yt = YouTube(url, on_progress_callback=size_guard.pytube_hook)
                         
                         # دریافت جزئیات ویدیو برای لاگ
                         title = yt.title
@@ -329,12 +475,12 @@ class YouTubeDownloader:
                         if video_stream:
                             logger.info(f"استریم ویدیویی یافت شد: {video_stream.resolution}")
                             video_file = generate_temp_filename('.mp4.video')
-                            video_stream.download(filename=video_file)
+                            video_stream.download(filename=video_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
                             
                             if audio_stream:
                                 logger.info(f"استریم صوتی یافت شد: {audio_stream.abr}")
                                 audio_file = generate_temp_filename('.mp4.audio')
-                                audio_stream.download(filename=audio_file)
+                                audio_stream.download(filename=audio_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
                                 
                                 # ترکیب فایل‌های ویدیو و صدا با FFmpeg
                                 if os.path.exists(video_file) and os.path.exists(audio_file):
@@ -344,7 +490,7 @@ class YouTubeDownloader:
                                         output_file, '-y'
                                     ]
                                     try:
-                                        subprocess.run(cmd, check=True, capture_output=True)
+                                        run_subprocess(cmd, check=True, capture_output=True)
                                         logger.info("فایل‌های ویدیو و صوتی با موفقیت ترکیب شدند")
                                         os.remove(video_file)
                                         os.remove(audio_file)
@@ -366,7 +512,7 @@ class YouTubeDownloader:
                             stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
                             if stream:
                                 logger.info(f"استریم progressive یافت شد: {stream.resolution}")
-                                stream.download(filename=output_file)
+                                stream.download(filename=output_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
                                 
                                 if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                                     file_size = os.path.getsize(output_file)
@@ -374,13 +520,14 @@ class YouTubeDownloader:
                                     return output_file
                     
                     except Exception as pytube_alternative_error:
+                        size_guard.raise_if_exceeded()
                         logger.warning(f"خطا در تلاش جایگزین pytube: {pytube_alternative_error}")
                     
                     # اگر به اینجا رسیدیم، روش اول موفق نبوده است
                     # تلاش با استفاده از youtube-dl
                     try:
-                        command = ['yt-dlp', '-f', 'best[filesize<50M]', '--merge-output-format', 'mp4', '-o', output_file, url]
-                        process = subprocess.run(command, capture_output=True, text=True, check=True)
+                        command = ['yt-dlp', '-f', 'best[filesize<50M]', '--max-filesize', str(MAX_TELEGRAM_FILE_SIZE), '--merge-output-format', 'mp4', '-o', output_file, url]
+                        process = run_subprocess(command, capture_output=True, text=True, check=True)
                         logger.info(f"خروجی yt-dlp: {process.stdout[:200]}")
                         
                         if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
@@ -392,8 +539,8 @@ class YouTubeDownloader:
                         
                     # روش جایگزین دیگر: استفاده از youtube-dl
                     try:
-                        command = ['youtube-dl', '-f', 'best[filesize<50M]', '--merge-output-format', 'mp4', '-o', output_file, url]
-                        process = subprocess.run(command, capture_output=True, text=True, check=True)
+                        command = ['youtube-dl', '-f', 'best[filesize<50M]', '--max-filesize', str(MAX_TELEGRAM_FILE_SIZE), '--merge-output-format', 'mp4', '-o', output_file, url]
+                        process = run_subprocess(command, capture_output=True, text=True, check=True)
                         logger.info(f"خروجی youtube-dl: {process.stdout[:200]}")
                         
                         if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
@@ -407,10 +554,12 @@ class YouTubeDownloader:
                     logger.warning("کتابخانه pytube در دسترس نیست")
                 
                 except Exception as cmd_error:
+                    size_guard.raise_if_exceeded()
                     logger.error(f"خطا در اجرای دستور دانلود: {cmd_error}")
                     logger.exception("جزئیات خطا:")
                     
             except Exception as method_error:
+                size_guard.raise_if_exceeded()
                 logger.error(f"خطا در روش اول دانلود: {method_error}")
                 logger.exception("جزئیات خطا:")
             
@@ -429,7 +578,7 @@ class YouTubeDownloader:
                 url = f"https://vid.puffyan.us/api/v1/videos/{video_id}"
                 logger.info(f"تلاش با استفاده از API جایگزین: {url}")
                 try:
-                    response = requests.get(url, headers=headers)
+                    response = http.get(url, headers=headers, timeout=current_deadline().timeout(HTTP_TIMEOUT))
                     if response.status_code == 200:
                         video_data = response.json()
                         if 'formatStreams' in video_data:
@@ -447,22 +596,26 @@ class YouTubeDownloader:
                                 logger.info(f"لینک دانلود مستقیم از API جایگزین یافت شد: {video_url[:50]}...")
                                 
                                 output_file = generate_temp_filename('.mp4')
+                                size_guard = SizeGuard(signal=signal)
                                 try:
-                                    with requests.get(video_url, stream=True, headers=headers) as r:
-                                        r.raise_for_status()
-                                        with open(output_file, 'wb') as f:
-                                            for chunk in r.iter_content(chunk_size=8192):
-                                                f.write(chunk)
-                                    
+                                    # دریافت با چند اتصال همزمان در صورت پشتیبانی سرور از Range
+                                    download_segmented(video_url, output_file, size_guard, headers=headers)
+
                                     if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                                         file_size = os.path.getsize(output_file)
                                         logger.info(f"ویدیو با موفقیت از API جایگزین دانلود شد. سایز: {format_size(file_size)}")
                                         return output_file
                                 except Exception as dl_error:
+                                    clean_temp_file(output_file)
+                                    size_guard.raise_if_exceeded()
                                     logger.error(f"خطا در دانلود از API جایگزین: {dl_error}")
+                except DownloadAbortedError:
+                    raise
                 except Exception as api_error:
                     logger.error(f"خطا در دریافت داده از API جایگزین: {api_error}")
             
+            except DownloadAbortedError:
+                raise
             except Exception as api_method_error:
                 logger.error(f"خطا در روش دوم دانلود: {api_method_error}")
                 logger.exception("جزئیات خطا:")
@@ -471,6 +624,8 @@ class YouTubeDownloader:
             logger.error("تمام روش‌های دانلود شکست خورد")
             return ""
                 
+        except DownloadAbortedError:
+            raise
         except Exception as e:
             logger.error(f"خطای کلی در دانلود مستقیم: {e}")
             logger.exception("جزئیات خطا:")
@@ -478,6 +633,59 @@ class YouTubeDownloader:
             
         return ""  # اگر همه روش‌ها شکست خورد
 
+    def _download_shorts_with_pytube(self, url: str, output_file: str, signal: Optional[AttemptSignal] = None) -> str:
+        """دانلود شورتز با بهترین کیفیت موجود در pytube"""
+        size_guard = SizeGuard(signal=signal)
+        try:
+            # سعی اول: استفاده از لینک اصلی
+            yt = YouTube(url, on_progress_callback=size_guard.pytube_hook)
+            logger.info(f"اطلاعات شورتز دریافت شد با لینک اصلی: {yt.title}")
+            
+            # انتخاب بهترین کیفیت موجود برای دانلود
+            streams = yt.streams.filter(progressive=True, file_extension='mp4')
+            if not streams or len(streams) == 0:
+                # تلاش برای دریافت همه استریم‌ها اگر فیلتر کار نکرد
+                streams = yt.streams.all()
+                logger.info(f"استریم‌های یافت شده (بدون فیلتر): {len(streams)}")
+            else:
+                logger.info(f"استریم‌های یافت شده (با فیلتر): {len(streams)}")
+            
+            stream = None
+            try:
+                stream = streams.order_by('resolution').desc().first()
+            except:
+                if streams and len(streams) > 0:
+                    stream = streams[0]
+            
+            if not stream:
+                logger.warning("هیچ استریمی برای دانلود با pytube یافت نشد")
+                return ""
+
+            # دانلود و ذخیره ویدیو
+            logger.info("در حال دانلود شورتز با pytube...")
+            stream.download(filename=output_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
+        except Exception as e:
+            self._remove_partial_files(output_file)
+            size_guard.raise_if_exceeded()
+            raise_if_unavailable(e)
+            raise
+        return self._verified_output(output_file, "pytube")
+
+    def _download_shorts_hedged(self, url: str, video_id: str) -> Optional[str]:
+        """دانلود پوشش‌دار شورتز: شروع روش پشتیبان در صورت کندی روش اول
+
+        هر روش در فایل خروجی جداگانه دانلود می‌کند تا خروجی روش بازنده بدون
+        تداخل با روش برنده پاک شود.
+        """
+        ytdlp_output = generate_temp_filename('.mp4')
+        pytube_output = generate_temp_filename('.mp4')
+        return backend_registry.race(f"دانلود پوشش‌دار شورتز {video_id}", [
+            (BACKEND_YTDLP, lambda signal: self._download_with_ytdlp(
+                url, ytdlp_output, None, 'best[ext=mp4]/bestvideo[ext=mp4]+bestaudio[ext=m4a]/best', signal)),
+            (BACKEND_PYTUBE, lambda signal: self._download_shorts_with_pytube(url, pytube_output, signal)),
+            (BACKEND_DIRECT, lambda signal: self._download_via_direct_link(video_id, signal)),
+        ], hedge_delay=self.hedge_delay, discard=self._remove_partial_files)
+
     def download_shorts(self, url: str) -> str:
         """دانلود شورتز یوتیوب"""
         try:
@@ -497,97 +705,134 @@ class YouTubeDownloader:
             watch_url = f"https://www.youtube.com/watch?v={video_id}"
             logger.info(f"لینک شورتز به لینک استاندارد تبدیل شد: {watch_url}")
             
-            output_file = generate_temp_filename('.mp4')
-            logger.info(f"نام فایل خروجی شورتز: {output_file}")
-            
-            # روش 1: استفاده از yt-dlp (پایدارتر و قدرتمندتر)
-            try:
-                logger.info("در حال تلاش برای دانلود شورتز با yt-dlp...")
-                import yt_dlp
-                
-                ydl_opts = {
-                    'format': 'best[ext=mp4]/bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
-                    'outtmpl': output_file,
-                    'quiet': True
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                
-                # بررسی وجود فایل
-                if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                    file_size = os.path.getsize(output_file)
-                    if file_size > MAX_TELEGRAM_FILE_SIZE:
-                        logger.warning(f"سایز فایل ({format_size(file_size)}) بیشتر از حد مجاز تلگرام است")
-                        os.remove(output_file)
-                        return ""
-                    
-                    logger.info(f"شورتز با موفقیت با yt-dlp دانلود شد. سایز فایل: {format_size(file_size)}")
-                    return output_file
-                else:
-                    logger.warning("فایل دانلود شده با yt-dlp خالی است یا ایجاد نشده است")
-            except Exception as ytdlp_error:
-                logger.warning(f"خطا در دانلود شورتز با yt-dlp: {ytdlp_error}")
-                logger.warning("در حال تلاش با روش جایگزین (pytube)...")
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-            
-            # روش 2: استفاده از pytube
-            try:
-                # سعی اول: استفاده از لینک اصلی
-                yt = YouTube(url)
-                logger.info(f"اطلاعات شورتز دریافت شد با لینک اصلی: {yt.title}")
-                
-                # انتخاب بهترین کیفیت موجود برای دانلود
-                streams = yt.streams.filter(progressive=True, file_extension='mp4')
-                if not streams or len(streams) == 0:
-                    # تلاش برای دریافت همه استریم‌ها اگر فیلتر کار نکرد
-                    streams = yt.streams.all()
-                    logger.info(f"استریم‌های یافت شده (بدون فیلتر): {len(streams)}")
-                else:
-                    logger.info(f"استریم‌های یافت شده (با فیلتر): {len(streams)}")
-                
-                stream = None
-                try:
-                    stream = streams.order_by('resolution').desc().first()
-                except:
-                    if streams and len(streams) > 0:
-                        stream = streams[0]
-                
-                if stream:
-                    # دانلود و ذخیره ویدیو
-                    logger.info("در حال دانلود شورتز با pytube...")
-                    stream.download(filename=output_file)
-                    
-                    if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                        file_size = os.path.getsize(output_file)
-                        logger.info(f"شورتز با موفقیت دانلود شد با pytube. سایز فایل: {format_size(file_size)}")
-                        return output_file
-                    else:
-                        logger.warning("فایل دانلود شده با pytube خالی است یا ایجاد نشده است")
-                else:
-                    logger.warning("هیچ استریمی برای دانلود با pytube یافت نشد")
-            except Exception as pytube_error:
-                logger.warning(f"خطا در دانلود با pytube: {pytube_error}")
-                logger.warning("در حال تلاش با روش مستقیم...")
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-            
-            # روش 3: استفاده از دانلود مستقیم
-            logger.info("تلاش برای دانلود با روش مستقیم...")
-            direct_output = self._download_via_direct_link(video_id)
-            if direct_output:
-                logger.info("دانلود با روش مستقیم موفقیت‌آمیز بود")
-                return direct_output
-            else:
-                logger.error("تمام روش‌های دانلود شکست خورد")
-                return ""
+            with self._failure_guard(video_id, 'best', MEDIA_VIDEO):
+                if self.hedge_delay > 0:
+                    return self._download_shorts_hedged(url, video_id) or ""
+
+                output_file = generate_temp_filename('.mp4')
+                logger.info(f"نام فایل خروجی شورتز: {output_file}")
+
+                output = backend_registry.run(f"دانلود شورتز {video_id}", [
+                    (BACKEND_YTDLP, lambda: self._download_with_ytdlp(
+                        url, output_file, None, 'best[ext=mp4]/bestvideo[ext=mp4]+bestaudio[ext=m4a]/best')),
+                    (BACKEND_PYTUBE, lambda: self._download_shorts_with_pytube(url, output_file)),
+                    (BACKEND_DIRECT, lambda: self._download_via_direct_link(video_id)),
+                ])
+            return output or ""
         
+        except DownloadAbortedError:
+            raise
         except Exception as e:
             logger.error(f"خطای کلی در دانلود شورتز: {e}")
             logger.exception("جزئیات خطا:")
             return ""
     
+    def _download_audio_with_ytdlp(self, url: str, output_base: str) -> str:
+        """دانلود بهترین استریم فقط صوتی با yt-dlp"""
+        import yt_dlp
+
+        # توقف دانلود به محض عبور حجم دریافت شده از سقف تلگرام
+        size_guard = SizeGuard()
+        ydl_opts = {
+            'format': 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best',
+            'outtmpl': f'{output_base}.%(ext)s',
+            'progress_hooks': [size_guard.ytdlp_hook],
+            'socket_timeout': current_deadline().timeout(HTTP_TIMEOUT),
+            'quiet': True,
+            **_YTDLP_TRANSFER_OPTS
+        }
+
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                result = self._ytdlp_download(ydl, url)
+        except Exception as e:
+            self._remove_partial_files(output_base)
+            size_guard.raise_if_exceeded()
+            raise_if_unavailable(e)
+            raise
+
+        if result and result.get('requested_downloads'):
+            downloaded_file = result['requested_downloads'][0].get('filepath', "")
+            if downloaded_file and os.path.exists(downloaded_file) and os.path.getsize(downloaded_file) > 0:
+                return downloaded_file
+        return ""
+
+    def _download_audio_with_pytube(self, url: str, output_base: str) -> str:
+        """دانلود استریم صوتی pytube (فرمت mp4/m4a)"""
+        size_guard = SizeGuard()
+        downloaded_file = f"{output_base}.m4a"
+        try:
+            yt = YouTube(url, on_progress_callback=size_guard.pytube_hook)
+            stream = yt.streams.filter(only_audio=True, file_extension='mp4').order_by('abr').desc().first()
+            if not stream:
+                logger.warning("هیچ استریم صوتی با pytube یافت نشد")
+                return ""
+            logger.info(f"استریم صوتی با کیفیت {stream.abr} یافت شد")
+            stream.download(filename=downloaded_file, timeout=current_deadline().timeout(HTTP_TIMEOUT))
+        except Exception as e:
+            clean_temp_file(downloaded_file)
+            size_guard.raise_if_exceeded()
+            raise_if_unavailable(e)
+            raise
+
+        if os.path.exists(downloaded_file) and os.path.getsize(downloaded_file) > 0:
+            return downloaded_file
+        return ""
+
+    def download_audio(self, url: str) -> str:
+        """دانلود مستقیم فقط استریم صوتی (بدون دانلود ویدیو و تبدیل مجدد)
+
+        ابتدا بهترین استریم صوتی m4a انتخاب می‌شود که تلگرام مستقیماً می‌پذیرد. فایل دریافت شده
+        بدون تبدیل برگردانده می‌شود؛ اگر پسوند آن در TELEGRAM_AUDIO_EXTENSIONS نباشد (مثل opus یا
+        ویدیوی جایگزین)، استخراج صدا بر عهده فراخوان و در مرحله تبدیل مدیر کارها است.
+        """
+        try:
+            logger.info(f"شروع دانلود صدای یوتیوب با URL: {url}")
+
+            video_id = self._get_video_id(url)
+            if not video_id:
+                logger.error(f"شناسه ویدیو از URL استخراج نشد: {url}")
+                return ""
+
+            with self._failure_guard(video_id, 'best', MEDIA_AUDIO):
+                # روش‌های دانلود مستقیم استریم صوتی (yt-dlp و pytube) به ترتیب تطبیقی
+                output_base = os.path.splitext(generate_temp_filename())[0]
+                downloaded_file = backend_registry.run(f"دانلود صدای ویدیو {video_id}", [
+                    (BACKEND_YTDLP, lambda: self._download_audio_with_ytdlp(url, output_base)),
+                    (BACKEND_PYTUBE, lambda: self._download_audio_with_pytube(url, output_base)),
+                ]) or ""
+
+                # روش جایگزین: دانلود کم‌حجم‌ترین ویدیو و استخراج صدا از آن
+                if not downloaded_file:
+                    logger.warning("دانلود مستقیم استریم صوتی ناموفق بود، تلاش با دانلود ویدیو...")
+                    streams = self.get_available_streams(url)
+                    if not streams:
+                        logger.error("هیچ استریمی برای استخراج صدا یافت نشد")
+                        return ""
+                    itag, _ = min(streams.values(), key=lambda stream: stream[1])
+                    downloaded_file = self.download_video(url, itag)
+                    if not downloaded_file:
+                        logger.error("تمام روش‌های دانلود صدا شکست خورد")
+                        return ""
+
+                # حجم فایلی که نیاز به استخراج صدا دارد پس از استخراج توسط فراخوان بررسی می‌شود
+                file_size = os.path.getsize(downloaded_file)
+                if (os.path.splitext(downloaded_file)[1].lower() in TELEGRAM_AUDIO_EXTENSIONS
+                        and file_size > MAX_TELEGRAM_FILE_SIZE):
+                    logger.warning(f"سایز فایل صوتی ({format_size(file_size)}) بیشتر از حد مجاز تلگرام است")
+                    clean_temp_file(downloaded_file)
+                    raise FileTooLargeError(file_size, MAX_TELEGRAM_FILE_SIZE)
+
+            logger.info(f"صدا با موفقیت دانلود شد. سایز فایل: {format_size(file_size)}")
+            return downloaded_file
+
+        except DownloadAbortedError:
+            raise
+        except Exception as e:
+            logger.error(f"خطای کلی در دانلود صدای یوتیوب: {e}")
+            logger.exception("جزئیات خطا:")
+            return ""
+
     def get_playlist_videos(self, playlist_url: str, limit: int = 5) -> List[Dict[str, str]]:
         """دریافت لیست ویدیوهای موجود در پلی‌لیست یوتیوب
         
@@ -601,9 +846,9 @@ class YouTubeDownloader:
         try:
             logger.info(f"دریافت اطلاعات پلی‌لیست: {playlist_url}")
             
-            # تنظیم کردن دستور yt-dlp برای دریافت اطلاعات پلی‌لیست
-            from utils import extract_playlist_id
-            playlist_id = extract_playlist_id(playlist_url)
+            # شناسه پلی‌لیست با مسیریاب مشترک لینک‌ها
+            link = classify_url(playlist_url)
+            playlist_id = link.playlist_id if link else None
             
             if not playlist_id:
                 logger.error(f"شناسه پلی‌لیست استخراج نشد: {playlist_url}")
@@ -611,10 +856,6 @@ class YouTubeDownloader:
                 
             videos = []
             try:
-                # استفاده از yt-dlp برای دریافت اطلاعات پلی‌لیست
-                import subprocess
-                import json
-                
                 # ساخت دستور برای دریافت اطلاعات پلی‌لیست با فرمت JSON
                 cmd = [
                     'yt-dlp', 
@@ -625,7 +866,7 @@ class YouTubeDownloader:
                 ]
                 
                 # اجرای دستور
-                process = subprocess.run(cmd, capture_output=True, text=True)
+                process = run_subprocess(cmd, capture_output=True, text=True)
                 
                 # پردازش خروجی JSON
                 if process.stdout:
@@ -651,6 +892,9 @@ class YouTubeDownloader:
                         except json.JSONDecodeError:
                             logger.warning(f"خطا در پردازش JSON ویدیو: {line[:100]}")
             
+            except DownloadAbortedError:
+                # پس از پایان زمان مجاز یا لغو درخواست، روش جایگزین امتحان نمی‌شود
+                raise
             except Exception as e:
                 logger.error(f"خطا در اجرای yt-dlp: {e}")
                 logger.exception("جزئیات خطا:")
@@ -682,6 +926,8 @@ class YouTubeDownloader:
             logger.info(f"تعداد {len(videos)} ویدیو از پلی‌لیست دریافت شد")
             return videos
             
+        except DownloadAbortedError:
+            raise
         except Exception as e:
             logger.error(f"خطا در دریافت ویدیوهای پلی‌لیست: {e}")
             logger.exception("جزئیات خطا:")
@@ -0,0 +1,212 @@
+import socket
+import logging
+import threading
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.retry import Retry
+
+from config import (
+    HTTP_POOL_HOSTS,
+    HTTP_POOL_PER_HOST,
+    HTTP_RETRIES,
+    HTTP_RETRY_BACKOFF,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_DNS_CACHE_SIZE
+)
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """آمار استفاده از مجموعه اتصال‌های مشترک"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.pool_misses = 0
+        self.connections_opened = 0
+        self._opened_by_host: Dict[str, int] = {}
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_pool_miss(self) -> None:
+        with self._lock:
+            self.pool_misses += 1
+
+    def record_connection(self, host: str) -> None:
+        with self._lock:
+            self.connections_opened += 1
+            self._opened_by_host[host] = self._opened_by_host.get(host, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """تعداد درخواست‌ها، یافتن مجموعه اتصال میزبان و استفاده مجدد از اتصال‌های باز"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'pool_hits': self.requests - self.pool_misses,
+                'pool_misses': self.pool_misses,
+                'connections_opened': self.connections_opened,
+                # درخواست‌هایی که بدون اتصال (و دست دادن TLS) جدید انجام شدند
+                'connections_reused': max(0, self.requests - self.connections_opened),
+                'opened_by_host': dict(self._opened_by_host),
+            }
+
+
+# نمونه مشترک آمار اتصال‌ها
+pool_metrics = PoolMetrics()
+
+
+# کش DNS اتصال‌های مجموعه مشترک؛ resolver سراسری (socket.getaddrinfo) تغییر نمی‌کند و
+# کتابخانه‌هایی که اتصال‌های خود را دارند (yt-dlp، pytube و تلگرام) از resolver سیستم استفاده می‌کنند
+_dns_cache = TTLCache(HTTP_DNS_CACHE_SIZE, HTTP_DNS_CACHE_TTL)
+
+
+def _cached_addresses(host: str, port: int) -> List[str]:
+    """آدرس‌های IP میزبان از کش DNS (یا با resolve و ذخیره در صورت نبود)"""
+    key = f"{host}|{port}"
+    addresses = _dns_cache.get(key)
+    if addresses is None:
+        infos = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        _dns_cache.put(key, addresses)
+    return addresses
+
+
+def dns_stats() -> Dict[str, Any]:
+    """آمار کش DNS"""
+    return _dns_cache.stats()
+
+
+class _CachedDNSConnectionMixin:
+    """ساخت سوکت اتصال با آدرس‌های کش DNS به جای resolve در هر اتصال جدید
+
+    نام میزبان اصلی (برای SNI و بررسی گواهی TLS) تغییر نمی‌کند و فقط آدرس اتصال سوکت
+    از کش خوانده می‌شود؛ آدرس‌ها به ترتیب امتحان می‌شوند.
+    """
+
+    def _new_conn(self):
+        if HTTP_DNS_CACHE_TTL <= 0:
+            return super()._new_conn()
+        host = self._dns_host
+        try:
+            addresses = _cached_addresses(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        last_error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                last_error = e
+            finally:
+                self._dns_host = host
+        raise last_error or NewConnectionError(self, f"هیچ آدرسی برای {host} پیدا نشد")
+
+
+class _MeteredHTTPConnection(_CachedDNSConnectionMixin, HTTPConnection):
+    def connect(self) -> None:
+        pool_metrics.record_connection(self.host)
+        super().connect()
+
+
+class _MeteredHTTPSConnection(_CachedDNSConnectionMixin, HTTPSConnection):
+    def connect(self) -> None:
+        pool_metrics.record_connection(self.host)
+        super().connect()
+
+
+class _MeteredHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _MeteredHTTPConnection
+
+
+class _MeteredHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _MeteredHTTPSConnection
+
+
+class _MeteredPoolManager(PoolManager):
+    """مدیر مجموعه‌های اتصال (یک مجموعه برای هر میزبان) با ثبت آمار"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            'http': _MeteredHTTPConnectionPool,
+            'https': _MeteredHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool_metrics.record_pool_miss()
+        return super()._new_pool(scheme, host, port, request_context)
+
+
+class PooledAdapter(HTTPAdapter):
+    """آداپتور requests با مجموعه اتصال مشترک، اتصال‌های ماندگار و تلاش مجدد یکسان"""
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _MeteredPoolManager(num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs)
+
+    def send(self, request, *args, **kwargs):
+        pool_metrics.record_request()
+        return super().send(request, *args, **kwargs)
+
+
+def _create_retry() -> Retry:
+    """تلاش مجدد با تأخیر نمایی برای خطاهای اتصال و خطاهای موقت سرور
+
+    پاسخ 429 تلاش مجدد نمی‌شود تا مدیریت محدودیت نشست‌های اینستاگرام دست نخورد.
+    """
+    return Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+
+
+# آداپتور مشترک همه نشست‌های HTTP؛ هر میزبان حداکثر HTTP_POOL_PER_HOST اتصال باز نگه می‌دارد
+http_adapter = PooledAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_PER_HOST,
+                             max_retries=_create_retry())
+
+
+def mount_pool(session: requests.Session) -> requests.Session:
+    """استفاده از مجموعه اتصال مشترک در یک نشست requests (کوکی‌ها و هدرهای نشست جدا می‌مانند)"""
+    session.mount('https://', http_adapter)
+    session.mount('http://', http_adapter)
+    return session
+
+
+def close_session(session: requests.Session) -> None:
+    """بستن نشست requests بدون بستن مجموعه اتصال مشترک که نشست‌های دیگر از آن استفاده می‌کنند"""
+    for prefix, adapter in list(session.adapters.items()):
+        if adapter is http_adapter:
+            del session.adapters[prefix]
+    session.close()
+
+
+def new_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    """ساخت نشست requests روی مجموعه اتصال مشترک، برای درخواست‌هایی که کوکی مخصوص خود دارند"""
+    session = mount_pool(requests.Session())
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+# نشست مشترک برای درخواست‌های بدون هویت (دریافت فایل‌ها و API های عمومی)؛
+# کوکی‌ها ذخیره نمی‌شوند تا بین درخواست‌های کاربران مختلف منتقل نشوند
+http = new_session()
+http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
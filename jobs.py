@@ -0,0 +1,251 @@
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from config import (
+    JOB_WORKERS,
+    JOB_QUEUE_MAX,
+    DOWNLOAD_CONCURRENCY,
+    TRANSCODE_CONCURRENCY,
+    UPLOAD_CONCURRENCY
+)
+from deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+
+class JobKind(Enum):
+    """نوع کارهایی که در صف پس‌زمینه اجرا می‌شوند"""
+    YOUTUBE_STREAMS = "youtube_streams"
+    YOUTUBE_VIDEO = "youtube_video"
+    YOUTUBE_AUDIO = "youtube_audio"
+    YOUTUBE_SHORTS_VIDEO = "youtube_shorts_video"
+    YOUTUBE_SHORTS_AUDIO = "youtube_shorts_audio"
+    INSTAGRAM_POST = "instagram_post"
+    INSTAGRAM_VIDEO = "instagram_video"
+    INSTAGRAM_AUDIO = "instagram_audio"
+    YOUTUBE_PLAYLIST = "youtube_playlist"
+    BATCH = "batch"
+
+
+class Stage(Enum):
+    """مراحل خط لوله پردازش که هر کدام محدودیت همزمانی جداگانه دارند"""
+    DOWNLOAD = "download"
+    TRANSCODE = "transcode"
+    UPLOAD = "upload"
+
+
+class JobQueueFullError(Exception):
+    """صف کارها پر است و کار جدیدی پذیرفته نمی‌شود"""
+    pass
+
+
+@dataclass
+class DownloadJob:
+    """یک کار دانلود که توسط هندلرها ساخته و در صف قرار داده می‌شود"""
+    kind: JobKind
+    user_id: int
+    chat_id: int
+    handler: Callable[..., None]
+    args: Tuple[Any, ...] = ()
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    created_at: float = field(default_factory=time.monotonic)
+    # بودجه زمانی درخواست از لحظه ساخت کار (شامل زمان انتظار در صف)
+    deadline: Deadline = field(default_factory=Deadline)
+
+
+class JobManager:
+    """اجرای کارهای دانلود در مجموعه‌ای محدود از کارگرها، جدا از dispatcher تلگرام"""
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_max: int = JOB_QUEUE_MAX,
+                 stage_limits: Optional[Dict[Stage, int]] = None):
+        if stage_limits is None:
+            stage_limits = {
+                Stage.DOWNLOAD: DOWNLOAD_CONCURRENCY,
+                Stage.TRANSCODE: TRANSCODE_CONCURRENCY,
+                Stage.UPLOAD: UPLOAD_CONCURRENCY,
+            }
+        self.workers = max(1, workers)
+        self.queue_max = max(1, queue_max)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download-job")
+        self._stage_semaphores = {
+            stage: threading.BoundedSemaphore(max(1, limit)) for stage, limit in stage_limits.items()
+        }
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, job: DownloadJob) -> Future:
+        """قرار دادن کار در صف و بازگشت فوری بدون انتظار برای اجرا"""
+        with self._lock:
+            if self._pending + self._running >= self.queue_max:
+                logger.warning(f"صف کارها پر است، کار {job.kind.value} برای کاربر {job.user_id} رد شد")
+                raise JobQueueFullError("صف کارها پر است")
+            self._pending += 1
+
+        logger.info(f"کار {job.job_id} از نوع {job.kind.value} برای کاربر {job.user_id} در صف قرار گرفت")
+        return self._executor.submit(contextvars.copy_context().run, self._run, job)
+
+    def _run(self, job: DownloadJob) -> None:
+        """اجرای یک کار در نخ کارگر"""
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+
+        wait_time = time.monotonic() - job.created_at
+        logger.info(f"شروع اجرای کار {job.job_id} ({job.kind.value}) پس از {wait_time:.2f} ثانیه انتظار در صف")
+        started = time.monotonic()
+        failed = False
+        try:
+            # همه مراحل کار (دانلود، تبدیل، آپلود) محدودیت زمانی این درخواست را رعایت می‌کنند
+            with deadline_scope(job.deadline):
+                job.handler(*job.args)
+        except Exception as e:
+            failed = True
+            logger.error(f"خطا در اجرای کار {job.job_id} ({job.kind.value}): {e}")
+            logger.exception("جزئیات خطا:")
+        finally:
+            with self._lock:
+                self._running -= 1
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+            logger.info(f"کار {job.job_id} در {time.monotonic() - started:.2f} ثانیه پایان یافت")
+
+    @contextmanager
+    def stage(self, stage: Stage):
+        """محدود کردن تعداد اجرای همزمان یک مرحله (دانلود، تبدیل یا آپلود)
+
+        انتظار برای نوبت مرحله از زمان باقیمانده درخواست بیشتر نمی‌شود.
+        """
+        semaphore = self._stage_semaphores.get(stage)
+        if semaphore is None:
+            yield
+            return
+        deadline = current_deadline()
+        if not semaphore.acquire(timeout=deadline.timeout()):
+            logger.warning(f"زمان مجاز درخواست در انتظار نوبت مرحله {stage.value} به پایان رسید")
+            raise DeadlineExceededError(f"زمان مجاز در انتظار مرحله {stage.value} به پایان رسید")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        """آمار فعلی صف کارها"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'running': self._running,
+                'completed': self._completed,
+                'failed': self._failed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """توقف کارگرها"""
+        self._executor.shutdown(wait=wait)
+
+
+class _Flight:
+    """وضعیت یک کار در حال اجرا که درخواست‌های تکراری منتظر آن هستند"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.failed = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """یکی کردن درخواست‌های همزمان برای یک محتوای یکسان
+
+    اولین درخواست برای هر کلید کار را انجام می‌دهد و درخواست‌های تکراری همزمان
+    تا پایان آن منتظر می‌مانند و سپس نتیجه (file_id ذخیره شده در کش) را استفاده می‌کنند.
+    اگر کار با خطا تمام شود، یکی از درخواست‌های منتظر مسئول انجام دوباره آن می‌شود.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    @contextmanager
+    def coalesce(self, key: str, timeout: Optional[float] = None) -> Iterator[bool]:
+        """ورود به بخش انحصاری برای یک کلید
+
+        Yields:
+            True اگر این درخواست مسئول انجام کار است، False اگر منتظر درخواست
+            دیگری مانده که با موفقیت تمام شده و اکنون باید نتیجه را از کش بخواند.
+
+        Raises:
+            DeadlineExceededError: اگر کار جاری تا پایان timeout (یا بودجه زمانی درخواست) تمام نشود
+        """
+        flight, leader = self._join(key, timeout)
+        if not leader:
+            yield False
+            return
+
+        try:
+            yield True
+        except BaseException:
+            # درخواست‌های منتظر به جای خواندن کش، مسئول جدیدی برای کار انتخاب می‌کنند
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            if flight.waiters:
+                logger.info(f"دانلود {key} پایان یافت، {flight.waiters} درخواست منتظر آزاد شدند")
+            flight.done.set()
+
+    def _join(self, key: str, timeout: Optional[float]) -> Tuple[_Flight, bool]:
+        """پیوستن به کار جاری برای کلید یا شروع آن در صورت نبود کار موفق"""
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                    self._leaders += 1
+                    return flight, True
+                flight.waiters += 1
+                self._coalesced += 1
+
+            logger.info(f"درخواست تکراری برای {key}، در انتظار پایان دانلود جاری")
+            if expires_at is None:
+                wait = current_deadline().remaining()
+            else:
+                wait = max(0.0, expires_at - time.monotonic())
+            if not flight.done.wait(wait):
+                raise DeadlineExceededError(f"زمان انتظار برای پایان دانلود جاری {key} به پایان رسید")
+            if not flight.failed:
+                return flight, False
+            logger.info(f"دانلود جاری {key} ناموفق بود، انتخاب مسئول جدید برای انجام آن")
+
+    def stats(self) -> Dict[str, int]:
+        """آمار درخواست‌های یکی شده"""
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self._leaders,
+                'coalesced': self._coalesced,
+            }
+
+
+# نمونه مشترک مدیر کارها برای همه هندلرها
+job_manager = JobManager()
+
+# نمونه مشترک برای یکی کردن دانلودهای تکراری همزمان
+in_flight = SingleFlight()
@@ -0,0 +1,136 @@
+import re
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from cache import media_key, content_key
+
+logger = logging.getLogger(__name__)
+
+# پلتفرم‌های پشتیبانی شده (همان نام‌هایی که در کلیدهای کش استفاده می‌شوند)
+PLATFORM_YOUTUBE = 'youtube'
+PLATFORM_INSTAGRAM = 'instagram'
+
+# نوع محتوای هر لینک
+LINK_VIDEO = 'video'
+LINK_SHORTS = 'shorts'
+LINK_PLAYLIST = 'playlist'
+LINK_POST = 'post'
+LINK_REEL = 'reel'
+LINK_TV = 'tv'
+LINK_STORY = 'story'
+
+# الگوی یکپارچه همه لینک‌ها که یک بار کامپایل می‌شود و متن پیام را در یک گذر بررسی می‌کند؛
+# هر شاخه با گروه‌های نام‌دار خود نوع لینک و شناسه محتوا را مشخص می‌کند و شاخه آخر
+# سایر لینک‌ها را (برای پیام «لینک پشتیبانی نشده») می‌یابد. پیش‌نگری ابتدای الگو موقعیت‌هایی را
+# که نمی‌توانند شروع لینک باشند (اکثر حروف متن پیام) بدون امتحان شاخه‌ها رد می‌کند
+_LINK_PATTERN = re.compile(r"""
+    (?=[hwmyi])
+    (?:https?://)?(?:(?:www|m|music)\.)?
+    (?:
+        youtube\.com/shorts/(?P<shorts>[\w-]+)
+      | youtube\.com/playlist\?(?:[^\s#]*?&)?list=(?P<playlist>[\w-]+)
+      | youtube\.com/watch\?
+            (?=(?:[^\s#]*?&)?v=(?P<watch>[\w-]+))
+            (?:(?=(?:[^\s#]*?&)?list=(?P<watch_list>[\w-]+)))?
+            [^\s#]*
+      | youtube\.com/(?:embed|live|v)/(?P<embed>[\w-]+)
+      | youtu\.be/(?P<youtu_be>[\w-]+)
+      | (?:instagram\.com|instagr\.am)/(?:[\w.]+/)?(?P<instagram_kind>p|reels?|tv)/(?P<instagram>[\w-]+)
+      | instagram\.com/stories/(?P<story_user>[\w.]+)/(?P<story>\d+)
+    )
+  | (?P<other>https?://[^\s<>"]+)
+""", re.VERBOSE | re.IGNORECASE)
+
+_INSTAGRAM_KINDS = {'p': LINK_POST, 'reel': LINK_REEL, 'reels': LINK_REEL, 'tv': LINK_TV}
+
+
+@dataclass(frozen=True)
+class MediaLink:
+    """نتیجه تشخیص یک لینک: پلتفرم، نوع محتوا، شناسه یکتا و لینک استاندارد
+
+    برای لینک‌های پشتیبانی نشده platform و kind و media_id برابر None هستند
+    و url همان متن لینک است.
+    """
+    platform: Optional[str]
+    kind: Optional[str]
+    media_id: Optional[str]
+    url: str
+    # شناسه پلی‌لیست برای لینک ویدیویی که داخل یک پلی‌لیست باز شده است
+    playlist_id: Optional[str] = None
+
+    @property
+    def supported(self) -> bool:
+        return self.platform is not None
+
+    @property
+    def content_key(self) -> Optional[str]:
+        """کلید یکتای محتوا (مثلاً youtube:dQw4w9WgXcQ) برای حذف لینک‌های تکراری"""
+        return content_key(self.platform, self.media_id) if self.supported else None
+
+    def cache_key(self, variant: str, kind: str) -> Optional[str]:
+        """کلید کش رسانه این محتوا برای یک کیفیت و نوع خروجی"""
+        return media_key(self.platform, self.media_id, variant, kind) if self.supported else None
+
+
+def _link_from_match(match: 're.Match') -> MediaLink:
+    """ساخت نتیجه تشخیص از گروه‌های نام‌دار الگو
+
+    هر شاخه الگو با گروه نام‌دار مخصوص خود تمام می‌شود، بنابراین lastgroup شاخه تطبیق یافته را
+    بدون ساختن دیکشنری همه گروه‌ها مشخص می‌کند.
+    """
+    branch = match.lastgroup
+    if branch == 'shorts':
+        video_id = match['shorts']
+        return MediaLink(PLATFORM_YOUTUBE, LINK_SHORTS, video_id, f"https://www.youtube.com/shorts/{video_id}")
+    if branch == 'playlist':
+        playlist_id = match['playlist']
+        return MediaLink(PLATFORM_YOUTUBE, LINK_PLAYLIST, playlist_id,
+                         f"https://www.youtube.com/playlist?list={playlist_id}", playlist_id)
+    if branch in ('watch', 'watch_list', 'embed', 'youtu_be'):
+        video_id = match['watch'] or match['embed'] or match['youtu_be']
+        return MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, video_id, f"https://www.youtube.com/watch?v={video_id}",
+                         match['watch_list'])
+    if branch == 'instagram':
+        kind = _INSTAGRAM_KINDS[match['instagram_kind'].lower()]
+        path = 'reel' if kind == LINK_REEL else match['instagram_kind'].lower()
+        shortcode = match['instagram']
+        return MediaLink(PLATFORM_INSTAGRAM, kind, shortcode, f"https://www.instagram.com/{path}/{shortcode}/")
+    if branch == 'story':
+        story_id = match['story']
+        return MediaLink(PLATFORM_INSTAGRAM, LINK_STORY, story_id,
+                         f"https://www.instagram.com/stories/{match['story_user']}/{story_id}/")
+    return MediaLink(None, None, None, match['other'])
+
+
+def find_links(text: str) -> List[MediaLink]:
+    """همه لینک‌های متن به ترتیب ظاهر شدن (شامل لینک‌های پشتیبانی نشده)"""
+    if not text:
+        return []
+    return [_link_from_match(match) for match in _LINK_PATTERN.finditer(text)]
+
+
+def unique_links(links: List[MediaLink]) -> List[MediaLink]:
+    """لینک‌های پشتیبانی شده بدون تکرار محتوا (لینک‌های مختلف یک ویدیو یا پست یک بار می‌آیند)"""
+    seen = set()
+    result = []
+    for link in links:
+        if link.supported and link.content_key not in seen:
+            seen.add(link.content_key)
+            result.append(link)
+    return result
+
+
+def classify_url(url: str) -> Optional[MediaLink]:
+    """تشخیص یک لینک (یا None اگر متن لینک نباشد)"""
+    match = _LINK_PATTERN.search(url or '')
+    return _link_from_match(match) if match else None
+
+
+def media_id_for(url: str, platform: str) -> Optional[str]:
+    """شناسه محتوای یک لینک در پلتفرم مشخص (شناسه ویدیو یا کد کوتاه پست)"""
+    link = classify_url(url)
+    if not link or link.platform != platform or link.kind == LINK_PLAYLIST:
+        logger.warning(f"هیچ شناسه محتوای {platform} در URL پیدا نشد: {url}")
+        return None
+    return link.media_id
@@ -28,6 +28,10 @@ HELP_MESSAGE = """
 - می‌توانید تعداد ویدیوها (3، 5 یا 10) را انتخاب کنید.
 - امکان دانلود ویدیو یا فقط استخراج صدا از ویدیوهای پلی‌لیست وجود دارد.
 
+📋 *ارسال چند لینک با هم*:
+- چند لینک را در یک پیام یا در یک فایل متنی (txt) ارسال کنید.
+- لینک‌ها همزمان دانلود می‌شوند و هر کدام به محض آماده شدن ارسال می‌شود.
+
 🎵 *استخراج صدا*:
 - با ارسال لینک شورتز یا ویدیو، گزینه 'استخراج صدا' را انتخاب کنید تا فقط صدای ویدیو را دریافت کنید.
 - فایل‌های صوتی با فرمت MP3 و کیفیت مناسب استخراج می‌شوند.
@@ -86,17 +90,42 @@ DOWNLOADING_MESSAGE = "در حال دانلود محتوا... ⏳"
 UPLOAD_TO_TELEGRAM = "در حال آپلود به تلگرام... ⏳"
 NETWORK_ERROR = "خطا در اتصال به سرور. ممکن است اینترنت شما دچار مشکل شده باشد یا سرور مقصد در دسترس نباشد. لطفاً بعداً دوباره تلاش کنید. ❌"
 RATE_LIMIT_ERROR = "به دلیل محدودیت سرور، امکان دانلود در حال حاضر وجود ندارد. لطفاً کمی بعد دوباره تلاش کنید. ❌"
+JOB_QUEUED = "درخواست شما در صف پردازش قرار گرفت... ⏳"
+QUEUE_FULL_ERROR = "ربات در حال حاضر درخواست‌های زیادی دارد. لطفاً چند دقیقه دیگر دوباره تلاش کنید. ❌"
+REQUEST_TIMEOUT_ERROR = "زمان مجاز پردازش درخواست به پایان رسید. لطفاً دوباره تلاش کنید. ❌"
+SESSION_EXPIRED_ERROR = "این درخواست منقضی شده است. لطفاً لینک را دوباره ارسال کنید. ❌"
+CONTENT_UNAVAILABLE_ERROR = "این محتوا حذف شده یا در دسترس نیست. ❌"
+CONTENT_PRIVATE_ERROR = "این محتوا خصوصی است و امکان دانلود آن وجود ندارد. ❌"
+CONTENT_REGION_BLOCKED_ERROR = "این محتوا در منطقه سرور ربات مسدود شده است و امکان دانلود آن وجود ندارد. ❌"
+# پیام مربوط به هر دلیل در دسترس نبودن محتوا
+CONTENT_UNAVAILABLE_MESSAGES = {
+    'unavailable': CONTENT_UNAVAILABLE_ERROR,
+    'private': CONTENT_PRIVATE_ERROR,
+    'region_blocked': CONTENT_REGION_BLOCKED_ERROR,
+}
 
 # پیام‌های دانلود صوت
 AUDIO_EXTRACTION_STARTED = "در حال استخراج صدا از ویدیو... ⏳"
 AUDIO_EXTRACTION_SUCCESS = "صدا با موفقیت استخراج شد! ✅"
 AUDIO_EXTRACTION_ERROR = "خطا در استخراج صدا. لطفاً دوباره تلاش کنید. ❌"
+AUDIO_FILE_TOO_LARGE = "حجم فایل صوتی بیشتر از حد مجاز تلگرام است. امکان ارسال وجود ندارد. ❌"
+
+# پیام‌های دانلود گروهی (چند لینک در یک پیام یا فایل متنی)
+BATCH_DOWNLOAD_STARTED = "در حال دانلود {total} لینک... ⏳"
+BATCH_DOWNLOAD_PROGRESS = "{done} از {total} لینک پردازش شد... ⏳"
+BATCH_ITEM_FAILED = "❌ {url}\n{reason}"
+BATCH_DOWNLOAD_SUMMARY = "دانلود گروهی به پایان رسید ✅\nموفق: {succeeded} از {total}\nناموفق: {failed}"
+BATCH_TOO_MANY_LINKS = "فقط {limit} لینک اول پردازش می‌شود. ⚠️"
+BATCH_DOCUMENT_TOO_LARGE = "حجم فایل لینک‌ها بیشتر از حد مجاز است. ❌"
+BATCH_PLAYLIST_SKIPPED = "لینک پلی‌لیست همراه لینک‌های دیگر دانلود نمی‌شود؛ برای دانلود پلی‌لیست، لینک آن را جداگانه ارسال کنید. ⚠️"
 
 # پیام‌های دانلود پلی‌لیست
 PLAYLIST_DOWNLOAD_STARTED = "در حال دانلود پلی‌لیست یوتیوب... ⏳"
 PLAYLIST_DOWNLOAD_SUCCESS = "پلی‌لیست با موفقیت دانلود شد! ✅"
 PLAYLIST_DOWNLOAD_ERROR = "خطا در دانلود پلی‌لیست. لطفاً مطمئن شوید لینک صحیح است و دوباره تلاش کنید. ❌"
 PLAYLIST_FILE_TOO_LARGE = "حجم پلی‌لیست بیشتر از حد مجاز است. لطفاً تعداد ویدیوهای کمتری را انتخاب کنید. ❌"
+PLAYLIST_TYPE_SELECTION = "لطفاً نوع دانلود پلی‌لیست را انتخاب کنید:"
+PLAYLIST_LIMIT_SELECTION = "تعداد ویدیوهای پلی‌لیست را انتخاب کنید:"
 
 # پیام‌های تنظیمات کاربر
 SETTINGS_MESSAGE = """
@@ -0,0 +1,223 @@
+import sqlite3
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from config import (
+    SPECULATIVE_PREFETCH,
+    SPECULATIVE_MAX_ACTIVE,
+    SPECULATIVE_TIMEOUT,
+    SPECULATIVE_MIN_CHOICES,
+    QUALITY_HISTORY_PATH
+)
+from cache import file_id_cache, media_store
+from deadline import Deadline, DeadlineExceededError, deadline_scope
+from jobs import job_manager, in_flight, Stage
+from utils import clean_temp_file
+
+logger = logging.getLogger(__name__)
+
+# انواع منوی انتخاب کیفیت که آمار آنها جداگانه نگهداری می‌شود
+MENU_VIDEO = 'video'
+MENU_SHORTS = 'shorts'
+
+
+def quality_of(label: str) -> str:
+    """کیفیت یک گزینه منو (مثلاً 1280x720 یا 720p) بدون حجم و توضیحات"""
+    return label.split(" ")[0]
+
+
+class QualityHistory:
+    """آمار ماندگار کیفیت‌هایی که کاربران در هر نوع منو انتخاب کرده‌اند"""
+
+    def __init__(self, path: str = QUALITY_HISTORY_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS quality_choices (
+                    menu TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    choices INTEGER NOT NULL,
+                    PRIMARY KEY (menu, quality)
+                )"""
+            )
+
+    def record(self, menu: str, quality: str) -> None:
+        """ثبت یک انتخاب کاربر"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO quality_choices (menu, quality, choices) VALUES (?, ?, 1)
+                   ON CONFLICT (menu, quality) DO UPDATE SET choices = choices + 1""",
+                (menu, quality)
+            )
+
+    def counts(self, menu: str) -> Dict[str, int]:
+        """تعداد انتخاب هر کیفیت در یک نوع منو"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT quality, choices FROM quality_choices WHERE menu = ?", (menu,)
+            ).fetchall()
+        return dict(rows)
+
+
+@dataclass
+class Speculation:
+    """یک دانلود حدسی برای منوی کیفیت یک درخواست"""
+    token: str
+    itag: str
+    cache_key: str
+    deadline: Deadline = field(default_factory=lambda: Deadline(SPECULATIVE_TIMEOUT))
+    cancelled: bool = False
+    stored: bool = False
+
+
+class SpeculativePrefetcher:
+    """دانلود حدسی پرانتخاب‌ترین کیفیت در حالی که کاربر منوی کیفیت را می‌بیند
+
+    نتیجه در کش فایل‌ها ذخیره می‌شود تا اگر کاربر همان کیفیت را انتخاب کند، فقط
+    آپلود باقی بماند. اگر کیفیت دیگری انتخاب شود، دانلود لغو و نتیجه آن حذف می‌شود.
+    تعداد دانلودهای حدسی همزمان محدود است و در صورت پر بودن ظرفیت، حدسی زده نمی‌شود.
+    """
+
+    def __init__(self, enabled: bool = SPECULATIVE_PREFETCH, max_active: int = SPECULATIVE_MAX_ACTIVE,
+                 min_choices: int = SPECULATIVE_MIN_CHOICES, history: Optional[QualityHistory] = None):
+        self.enabled = enabled
+        self.min_choices = min_choices
+        self.history = history or QualityHistory()
+        self._slots = threading.BoundedSemaphore(max(1, max_active))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_active), thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._active: Dict[str, Speculation] = {}
+        self._kept = 0
+        self._wasted = 0
+
+    def _predict(self, menu: str, streams: Dict[str, Tuple[str, int]]) -> Optional[str]:
+        """itag پرانتخاب‌ترین کیفیت موجود در منو بر اساس آمار (یا None اگر آمار کافی نباشد)"""
+        counts = self.history.counts(menu)
+        if sum(counts.values()) < self.min_choices:
+            return None
+        options = [(counts.get(quality_of(label), 0), str(itag)) for label, (itag, _) in streams.items()]
+        best_count, best_itag = max(options, default=(0, None))
+        return best_itag if best_count else None
+
+    def start(self, token: str, menu: str, streams: Dict[str, Tuple[str, int]],
+              cache_key_for: Callable[[str], Optional[str]], download: Callable[[str], str]) -> None:
+        """شروع دانلود حدسی پس از نمایش منوی کیفیت
+
+        Args:
+            token: شناسه نشست درخواستی که منوی آن نمایش داده شده
+            menu: نوع منو (ویدیو یا شورتز)
+            streams: گزینه‌های منو (عنوان: (itag، حجم))
+            cache_key_for: ساخت کلید کش رسانه برای یک itag
+            download: دانلود یک itag و بازگشت مسیر فایل
+        """
+        self.cancel(token)
+        if not self.enabled or not streams:
+            return
+        self._forget_expired()
+        itag = self._predict(menu, streams)
+        cache_key = cache_key_for(itag) if itag else None
+        if not cache_key or file_id_cache.contains(cache_key) or media_store.contains(cache_key):
+            return
+        if not self._slots.acquire(blocking=False):
+            logger.info(f"ظرفیت دانلود حدسی پر است، برای درخواست {token} حدسی زده نمی‌شود")
+            return
+
+        speculation = Speculation(token, itag, cache_key)
+        with self._lock:
+            self._active[token] = speculation
+        logger.info(f"شروع دانلود حدسی {cache_key} برای درخواست {token}")
+        self._executor.submit(contextvars.copy_context().run, self._run, speculation, download)
+
+    def _run(self, speculation: Speculation, download: Callable[[str], str]) -> None:
+        """اجرای دانلود حدسی در نخ جداگانه با بودجه زمانی خودش"""
+        output_file = ""
+        try:
+            with deadline_scope(speculation.deadline):
+                # اگر کاربر زودتر انتخاب کرده باشد، دانلود اصلی منتظر همین دانلود می‌ماند
+                with in_flight.coalesce(speculation.cache_key) as leader:
+                    if not leader or speculation.cancelled:
+                        return
+                    with job_manager.stage(Stage.DOWNLOAD):
+                        output_file = download(speculation.itag)
+                    if output_file and not speculation.cancelled:
+                        media_store.store_file(speculation.cache_key, output_file)
+                        speculation.stored = True
+                        logger.info(f"دانلود حدسی {speculation.cache_key} پایان یافت")
+                        # کاربر در حین ذخیره کیفیت دیگری را انتخاب کرده است
+                        if speculation.cancelled:
+                            media_store.invalidate(speculation.cache_key)
+        except DeadlineExceededError:
+            logger.info(f"دانلود حدسی {speculation.cache_key} لغو شد یا زمان آن به پایان رسید")
+        except Exception as e:
+            logger.warning(f"خطا در دانلود حدسی {speculation.cache_key}: {e}")
+        finally:
+            if output_file:
+                clean_temp_file(output_file)
+            self._slots.release()
+            # دانلود ناموفق دیگر نیازی به تصمیم‌گیری هنگام انتخاب کاربر ندارد
+            with self._lock:
+                if self._active.get(speculation.token) is speculation and not speculation.stored:
+                    del self._active[speculation.token]
+
+    def resolve(self, token: str, menu: str, itag: str, streams: Optional[Dict[str, Tuple[str, int]]]) -> None:
+        """ثبت انتخاب کاربر و نگه داشتن یا لغو دانلود حدسی مربوط به آن"""
+        if streams:
+            for label, (stream_itag, _) in streams.items():
+                if str(stream_itag) == str(itag):
+                    self.history.record(menu, quality_of(label))
+                    break
+
+        with self._lock:
+            speculation = self._active.pop(token, None)
+        if speculation is None:
+            return
+        if speculation.itag == str(itag):
+            with self._lock:
+                self._kept += 1
+            logger.info(f"در درخواست {token} همان کیفیت حدسی انتخاب شد، از نتیجه دانلود حدسی استفاده می‌شود")
+            return
+        with self._lock:
+            self._wasted += 1
+        self._discard(speculation)
+
+    def cancel(self, token: str) -> None:
+        """لغو دانلود حدسی یک درخواست (مثلاً با بازگشت از منوی کیفیت)"""
+        with self._lock:
+            speculation = self._active.pop(token, None)
+        if speculation is not None:
+            self._discard(speculation)
+
+    def _forget_expired(self) -> None:
+        """کنار گذاشتن دانلودهای حدسی منوهایی که پس از پایان مهلت آنها انتخابی نشده است
+
+        نتیجه ذخیره شده آنها مانند هر دانلود دیگری در کش فایل‌ها باقی می‌ماند.
+        """
+        with self._lock:
+            for token in [token for token, item in self._active.items() if item.deadline.expired]:
+                del self._active[token]
+
+    def _discard(self, speculation: Speculation) -> None:
+        """توقف دانلود حدسی و حذف نتیجه استفاده نشده آن از کش"""
+        speculation.cancelled = True
+        speculation.deadline.cancel()
+        if speculation.stored:
+            media_store.invalidate(speculation.cache_key)
+        logger.info(f"دانلود حدسی {speculation.cache_key} کنار گذاشته شد")
+
+    def stats(self) -> Dict[str, int]:
+        """آمار دانلودهای حدسی"""
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'kept': self._kept,
+                'wasted': self._wasted,
+            }
+
+
+# نمونه مشترک دانلود حدسی
+prefetcher = SpeculativePrefetcher()
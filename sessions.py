@@ -0,0 +1,201 @@
+import json
+import time
+import secrets
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import SESSION_BACKEND, SESSION_TTL, SESSION_MAX_ENTRIES, SESSION_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# نوع‌های ذخیره‌ساز نشست درخواست‌ها
+BACKEND_MEMORY = 'memory'
+BACKEND_SQLITE = 'sqlite'
+
+# طول شناسه هر درخواست (بایت تصادفی؛ در callback_data به شکل hex با دو برابر این طول می‌آید)
+TOKEN_BYTES = 5
+# جداکننده بخش‌های callback_data دکمه‌ها (عملیات، شناسه نشست و پارامترها)
+CALLBACK_SEPARATOR = ':'
+
+
+def callback_data(action: str, token: str, *args: Any) -> str:
+    """داده کوتاه دکمه اینلاین (به جای لینک کامل، همیشه زیر سقف 64 بایت تلگرام)"""
+    return CALLBACK_SEPARATOR.join([action, token, *(str(arg) for arg in args)])
+
+
+def parse_callback_data(data: str) -> Tuple[str, Optional[str], List[str]]:
+    """جدا کردن عملیات، شناسه نشست (یا None برای دکمه‌های قالب قدیمی) و پارامترهای داده دکمه"""
+    action, *rest = data.split(CALLBACK_SEPARATOR)
+    if not rest:
+        return action, None, []
+    return action, rest[0], rest[1:]
+
+
+class MemorySessionBackend:
+    """نگهداری نشست‌ها در حافظه با ترتیب انقضا
+
+    رکوردها به ترتیب زمان ذخیره نگهداری می‌شوند، بنابراین رکوردهای منقضی و قدیمی‌ترین
+    رکورد (هنگام پر شدن ظرفیت) همیشه در ابتدای لیست هستند و با O(1) حذف می‌شوند.
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] < time.time():
+                return None
+            return dict(entry[1])
+
+    def save(self, token: str, record: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._entries[token] = (expires_at, dict(record))
+            self._entries.move_to_end(token)
+            now = time.time()
+            while self._entries:
+                oldest_expires_at = next(iter(self._entries.values()))[0]
+                if oldest_expires_at >= now and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def count(self) -> int:
+        with self._lock:
+            # رکوردهای منقضی در ابتدای لیست هستند و در شمارش نشست‌های فعال حساب نمی‌شوند
+            now = time.time()
+            while self._entries and next(iter(self._entries.values()))[0] < now:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+
+class SQLiteSessionBackend:
+    """نگهداری نشست‌ها در SQLite تا پس از راه‌اندازی مجدد باقی بمانند و بین چند پردازه مشترک باشند"""
+
+    # هر چند بار ذخیره، ظرفیت حداکثر بررسی می‌شود
+    CAPACITY_CHECK_INTERVAL = 100
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_entries: int = SESSION_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._conn:
+            # حالت WAL برای خواندن و نوشتن همزمان از چند پردازه
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS request_sessions (
+                    token TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS request_sessions_expires_at ON request_sessions (expires_at)"
+            )
+        logger.info(f"ذخیره‌ساز نشست درخواست‌ها در مسیر {path} آماده شد")
+
+    def load(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM request_sessions WHERE token = ? AND expires_at >= ?", (token, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, token: str, record: Dict[str, Any], expires_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO request_sessions (token, data, expires_at) VALUES (?, ?, ?)",
+                (token, json.dumps(record, ensure_ascii=False), expires_at)
+            )
+            # حذف رکوردهای منقضی با استفاده از ایندکس زمان انقضا
+            self._conn.execute("DELETE FROM request_sessions WHERE expires_at < ?", (time.time(),))
+            self._saves += 1
+            if self._saves % self.CAPACITY_CHECK_INTERVAL == 0:
+                self._conn.execute(
+                    """DELETE FROM request_sessions WHERE token IN (
+                        SELECT token FROM request_sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,)
+                )
+
+    def delete(self, token: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM request_sessions WHERE token = ?", (token,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM request_sessions WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+
+
+class SessionStore:
+    """وضعیت هر درخواست کاربر (لینک، استریم‌ها، چت) با شناسه کوتاه و تصادفی
+
+    هر لینک ارسال شده نشست جداگانه‌ای دارد، بنابراین چند درخواست همزمان یک کاربر
+    جایگزین یکدیگر نمی‌شوند. نشست‌های رها شده پس از ttl ثانیه منقضی می‌شوند.
+    رکوردها باید قابل تبدیل به JSON باشند.
+    """
+
+    def __init__(self, backend: Any, ttl: int = SESSION_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def create(self, user_id: int, chat_id: int, **data) -> str:
+        """ایجاد نشست جدید برای یک درخواست و بازگشت شناسه آن"""
+        token = secrets.token_hex(TOKEN_BYTES)
+        record = {'user_id': user_id, 'chat_id': chat_id, **data}
+        self.backend.save(token, record, time.time() + self.ttl)
+        logger.info(f"نشست {token} برای کاربر {user_id} ایجاد شد")
+        return token
+
+    def get(self, token: str, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """دریافت نشست (یا None اگر وجود نداشته باشد، منقضی شده یا متعلق به کاربر دیگری باشد)"""
+        record = self.backend.load(token)
+        if record is None:
+            logger.warning(f"نشست {token} یافت نشد یا منقضی شده است")
+            return None
+        if user_id is not None and record.get('user_id') != user_id:
+            logger.warning(f"نشست {token} متعلق به کاربر {user_id} نیست")
+            return None
+        return record
+
+    def update(self, token: str, **data) -> bool:
+        """به‌روزرسانی فیلدهای نشست و تمدید زمان انقضای آن"""
+        record = self.backend.load(token)
+        if record is None:
+            return False
+        record.update(data)
+        self.backend.save(token, record, time.time() + self.ttl)
+        return True
+
+    def delete(self, token: str) -> None:
+        """حذف نشست پس از پایان درخواست"""
+        self.backend.delete(token)
+
+    def stats(self) -> Dict[str, int]:
+        """تعداد نشست‌های فعال"""
+        return {'active': self.backend.count()}
+
+
+def create_backend(name: str = SESSION_BACKEND) -> Any:
+    """ساخت ذخیره‌ساز نشست بر اساس تنظیمات"""
+    if name == BACKEND_SQLITE:
+        return SQLiteSessionBackend()
+    if name != BACKEND_MEMORY:
+        logger.warning(f"ذخیره‌ساز نشست ناشناخته {name}، از حافظه استفاده می‌شود")
+    return MemorySessionBackend()
+
+
+# نمونه مشترک ذخیره‌ساز نشست درخواست‌ها
+session_store = SessionStore(create_backend())
@@ -0,0 +1,130 @@
+import uuid
+import queue
+import logging
+import threading
+import contextvars
+from typing import Any, Dict, Iterator, Optional
+
+from telegram import Message
+from telegram.error import TelegramError
+
+from config import STREAMING_BUFFER_SIZE, HTTP_TIMEOUT
+from deadline import current_deadline
+from http_pool import http
+from downloader.size_guard import SizeGuard
+
+logger = logging.getLogger(__name__)
+
+# اندازه هر بسته خوانده شده از منبع
+CHUNK_SIZE = 64 * 1024
+# پایان جریان داده
+_END = object()
+
+
+class StreamBuffer:
+    """بافر محدود بین دریافت از منبع و آپلود به تلگرام
+
+    دریافت در نخ جداگانه انجام می‌شود و اگر آپلود عقب بماند، تا خالی شدن بافر صبر می‌کند.
+    خطای دریافت در سمت آپلود دوباره ایجاد می‌شود تا درخواست آپلود نیمه‌کاره رها شود.
+    """
+
+    def __init__(self, url: str, headers: Dict[str, str], size_guard: SizeGuard,
+                 buffer_size: int = STREAMING_BUFFER_SIZE):
+        self.url = url
+        self.headers = headers
+        self.size_guard = size_guard
+        self.received = 0
+        self._chunks: queue.Queue = queue.Queue(maxsize=max(1, buffer_size // CHUNK_SIZE))
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._produce,),
+                                        name="stream-download", daemon=True)
+
+    def start(self) -> 'StreamBuffer':
+        self._thread.start()
+        return self
+
+    def _put(self, item: Any) -> None:
+        """افزودن به بافر؛ اگر آپلود متوقف شده باشد، دریافت هم متوقف می‌شود"""
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise IOError("آپلود متوقف شده است")
+
+    def _produce(self) -> None:
+        try:
+            with http.get(self.url, headers=self.headers, stream=True,
+                          timeout=current_deadline().timeout(HTTP_TIMEOUT)) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self.received += len(chunk)
+                    self.size_guard.update(self.url, self.received)
+                    self._put(chunk)
+            self._put(_END)
+        except Exception as e:
+            if not self._closed.is_set():
+                self._put(e)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            try:
+                item = self._chunks.get(timeout=current_deadline().timeout(HTTP_TIMEOUT))
+            except queue.Empty:
+                raise IOError(f"داده‌ای از منبع در {HTTP_TIMEOUT} ثانیه دریافت نشد")
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        """توقف دریافت (در صورت پایان یا شکست آپلود)"""
+        self._closed.set()
+
+
+def _multipart_body(boundary: str, fields: Dict[str, str], file_field: str, filename: str,
+                    content_type: str, content: Iterator[bytes]) -> Iterator[bytes]:
+    """بدنه multipart/form-data که محتوای فایل آن همزمان با دریافت ساخته می‌شود"""
+    for name, value in fields.items():
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode()
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+           f'Content-Type: {content_type}\r\n\r\n').encode()
+    yield from content
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+def stream_video_upload(bot: Any, chat_id: int, source_url: str, headers: Optional[Dict[str, str]] = None,
+                        filename: str = "video.mp4") -> Message:
+    """ارسال ویدیو به تلگرام همزمان با دریافت آن از منبع، بدون نوشتن روی دیسک
+
+    آپلود با اولین بسته‌های دریافت شده شروع می‌شود (بدنه درخواست به صورت chunked ارسال می‌شود)
+    و حداکثر STREAMING_BUFFER_SIZE بایت در حافظه منتظر آپلود می‌ماند.
+
+    Raises:
+        FileTooLargeError: اگر حجم دریافت شده از سقف تلگرام عبور کند
+        TelegramError: اگر تلگرام ویدیو را نپذیرد
+    """
+    size_guard = SizeGuard()
+    source = StreamBuffer(source_url, headers or {}, size_guard).start()
+    boundary = uuid.uuid4().hex
+    fields = {'chat_id': str(chat_id), 'supports_streaming': 'true'}
+    try:
+        response = http.post(
+            f"{bot.base_url}/sendVideo",
+            data=_multipart_body(boundary, fields, 'video', filename, 'video/mp4', iter(source)),
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            timeout=current_deadline().timeout()
+        )
+    except Exception:
+        size_guard.raise_if_exceeded()
+        raise
+    finally:
+        source.close()
+
+    result = response.json()
+    if not result.get('ok'):
+        raise TelegramError(result.get('description') or f"خطای آپلود جریانی: {response.status_code}")
+    logger.info(f"ویدیو به صورت جریانی ارسال شد ({source.received} بایت)")
+    return Message.de_json(result['result'], bot)
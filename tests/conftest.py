@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# ماژول config در زمان import توکن و مسیر کش را می‌خواند؛ تست‌ها با مقادیر موقت اجرا می‌شوند
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bot-test-cache-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
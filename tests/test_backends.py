@@ -0,0 +1,122 @@
+import time
+import threading
+
+import pytest
+
+from deadline import Deadline, deadline_scope
+from downloader.backends import BackendRegistry, CircuitState
+from downloader.errors import ContentUnavailableError, REASON_UNAVAILABLE
+
+
+def _registry(**kwargs):
+    options = dict(window=4, min_attempts=2, failure_threshold=0.5, open_seconds=60)
+    options.update(kwargs)
+    return BackendRegistry(**options)
+
+
+def test_circuit_opens_after_failures_and_backend_is_skipped():
+    registry = _registry()
+    registry.record('a', False, 1.0)
+    assert registry.ordered(['a', 'b']) == ['a', 'b']
+    registry.record('a', False, 1.0)
+
+    assert registry.stats()['a']['state'] == CircuitState.OPEN.value
+    assert registry.ordered(['a', 'b']) == ['b']
+
+
+def test_half_open_allows_one_probe_and_success_closes_circuit():
+    registry = _registry(open_seconds=0.05)
+    registry.record('a', False, 1.0)
+    registry.record('a', False, 1.0)
+    time.sleep(0.06)
+
+    assert registry._acquire('a', forced=False)
+    # تلاش آزمایشی دوم تا مشخص شدن نتیجه تلاش اول مجاز نیست
+    assert not registry._acquire('a', forced=False)
+    registry.record('a', True, 0.5)
+
+    assert registry.stats()['a']['state'] == CircuitState.CLOSED.value
+    assert registry.ordered(['a']) == ['a']
+
+
+def test_all_open_still_returns_best_backend():
+    registry = _registry()
+    for name, results in (('a', [False, False]), ('b', [True, False, False, False])):
+        for ok in results:
+            registry.record(name, ok, 1.0)
+
+    assert registry.ordered(['a', 'b']) == ['b']
+
+
+def test_healthy_faster_backend_is_tried_first():
+    registry = _registry()
+    for _ in range(2):
+        registry.record('slow', True, 5.0)
+        registry.record('fast', True, 1.0)
+
+    assert registry.ordered(['slow', 'fast']) == ['fast', 'slow']
+
+
+def test_run_falls_back_and_final_errors_stop_the_chain():
+    registry = _registry()
+    with deadline_scope(Deadline(5)):
+        assert registry.run("test", [('a', lambda: None), ('b', lambda: "ok")]) == "ok"
+
+        def unavailable():
+            raise ContentUnavailableError(REASON_UNAVAILABLE)
+
+        with pytest.raises(ContentUnavailableError):
+            registry.run("test", [('c', unavailable), ('b', lambda: "ok")])
+
+    stats = registry.stats()
+    assert stats['a']['failures'] == 1
+    assert stats['b']['attempts'] == 1
+    # خطای محتوا در آمار روش ثبت نمی‌شود
+    assert stats['c']['attempts'] == 0
+
+
+def test_race_starts_backup_after_hedge_delay_and_discards_loser():
+    registry = _registry()
+    release = threading.Event()
+    discarded = []
+
+    def slow(signal):
+        release.wait(5)
+        return "slow"
+
+    def fast(signal):
+        return "fast"
+
+    with deadline_scope(Deadline(5)):
+        result = registry.race("test", [('slow', slow), ('fast', fast)], hedge_delay=0.05,
+                               discard=discarded.append)
+    release.set()
+    for _ in range(100):
+        if discarded:
+            break
+        time.sleep(0.01)
+
+    assert result == "fast"
+    # تلاش بازنده پس از لغو نتیجه‌ای داده که باید پاک شود
+    assert discarded == ["slow"]
+
+
+def test_race_does_not_hedge_once_download_started():
+    registry = _registry()
+    started = []
+
+    def primary(signal):
+        signal.mark_started()
+        time.sleep(0.2)
+        return "primary"
+
+    def backup(signal):
+        started.append(True)
+        return "backup"
+
+    with deadline_scope(Deadline(5)):
+        result = registry.race("test", [('primary', primary), ('backup', backup)], hedge_delay=0.02,
+                               discard=lambda result: None)
+
+    assert result == "primary"
+    assert not started
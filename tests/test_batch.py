@@ -0,0 +1,29 @@
+from batch import run_batch
+from config import REQUEST_DEADLINE
+from deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+
+
+def test_item_budget_is_bounded_by_parent_deadline():
+    budgets = []
+    with deadline_scope(Deadline(5)):
+        run_batch([1, 2], lambda item: budgets.append(current_deadline().budget), concurrency=2)
+
+    assert len(budgets) == 2
+    assert all(0 < budget <= 5 for budget in budgets)
+
+
+def test_item_gets_full_budget_when_parent_has_more_time():
+    budgets = []
+    with deadline_scope(Deadline(REQUEST_DEADLINE * 10)):
+        run_batch([1], lambda item: budgets.append(current_deadline().budget))
+
+    assert budgets == [REQUEST_DEADLINE]
+
+
+def test_cancelled_parent_stops_remaining_items():
+    parent = Deadline()
+    parent.cancel()
+    with deadline_scope(parent):
+        results = run_batch([1, 2, 3], lambda item: current_deadline().check())
+
+    assert all(isinstance(result.error, DeadlineExceededError) for result in results)
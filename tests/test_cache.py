@@ -0,0 +1,102 @@
+import os
+import time
+import uuid
+
+import pytest
+
+import cache
+from cache import MediaStore, NegativeCache, media_key
+from downloader.errors import (
+    ContentUnavailableError,
+    FileTooLargeError,
+    REASON_PRIVATE,
+    REASON_TOO_LARGE,
+    REASON_UNAVAILABLE,
+)
+
+
+def test_recover_only_removes_files_it_owns(tmp_path):
+    key = media_key('youtube', 'dQw4w9WgXcQ', '720p', 'video')
+    source = tmp_path / "source.mp4"
+    source.write_bytes(b"video")
+    cache_dir = tmp_path / "media"
+    MediaStore(str(cache_dir), max_bytes=1024 * 1024).store_file(key, str(source))
+
+    # فایل موقت نیمه‌کاره و فایل کش بدون رکورد (مثلاً پس از قطع ناگهانی برنامه)
+    stale_temp = cache_dir / f".{uuid.uuid4()}.tmp"
+    stale_temp.write_bytes(b"partial")
+    orphan = cache_dir / f"{'a' * 64}.mp4"
+    orphan.write_bytes(b"orphan")
+    # فایل‌هایی که کش نساخته است
+    foreign = [cache_dir / "notes.txt", cache_dir / "video.mp4", cache_dir / ".keep"]
+    for path in foreign:
+        path.write_bytes(b"keep")
+
+    store = MediaStore(str(cache_dir), max_bytes=1024 * 1024)
+
+    assert not stale_temp.exists()
+    assert not orphan.exists()
+    assert all(path.exists() for path in foreign)
+    checked_out = store.checkout_file(key)
+    try:
+        with open(checked_out, 'rb') as f:
+            assert f.read() == b"video"
+    finally:
+        os.remove(checked_out)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_negative_cache_uses_ttl_of_each_reason(tmp_path, clock):
+    negative = NegativeCache(str(tmp_path / "negative.sqlite3"),
+                             ttls={REASON_PRIVATE: 60, REASON_UNAVAILABLE: 600})
+    negative.put("private", REASON_PRIVATE, "خصوصی")
+    negative.put("removed", REASON_UNAVAILABLE)
+
+    clock[0] += 61
+    assert negative.get("private") is None
+    assert negative.get("removed") == (REASON_UNAVAILABLE, "")
+
+    clock[0] += 540
+    assert negative.get("removed") is None
+    assert negative.stats() == {'hits': 1, 'entries': 0}
+
+
+def test_negative_cache_skips_reasons_without_ttl(tmp_path, clock):
+    negative = NegativeCache(str(tmp_path / "negative.sqlite3"), ttls={REASON_PRIVATE: 60})
+    negative.put("removed", REASON_UNAVAILABLE)
+
+    assert negative.get("removed") is None
+
+
+def test_negative_cache_guard_stores_and_replays_failures(tmp_path, clock):
+    negative = NegativeCache(str(tmp_path / "negative.sqlite3"),
+                             ttls={REASON_UNAVAILABLE: 600, REASON_TOO_LARGE: 60})
+
+    with pytest.raises(ContentUnavailableError):
+        with negative.guard("content", "content/720p"):
+            raise ContentUnavailableError(REASON_UNAVAILABLE, "removed")
+    with pytest.raises(FileTooLargeError):
+        with negative.guard("other", "other/1080p"):
+            raise FileTooLargeError(200, 100)
+
+    with pytest.raises(ContentUnavailableError) as unavailable:
+        with negative.guard("content", "content/360p"):
+            pytest.fail("محتوای حذف شده نباید دوباره دریافت شود")
+    assert unavailable.value.reason == REASON_UNAVAILABLE
+    with pytest.raises(FileTooLargeError) as too_large:
+        with negative.guard("other", "other/1080p"):
+            pytest.fail("فرمت بیش از حد بزرگ نباید دوباره دریافت شود")
+    assert (too_large.value.received, too_large.value.limit) == (200, 100)
+
+    # خطای حجم فقط برای همان فرمت ذخیره می‌شود و تا پایان مدت اعتبار آن باقی است
+    with negative.guard("other", "other/360p"):
+        pass
+    clock[0] += 61
+    with negative.guard("other", "other/1080p"):
+        pass
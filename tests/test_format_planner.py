@@ -0,0 +1,73 @@
+from downloader.format_planner import (
+    BITRATE_ESTIMATE_MARGIN,
+    SIZE_APPROX,
+    SIZE_BITRATE,
+    SIZE_EXACT,
+    estimate_format_size,
+    plan_formats,
+)
+
+MB = 1024 * 1024
+
+
+def _video(format_id, height, acodec='none', **size):
+    return {'format_id': format_id, 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': acodec,
+            'width': height * 16 // 9, 'height': height, **size}
+
+
+def _audio(format_id, abr, **size):
+    return {'format_id': format_id, 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': abr, **size}
+
+
+def test_estimate_prefers_exact_then_approx_then_bitrate():
+    assert estimate_format_size({'filesize': 10, 'filesize_approx': 20, 'tbr': 1000}, 60) == (10, SIZE_EXACT)
+    assert estimate_format_size({'filesize_approx': 20, 'tbr': 1000}, 60) == (20, SIZE_APPROX)
+    # tbr بر حسب کیلوبیت بر ثانیه و با ضریب اطمینان
+    assert estimate_format_size({'tbr': 800}, 60) == (int(800 * 1000 / 8 * 60 * BITRATE_ESTIMATE_MARGIN),
+                                                      SIZE_BITRATE)
+    assert estimate_format_size({'vbr': 600, 'abr': 200}, 60) == estimate_format_size({'tbr': 800}, 60)
+    assert estimate_format_size({'tbr': 800}, None) == (None, None)
+
+
+def test_plan_chooses_best_quality_under_size_limit():
+    info = {'id': 'abc', 'duration': 60, 'formats': [
+        _video('137', 1080, filesize=60 * MB),
+        _video('136', 720, filesize=30 * MB),
+        _video('18', 360, acodec='mp4a', filesize=8 * MB),
+        _audio('140', 128, filesize=2 * MB),
+        _audio('139', 48, filesize=1 * MB),
+    ]}
+
+    plan = plan_formats(info, max_size=50 * MB)
+
+    # 1080p حتی با کم‌حجم‌ترین صدا از سقف بیشتر است
+    assert plan.chosen.format_id == '136+140'
+    assert plan.chosen.is_merged
+    assert plan.chosen.estimated_size == 32 * MB
+    assert plan.find('137+139').estimated_size == 61 * MB
+    assert [c.format_id for c in plan.fitting] == ['136+140', '136+139', '18']
+    assert not plan.find('18').is_merged
+
+
+def test_merged_size_source_is_least_precise_part():
+    info = {'id': 'abc', 'duration': 100, 'formats': [
+        _video('136', 720, filesize_approx=10 * MB),
+        _audio('140', 128, filesize=1 * MB),
+    ]}
+
+    assert plan_formats(info).find('136+140').size_source == SIZE_APPROX
+
+
+def test_plan_without_fitting_format_has_no_choice():
+    info = {'id': 'abc', 'duration': 60, 'formats': [_video('18', 360, acodec='mp4a', filesize=80 * MB)]}
+
+    plan = plan_formats(info, max_size=50 * MB)
+
+    assert plan.chosen is None
+    assert plan.candidates and not plan.fitting
+
+
+def test_formats_without_size_estimate_are_skipped():
+    info = {'id': 'abc', 'duration': None, 'formats': [_video('22', 720, acodec='mp4a', tbr=2000)]}
+
+    assert plan_formats(info).candidates == []
@@ -0,0 +1,52 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import http_pool
+from http_pool import http, pool_metrics
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: هر درخواست اتصال خود را می‌بندد و درخواست بعدی اتصال تازه باز می‌کند
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_dns_cache_is_scoped_to_pooled_connections(server, monkeypatch):
+    assert socket.getaddrinfo is http_pool.socket.getaddrinfo
+    assert socket.getaddrinfo.__module__ == "socket"
+
+    lookups = []
+    resolve = socket.getaddrinfo
+
+    def counting_getaddrinfo(host, *args, **kwargs):
+        lookups.append(host)
+        return resolve(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting_getaddrinfo)
+    url = f"http://localhost:{server.server_address[1]}/"
+    opened = pool_metrics.stats()['connections_opened']
+    for _ in range(3):
+        assert http.get(url, timeout=5).content == b"ok"
+
+    # سه اتصال جدید باز شده ولی نام میزبان فقط یک بار resolve شده است
+    assert pool_metrics.stats()['connections_opened'] - opened == 3
+    assert lookups.count("localhost") == 1
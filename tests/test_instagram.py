@@ -0,0 +1,128 @@
+import os
+import tracemalloc
+
+import pytest
+
+import downloader.instagram as instagram
+from http_pool import http_adapter
+from downloader.instagram import InstagramDownloader, LoaderContext, LoaderPool
+from downloader.instagram_sessions import InstagramSession
+
+CHUNK = 64 * 1024
+TOTAL_CHUNKS = 384  # 24 مگابایت
+PEAK_LIMIT = 4 * 1024 * 1024
+
+
+class _FakeResponse:
+    """پاسخ جریانی ساختگی که فایل بزرگ را بسته به بسته تولید می‌کند"""
+
+    status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for index in range(TOTAL_CHUNKS):
+            yield bytes([index % 256]) * chunk_size
+
+
+class _FakeHttp:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def get(self, url, **kwargs):
+        if self.fail:
+            raise IOError("direct fetch failed")
+        return _FakeResponse()
+
+
+class _FakeLoader:
+    """جایگزین instaloader که فایل بزرگ پست را بسته به بسته روی دیسک می‌نویسد"""
+
+    def __init__(self):
+        self.context = None
+        self.dirname_pattern = None
+
+    def download_post(self, post, target):
+        target_dir = os.path.join(self.dirname_pattern, target)
+        os.makedirs(target_dir)
+        with open(os.path.join(target_dir, f"{target}.mp4"), 'wb') as video_file:
+            for index in range(TOTAL_CHUNKS):
+                video_file.write(bytes([index % 256]) * CHUNK)
+
+
+class _FakeSession:
+    name = "test"
+
+    def mark_rate_limited(self):
+        pass
+
+
+class _FakeContext:
+    def __init__(self, direct_fetch_fails):
+        self.session = _FakeSession()
+        self.http = _FakeHttp(fail=direct_fetch_fails)
+        self.loader = _FakeLoader()
+
+
+class _FakePost:
+    typename = 'GraphVideo'
+    is_video = True
+    video_url = "https://example.com/video.mp4"
+    shortcode = "ABC123"
+    mediaid = 1
+
+
+@pytest.mark.parametrize("direct_fetch_fails", [False, True], ids=["direct-fetch", "instaloader-fallback"])
+def test_post_download_keeps_memory_flat(monkeypatch, direct_fetch_fails):
+    monkeypatch.setattr(instagram.instaloader.Post, "from_shortcode", lambda context, shortcode: _FakePost())
+    downloader = InstagramDownloader(pool_size=1)
+    context = _FakeContext(direct_fetch_fails)
+
+    tracemalloc.start()
+    try:
+        files = downloader._download_post_with_context(context, "https://www.instagram.com/p/ABC123/", "ABC123")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    try:
+        assert len(files) == 1
+        assert os.path.getsize(files[0]) == TOTAL_CHUNKS * CHUNK
+        # فایل بسته به بسته نوشته و با os.replace منتقل شده، نه یک جا در حافظه خوانده شده
+        assert peak < PEAK_LIMIT
+    finally:
+        downloader.clean_up(files)
+
+
+def test_evicted_context_is_closed():
+    limited, healthy = InstagramSession("limited"), InstagramSession("healthy")
+    pool = LoaderPool(size=1, sessions=[limited, healthy])
+    with pool.lease() as context:
+        assert context.session is limited
+    closed = []
+    context.close = lambda: closed.append(context)
+    limited.mark_rate_limited()
+
+    # تنها جای ساخت زمینه با کنار گذاشتن زمینه آزاد نشست محدود شده به دست می‌آید
+    with pool.lease() as replacement:
+        assert replacement.session is healthy
+    assert closed == [context]
+
+
+def test_context_close_keeps_shared_pool_open():
+    context = LoaderContext(1, InstagramSession("test"))
+    http_adapter.poolmanager.connection_from_host("example.com", 443, "https")
+    pools = len(http_adapter.poolmanager.pools)
+
+    context.close()
+
+    assert http_adapter not in context.http.adapters.values()
+    assert http_adapter not in context.loader.context._session.adapters.values()
+    assert len(http_adapter.poolmanager.pools) == pools
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+import delivery
+from deadline import DeadlineExceededError
+from jobs import SingleFlight
+
+
+def _wait_for_waiter(flights: SingleFlight, key: str) -> None:
+    """صبر تا وقتی که یک درخواست منتظر کار جاری کلید شود"""
+    for _ in range(500):
+        with flights._lock:
+            flight = flights._flights.get(key)
+            if flight and flight.waiters:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("درخواست منتظر به کار جاری نپیوست")
+
+
+def _join_in_thread(flights: SingleFlight, key: str, results: list) -> threading.Thread:
+    def run():
+        with flights.coalesce(key, timeout=5) as leader:
+            results.append(leader)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiter_reads_result_after_successful_leader():
+    flights = SingleFlight()
+    results = []
+    with flights.coalesce("key") as leader:
+        assert leader
+        thread = _join_in_thread(flights, "key", results)
+        _wait_for_waiter(flights, "key")
+    thread.join(5)
+
+    assert results == [False]
+
+
+def test_waiter_is_elected_leader_after_failed_leader():
+    flights = SingleFlight()
+    results = []
+    with pytest.raises(IOError):
+        with flights.coalesce("key"):
+            thread = _join_in_thread(flights, "key", results)
+            _wait_for_waiter(flights, "key")
+            raise IOError("download failed")
+    thread.join(5)
+
+    assert results == [True]
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_waiter_timeout_raises_deadline_exceeded():
+    flights = SingleFlight()
+    with flights.coalesce("key"):
+        with pytest.raises(DeadlineExceededError):
+            with flights.coalesce("key", timeout=0.05):
+                pass
+
+
+def test_send_coalesced_downloads_once_for_concurrent_requests(monkeypatch):
+    sent_ids = {}
+    downloads = []
+    release = threading.Event()
+    monkeypatch.setattr(delivery, "in_flight", SingleFlight())
+    monkeypatch.setattr(delivery, "send_cached_media", lambda bot, chat_id, key, **kwargs: key in sent_ids)
+    monkeypatch.setattr(delivery, "remember_sent_media", lambda key, message: sent_ids.__setitem__(key, message))
+
+    def deliver():
+        downloads.append(threading.current_thread().name)
+        release.wait(5)
+        return "message"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(delivery.send_coalesced(None, 1, "key", deliver)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for _ in range(500):
+        if downloads and delivery.in_flight._flights["key"].waiters == 3:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(downloads) == 1
+    assert sorted(results) == [False, True, True, True]
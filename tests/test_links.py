@@ -0,0 +1,104 @@
+import pytest
+
+from links import (
+    LINK_PLAYLIST, LINK_POST, LINK_REEL, LINK_SHORTS, LINK_STORY, LINK_TV, LINK_VIDEO,
+    PLATFORM_INSTAGRAM, PLATFORM_YOUTUBE, MediaLink, classify_url, find_links, media_id_for, unique_links,
+)
+
+VIDEO_ID = "dQw4w9WgXcQ"
+PLAYLIST_ID = "PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG"
+WATCH_URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+ROUTES = [
+    # یوتیوب: شورتز
+    (f"https://www.youtube.com/shorts/{VIDEO_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_SHORTS, VIDEO_ID, f"https://www.youtube.com/shorts/{VIDEO_ID}")),
+    (f"youtube.com/shorts/{VIDEO_ID}?feature=share",
+     MediaLink(PLATFORM_YOUTUBE, LINK_SHORTS, VIDEO_ID, f"https://www.youtube.com/shorts/{VIDEO_ID}")),
+    # یوتیوب: پلی‌لیست
+    (f"https://www.youtube.com/playlist?list={PLAYLIST_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_PLAYLIST, PLAYLIST_ID,
+               f"https://www.youtube.com/playlist?list={PLAYLIST_ID}", PLAYLIST_ID)),
+    (f"https://youtube.com/playlist?si=abc&list={PLAYLIST_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_PLAYLIST, PLAYLIST_ID,
+               f"https://www.youtube.com/playlist?list={PLAYLIST_ID}", PLAYLIST_ID)),
+    # یوتیوب: watch با و بدون list
+    (WATCH_URL, MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"http://youtube.com/watch?feature=share&v={VIDEO_ID}&t=42",
+     MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"https://www.youtube.com/watch?v={VIDEO_ID}&list={PLAYLIST_ID}&index=3",
+     MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL, PLAYLIST_ID)),
+    (f"https://www.youtube.com/watch?list={PLAYLIST_ID}&v={VIDEO_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL, PLAYLIST_ID)),
+    # یوتیوب: embed، live و /v/
+    (f"https://www.youtube.com/embed/{VIDEO_ID}?autoplay=1", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"https://www.youtube.com/live/{VIDEO_ID}", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"https://www.youtube.com/v/{VIDEO_ID}", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    # یوتیوب: لینک کوتاه
+    (f"https://youtu.be/{VIDEO_ID}?si=xyz", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"youtu.be/{VIDEO_ID}", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    # یوتیوب: زیردامنه‌های m. و music.
+    (f"https://m.youtube.com/watch?v={VIDEO_ID}", MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL)),
+    (f"https://music.youtube.com/watch?v={VIDEO_ID}&list={PLAYLIST_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_VIDEO, VIDEO_ID, WATCH_URL, PLAYLIST_ID)),
+    (f"https://m.youtube.com/shorts/{VIDEO_ID}",
+     MediaLink(PLATFORM_YOUTUBE, LINK_SHORTS, VIDEO_ID, f"https://www.youtube.com/shorts/{VIDEO_ID}")),
+    # اینستاگرام: پست، ریلز و IGTV
+    ("https://www.instagram.com/p/CabcDEF123/",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_POST, "CabcDEF123", "https://www.instagram.com/p/CabcDEF123/")),
+    ("https://instagram.com/some.user/p/CabcDEF123/?img_index=2",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_POST, "CabcDEF123", "https://www.instagram.com/p/CabcDEF123/")),
+    ("https://instagr.am/p/CabcDEF123",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_POST, "CabcDEF123", "https://www.instagram.com/p/CabcDEF123/")),
+    ("https://www.instagram.com/reel/Cx_y-z9/?igsh=abc",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_REEL, "Cx_y-z9", "https://www.instagram.com/reel/Cx_y-z9/")),
+    ("https://www.instagram.com/reels/Cx_y-z9/",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_REEL, "Cx_y-z9", "https://www.instagram.com/reel/Cx_y-z9/")),
+    ("https://m.instagram.com/tv/B1tvID/",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_TV, "B1tvID", "https://www.instagram.com/tv/B1tvID/")),
+    # اینستاگرام: استوری
+    ("https://www.instagram.com/stories/some.user/3141592653589793/",
+     MediaLink(PLATFORM_INSTAGRAM, LINK_STORY, "3141592653589793",
+               "https://www.instagram.com/stories/some.user/3141592653589793/")),
+    # لینک‌های پشتیبانی نشده
+    ("https://example.com/video.mp4", MediaLink(None, None, None, "https://example.com/video.mp4")),
+    ("https://www.youtube.com/", MediaLink(None, None, None, "https://www.youtube.com/")),
+    ("https://www.instagram.com/some.user/", MediaLink(None, None, None, "https://www.instagram.com/some.user/")),
+]
+
+
+@pytest.mark.parametrize("url, expected", ROUTES, ids=[url for url, _ in ROUTES])
+def test_classify_url(url, expected):
+    assert classify_url(url) == expected
+
+
+@pytest.mark.parametrize("url, expected", ROUTES, ids=[url for url, _ in ROUTES])
+def test_find_links_inside_message_text(url, expected):
+    assert find_links(f"ببین این رو {url} خیلی جالبه") == [expected]
+
+
+def test_plain_text_has_no_links():
+    assert find_links("سلام، این پیام لینکی ندارد") == []
+    assert find_links("") == []
+    assert classify_url("بدون لینک") is None
+
+
+def test_find_links_keeps_message_order():
+    text = (f"https://example.com/a\nhttps://www.instagram.com/p/CabcDEF123/\n"
+            f"https://youtu.be/{VIDEO_ID}")
+    assert [link.platform for link in find_links(text)] == [None, PLATFORM_INSTAGRAM, PLATFORM_YOUTUBE]
+
+
+def test_unique_links_dedupes_same_content_and_drops_unsupported():
+    text = (f"https://youtu.be/{VIDEO_ID} {WATCH_URL} https://m.youtube.com/watch?v={VIDEO_ID}&t=10 "
+            f"https://www.instagram.com/reel/Cx_y-z9/ https://www.instagram.com/reels/Cx_y-z9/ "
+            f"https://example.com/x")
+    links = unique_links(find_links(text))
+    assert [link.content_key for link in links] == [f"youtube:{VIDEO_ID}", "instagram:Cx_y-z9"]
+
+
+def test_media_id_for():
+    assert media_id_for(f"https://youtu.be/{VIDEO_ID}", PLATFORM_YOUTUBE) == VIDEO_ID
+    assert media_id_for("https://www.instagram.com/p/CabcDEF123/", PLATFORM_INSTAGRAM) == "CabcDEF123"
+    assert media_id_for("https://www.instagram.com/p/CabcDEF123/", PLATFORM_YOUTUBE) is None
+    assert media_id_for(f"https://www.youtube.com/playlist?list={PLAYLIST_ID}", PLATFORM_YOUTUBE) is None
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import segmented
+from downloader.segmented import download_segmented
+from downloader.size_guard import SizeGuard
+
+PAYLOAD = os.urandom(2 * 1024 * 1024)
+# سرعت هر اتصال محدود است تا مزیت دانلود چند اتصالی قابل اندازه‌گیری باشد
+SEND_CHUNK = 32 * 1024
+SEND_DELAY = 0.01
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        start, end = 0, len(PAYLOAD) - 1
+        ranged = server.supports_range and self.headers.get("Range")
+        if ranged:
+            first, _, last = self.headers["Range"].partition("=")[2].partition("-")
+            start, end = int(first), int(last) if last else len(PAYLOAD) - 1
+        with server.lock:
+            server.requests.append((start, end) if ranged else None)
+            drop = ranged and end > start and server.drops > 0
+            if drop:
+                server.drops -= 1
+        self.send_response(206 if ranged else 200)
+        if ranged:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        body = PAYLOAD[start:end + 1]
+        if drop:
+            # قطع اتصال در میانه بازه؛ دانلود باید از آخرین بایت دریافت شده ادامه یابد
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        for offset in range(0, len(body), SEND_CHUNK):
+            self.wfile.write(body[offset:offset + SEND_CHUNK])
+            if end > start:
+                time.sleep(SEND_DELAY)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    httpd.daemon_threads = True
+    httpd.supports_range = True
+    httpd.drops = 0
+    httpd.requests = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(segmented, "DOWNLOAD_SEGMENT_MIN_SIZE", 0)
+
+
+def _url(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/video.mp4"
+
+
+def _timed_download(httpd, output_file, segments):
+    started = time.monotonic()
+    download_segmented(_url(httpd), str(output_file), SizeGuard(), segments=segments)
+    return time.monotonic() - started
+
+
+def test_segmented_download_matches_and_is_faster(server, tmp_path):
+    single_file = tmp_path / "single.bin"
+    single = _timed_download(server, single_file, segments=1)
+    server.requests.clear()
+
+    multi_file = tmp_path / "multi.bin"
+    multi = _timed_download(server, multi_file, segments=4)
+
+    assert single_file.read_bytes() == PAYLOAD
+    assert multi_file.read_bytes() == PAYLOAD
+    # درخواست اول بررسی حجم و پشتیبانی Range است و بقیه چهار بازه پیوسته فایل
+    segments = sorted(server.requests[1:])
+    assert len(segments) == 4
+    assert segments[0][0] == 0 and segments[-1][1] == len(PAYLOAD) - 1
+    assert all(prev[1] + 1 == nxt[0] for prev, nxt in zip(segments, segments[1:]))
+    assert multi < single * 0.6, f"چند اتصالی {multi:.2f}s، تک اتصالی {single:.2f}s"
+
+
+def test_segment_resumes_after_dropped_connection(server, tmp_path):
+    server.drops = 1
+    output_file = tmp_path / "resumed.bin"
+    download_segmented(_url(server), str(output_file), SizeGuard(), segments=4)
+
+    assert output_file.read_bytes() == PAYLOAD
+    # یک بخش پس از قطع اتصال با بازه باقی‌مانده دوباره درخواست شده است
+    assert len(server.requests) == 1 + 4 + 1
+
+
+def test_falls_back_to_single_connection_without_range(server, tmp_path):
+    server.supports_range = False
+    output_file = tmp_path / "plain.bin"
+    download_segmented(_url(server), str(output_file), SizeGuard(), segments=4)
+
+    assert output_file.read_bytes() == PAYLOAD
+    assert server.requests == [None, None]
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+import sessions
+from sessions import (
+    MemorySessionBackend,
+    SQLiteSessionBackend,
+    SessionStore,
+    callback_data,
+    parse_callback_data,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), max_entries=2)
+    return MemorySessionBackend(max_entries=2)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(sessions.time, "time", lambda: now[0])
+    return now
+
+
+def test_store_round_trip_and_owner_check(backend):
+    store = SessionStore(backend, ttl=60)
+    token = store.create(1, 10, url="https://youtu.be/dQw4w9WgXcQ", streams={"720p": ["22", 1024]})
+
+    assert store.get(token, 1) == {'user_id': 1, 'chat_id': 10, 'url': "https://youtu.be/dQw4w9WgXcQ",
+                                   'streams': {"720p": ["22", 1024]}}
+    assert store.get(token, 2) is None
+    assert store.update(token, action="audio")
+    assert store.get(token)['action'] == "audio"
+
+    store.delete(token)
+    assert store.get(token) is None
+    assert not store.update(token, action="video")
+
+
+def test_sessions_expire_after_ttl(backend, clock):
+    store = SessionStore(backend, ttl=60)
+    token = store.create(1, 10)
+
+    clock[0] += 30
+    # به‌روزرسانی زمان انقضا را تمدید می‌کند
+    assert store.update(token, action="video")
+    clock[0] += 45
+    assert store.get(token) is not None
+    clock[0] += 16
+    assert store.get(token) is None
+    assert store.stats() == {'active': 0}
+
+
+def test_memory_backend_evicts_oldest_over_capacity():
+    store = SessionStore(MemorySessionBackend(max_entries=2), ttl=60)
+    tokens = [store.create(1, 10, index=index) for index in range(3)]
+
+    assert store.get(tokens[0]) is None
+    assert [store.get(token)['index'] for token in tokens[1:]] == [1, 2]
+
+
+def test_sqlite_backend_survives_reopen_and_trims_capacity(tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.sqlite3")
+    monkeypatch.setattr(SQLiteSessionBackend, "CAPACITY_CHECK_INTERVAL", 3)
+    store = SessionStore(SQLiteSessionBackend(path, max_entries=2), ttl=60)
+    tokens = [store.create(1, 10, index=index) for index in range(3)]
+
+    reopened = SessionStore(SQLiteSessionBackend(path, max_entries=2), ttl=60)
+    assert reopened.get(tokens[0]) is None
+    assert [reopened.get(token)['index'] for token in tokens[1:]] == [1, 2]
+
+
+@pytest.mark.parametrize("action, args", [("q", ["22"]), ("pl", ["video", "5"]), ("ia", [])])
+def test_callback_data_round_trip(action, args):
+    token = "a1b2c3d4e5"
+    data = callback_data(action, token, *args)
+
+    # محدودیت طول داده دکمه در تلگرام
+    assert len(data.encode()) <= 64
+    assert parse_callback_data(data) == (action, token, args)
+
+
+def test_legacy_callback_data_has_no_token():
+    assert parse_callback_data("download_video") == ("download_video", None, [])
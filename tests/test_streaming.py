@@ -0,0 +1,92 @@
+import hashlib
+import time
+
+import pytest
+
+import streaming
+from streaming import CHUNK_SIZE, StreamBuffer, _multipart_body
+from downloader.errors import FileTooLargeError
+from downloader.size_guard import SizeGuard
+
+
+class _FakeResponse:
+    """پاسخ جریانی ساختگی که داده را بسته به بسته و بدون نگه داشتن کل فایل تولید می‌کند"""
+
+    def __init__(self, total_chunks):
+        self.total_chunks = total_chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for index in range(self.total_chunks):
+            yield bytes([index % 256]) * chunk_size
+
+
+class _FakeHttp:
+    def __init__(self, total_chunks):
+        self.total_chunks = total_chunks
+
+    def get(self, url, **kwargs):
+        return _FakeResponse(self.total_chunks)
+
+
+def _expected_digest(total_chunks):
+    digest = hashlib.sha256()
+    for index in range(total_chunks):
+        digest.update(bytes([index % 256]) * CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+def test_stream_buffer_keeps_memory_bounded(monkeypatch):
+    total_chunks = 256  # 16 مگابایت
+    buffer_size = 1024 * 1024
+    monkeypatch.setattr(streaming, "http", _FakeHttp(total_chunks))
+    source = StreamBuffer("https://example.com/video.mp4", {}, SizeGuard(limit=1 << 40),
+                          buffer_size=buffer_size).start()
+
+    boundary = "test-boundary"
+    body = _multipart_body(boundary, {"chat_id": "1"}, "video", "video.mp4", "video/mp4", iter(source))
+    head = next(body) + next(body)
+    digest = hashlib.sha256()
+    consumed = 0
+    peak = 0
+    tail = b""
+    try:
+        for part in body:
+            if part.startswith(f"\r\n--{boundary}--".encode()):
+                tail = part
+                break
+            # آپلود کندتر از دریافت است تا بافر پر شود
+            time.sleep(0.001)
+            consumed += len(part)
+            digest.update(part)
+            peak = max(peak, source.received - consumed)
+    finally:
+        source.close()
+
+    assert head.startswith(f"--{boundary}\r\n".encode())
+    assert b'filename="video.mp4"' in head
+    assert tail == f"\r\n--{boundary}--\r\n".encode()
+    assert consumed == total_chunks * CHUNK_SIZE
+    assert digest.hexdigest() == _expected_digest(total_chunks)
+    # بافر پر شده اما از سقف تعیین شده (به علاوه بسته‌ای که منتظر جا است) بیشتر نشده است
+    assert peak >= buffer_size // 2
+    assert peak <= buffer_size + CHUNK_SIZE
+
+
+def test_stream_buffer_raises_size_limit_on_upload_side(monkeypatch):
+    monkeypatch.setattr(streaming, "http", _FakeHttp(64))
+    source = StreamBuffer("https://example.com/video.mp4", {}, SizeGuard(limit=10 * CHUNK_SIZE),
+                          buffer_size=4 * CHUNK_SIZE).start()
+    with pytest.raises(FileTooLargeError):
+        for _ in source:
+            pass
+    source.close()
+    assert source.received <= 11 * CHUNK_SIZE
@@ -0,0 +1,41 @@
+from downloader.youtube import YouTubeDownloader
+
+VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def _raw_info():
+    """اطلاعات پردازش نشده (process=False) با یک فرمت پیش‌رونده و یک فرمت فقط ویدیو"""
+    return {
+        'id': 'dQw4w9WgXcQ',
+        'title': 'test',
+        'duration': 60,
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': VIDEO_URL,
+        'formats': [
+            {'format_id': '18', 'url': 'https://media.example.com/18.mp4', 'ext': 'mp4', 'protocol': 'https',
+             'vcodec': 'avc1', 'acodec': 'mp4a', 'width': 640, 'height': 360, 'filesize': 5_000_000},
+            {'format_id': '137', 'url': 'https://media.example.com/137.mp4', 'ext': 'mp4', 'protocol': 'https',
+             'vcodec': 'avc1', 'acodec': 'none', 'width': 1920, 'height': 1080, 'filesize': 20_000_000},
+            {'format_id': '140', 'url': 'https://media.example.com/140.m4a', 'ext': 'm4a', 'protocol': 'https',
+             'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128, 'filesize': 1_000_000},
+        ],
+    }
+
+
+def test_progressive_source_comes_from_processed_format(monkeypatch):
+    downloader = YouTubeDownloader()
+    monkeypatch.setattr(downloader, "_extract_info", lambda url: _raw_info())
+
+    url, headers = downloader.get_progressive_source(VIDEO_URL, '18')
+
+    assert url == 'https://media.example.com/18.mp4'
+    # هدرهای دریافت فقط پس از پردازش فرمت‌ها توسط yt-dlp تعیین می‌شوند
+    assert headers.get('User-Agent')
+
+
+def test_merged_format_is_not_streamed(monkeypatch):
+    downloader = YouTubeDownloader()
+    monkeypatch.setattr(downloader, "_extract_info", lambda url: _raw_info())
+
+    assert downloader.get_progressive_source(VIDEO_URL, '137+140') is None
@@ -1,136 +1,12 @@
 import os
-import re
 import uuid
 import logging
-from urllib.parse import urlparse
 
 from config import TEMP_DOWNLOAD_DIR
+from deadline import DeadlineExceededError, run_subprocess
 
 logger = logging.getLogger(__name__)
 
-def extract_url(text):
-    """استخراج URL از متن ارسال شده"""
-    # الگوی URL استاندارد
-    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-    
-    # یافتن URL ها در متن
-    urls = re.findall(url_pattern, text)
-    
-    if not urls:
-        # اگر URL پیدا نشد، ممکن است کاربر لینک را بدون پروتکل ارسال کرده باشد
-        # سعی می‌کنیم الگوهای رایج را بررسی کنیم
-        common_domains = [
-            r'(?:www\.)?instagram\.com/[\w.-]+/(?:p|reel)/[\w-]+',     # Instagram posts and reels
-            r'(?:www\.)?instagram\.com/stories/[\w.-]+/\d+',           # Instagram stories
-            r'(?:www\.)?youtube\.com/watch\?v=[\w-]+',                 # YouTube videos
-            r'youtu\.be/[\w-]+',                                       # YouTube shortened URLs
-            r'(?:www\.)?youtube\.com/shorts/[\w-]+'                    # YouTube shorts
-        ]
-        
-        for pattern in common_domains:
-            potential_url = re.search(pattern, text)
-            if potential_url:
-                return 'https://' + potential_url.group(0)
-    
-    # اگر URL استاندارد پیدا شد
-    if urls:
-        # بررسی کنیم که URL یوتیوب کامل است یا فقط دامنه اصلی
-        for url in urls:
-            # برای شناسایی یک URL کامل یوتیوب
-            if '/shorts/' in url:
-                # اطمینان از اینکه بعد از /shorts/ یک شناسه وجود دارد
-                match = re.search(r'youtube\.com/shorts/([\w-]+)', url)
-                if match and match.group(1):
-                    logger.info(f"URL شورتز یوتیوب پیدا شد: {url}")
-                    return url
-            
-            # برای ویدیوهای عادی یوتیوب
-            if '/watch?v=' in url:
-                match = re.search(r'[?&]v=([\w-]+)', url)
-                if match and match.group(1):
-                    logger.info(f"URL ویدیوی یوتیوب پیدا شد: {url}")
-                    return url
-            
-            # برای لینک‌های کوتاه یوتیوب
-            if 'youtu.be/' in url:
-                match = re.search(r'youtu\.be/([\w-]+)', url)
-                if match and match.group(1):
-                    logger.info(f"URL کوتاه یوتیوب پیدا شد: {url}")
-                    return url
-            
-            # برای لینک‌های اینستاگرام
-            if 'instagram.com/' in url:
-                logger.info(f"URL اینستاگرام پیدا شد: {url}")
-                return url
-        
-        # اگر هیچ یک از شرایط بالا صادق نبود، اولین URL را برمی‌گردانیم
-        logger.info(f"URL پیدا شد: {urls[0]}")
-        return urls[0]
-    
-    logger.warning(f"هیچ URL در متن پیدا نشد: {text}")
-    return None
-
-def is_instagram_url(url):
-    """بررسی می‌کند که آیا URL مربوط به اینستاگرام است یا خیر"""
-    parsed_url = urlparse(url)
-    return any(domain in parsed_url.netloc for domain in ['instagram.com', 'www.instagram.com', 'instagr.am'])
-
-def is_youtube_url(url):
-    """بررسی می‌کند که آیا URL مربوط به یوتیوب است یا خیر"""
-    parsed_url = urlparse(url)
-    return any(domain in parsed_url.netloc for domain in ['youtube.com', 'www.youtube.com', 'youtu.be'])
-
-def is_youtube_shorts(url):
-    """بررسی می‌کند که آیا URL مربوط به شورتز یوتیوب است یا خیر"""
-    # تشخیص دقیق‌تر شورتز یوتیوب با استفاده از regex
-    if not url:
-        return False
-        
-    # بررسی الگوی /shorts/ در URL
-    shorts_pattern = r'youtube\.com/shorts/[\w-]+'
-    is_shorts = bool(re.search(shorts_pattern, url))
-    
-    if is_shorts:
-        logger.info(f"لینک شورتز یوتیوب شناسایی شد: {url}")
-    
-    return is_shorts
-    
-def is_youtube_playlist(url):
-    """بررسی می‌کند که آیا URL مربوط به پلی‌لیست یوتیوب است یا خیر"""
-    if not url:
-        return False
-        
-    # الگوهای متداول لینک پلی‌لیست یوتیوب
-    # مانند: https://www.youtube.com/playlist?list=PLAYLIST_ID
-    # یا: https://www.youtube.com/watch?v=VIDEO_ID&list=PLAYLIST_ID
-    patterns = [
-        r'youtube\.com/playlist\?list=[\w-]+',                        # لینک مستقیم پلی‌لیست
-        r'youtube\.com/watch\?(?:.*&)?list=[\w-]+(?:&.*)?'            # ویدیو از یک پلی‌لیست
-    ]
-    
-    for pattern in patterns:
-        if re.search(pattern, url):
-            logger.info(f"لینک پلی‌لیست یوتیوب شناسایی شد: {url}")
-            return True
-    
-    return False
-    
-def extract_playlist_id(url):
-    """استخراج شناسه پلی‌لیست از URL یوتیوب"""
-    if not url:
-        return None
-        
-    # الگوی استخراج شناسه پلی‌لیست
-    playlist_id_pattern = r'list=([\w-]+)'
-    match = re.search(playlist_id_pattern, url)
-    
-    if match:
-        playlist_id = match.group(1)
-        logger.info(f"شناسه پلی‌لیست استخراج شد: {playlist_id}")
-        return playlist_id
-    
-    return None
-
 def generate_temp_filename(extension='.mp4'):
     """ایجاد یک نام فایل موقت با پسوند مشخص"""
     random_name = str(uuid.uuid4())
@@ -160,10 +36,54 @@ def format_size(size_bytes):
         i += 1
     return f"{size_bytes:.2f} {size_name[i]}"
     
+# پسوندهای صوتی که تلگرام به عنوان فایل صوتی (پخش‌کننده موسیقی) می‌پذیرد
+TELEGRAM_AUDIO_EXTENSIONS = ('.mp3', '.m4a')
+
+def get_audio_codec(media_path):
+    """دریافت کدک اولین استریم صوتی فایل با ffprobe"""
+    try:
+        cmd = [
+            'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            media_path
+        ]
+        process = run_subprocess(cmd, check=True, capture_output=True, text=True)
+        codec = process.stdout.strip().split('\n')[0]
+        return codec or None
+    except DeadlineExceededError:
+        raise
+    except Exception as e:
+        logger.warning(f"خطا در تشخیص کدک صوتی {media_path}: {e}")
+        return None
+
+def extract_audio(media_path):
+    """استخراج صدا از فایل؛ در صورت امکان بدون تبدیل مجدد (فقط جدا کردن استریم صوتی)"""
+    # کدک‌هایی که بدون تبدیل در قالب قابل قبول تلگرام قرار می‌گیرند
+    copy_containers = {'aac': '.m4a', 'mp3': '.mp3'}
+    codec = get_audio_codec(media_path)
+
+    if codec in copy_containers:
+        audio_path = generate_temp_filename(copy_containers[codec])
+        try:
+            cmd = ['ffmpeg', '-i', media_path, '-vn', '-map', 'a:0', '-c:a', 'copy', audio_path, '-y']
+            run_subprocess(cmd, check=True, capture_output=True)
+            if os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
+                logger.info(f"استریم صوتی {codec} بدون تبدیل جدا شد: {audio_path}")
+                return audio_path
+        except DeadlineExceededError:
+            clean_temp_file(audio_path)
+            raise
+        except Exception as e:
+            logger.warning(f"خطا در جدا کردن استریم صوتی بدون تبدیل: {e}")
+        clean_temp_file(audio_path)
+
+    # در غیر این صورت تبدیل کامل به MP3
+    logger.info(f"کدک صوتی {codec} نیاز به تبدیل دارد، در حال تبدیل به MP3...")
+    return convert_video_to_audio(media_path)
+
 def convert_video_to_audio(video_path, output_extension='.mp3'):
     """تبدیل ویدیو به فایل صوتی"""
-    import subprocess
-    
     # تولید نام فایل صوتی خروجی
     audio_path = generate_temp_filename(output_extension)
     
@@ -175,8 +95,8 @@ def convert_video_to_audio(video_path, output_extension='.mp3'):
             audio_path, '-y'
         ]
         
-        # اجرای دستور ffmpeg
-        subprocess.run(cmd, check=True, capture_output=True)
+        # اجرای دستور ffmpeg (در صورت پایان زمان مجاز درخواست متوقف می‌شود)
+        run_subprocess(cmd, check=True, capture_output=True)
         
         # بررسی وجود فایل خروجی
         if os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
@@ -186,6 +106,9 @@ def convert_video_to_audio(video_path, output_extension='.mp3'):
             logger.error("خطا در تبدیل ویدیو به صدا: فایل خروجی ایجاد نشد یا خالی است")
             return None
             
+    except DeadlineExceededError:
+        clean_temp_file(audio_path)
+        raise
     except Exception as e:
         logger.error(f"خطا در تبدیل ویدیو به صدا: {e}")
         logger.exception("جزئیات خطا:")